@@ -107,6 +107,29 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10 MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10 MB
 
+# --- Compiled form schemas (submit validation) ---
+FORM_SCHEMA_CACHE_SIZE = 256  # per-process LRU entries
+FORM_SCHEMA_SHARED_CACHE = os.environ.get('FORM_SCHEMA_SHARED_CACHE') or None  # CACHES alias shared by workers
+
+# --- Pre-rendered public form payloads (by_share_id) ---
+PUBLIC_FORM_CACHE = os.environ.get('PUBLIC_FORM_CACHE', 'default')  # CACHES alias
+PUBLIC_FORM_CACHE_TIMEOUT = 60 * 60  # seconds; entries are keyed by form version
+
+# --- Submission ingestion spool (group-commit public submissions) ---
+SUBMISSION_SPOOL_ENABLED = os.environ.get('SUBMISSION_SPOOL_ENABLED', 'False').lower() in ('true', '1', 'yes')
+SUBMISSION_SPOOL_DIR = os.environ.get('SUBMISSION_SPOOL_DIR', str(BASE_DIR / 'spool'))
+SUBMISSION_SPOOL_BATCH_SIZE = int(os.environ.get('SUBMISSION_SPOOL_BATCH_SIZE', 500))  # submissions per transaction
+SUBMISSION_SPOOL_MAX_LATENCY = float(os.environ.get('SUBMISSION_SPOOL_MAX_LATENCY', 0.5))  # seconds before a flush
+SUBMISSION_SPOOL_ORPHAN_AGE = float(os.environ.get('SUBMISSION_SPOOL_ORPHAN_AGE', 300))  # idle seconds before another worker adopts an open segment
+SUBMISSION_SPOOL_MAX_ATTEMPTS = int(os.environ.get('SUBMISSION_SPOOL_MAX_ATTEMPTS', 5))  # failed flushes before a segment is quarantined
+
+# --- Analytics sketches ---
+TEXT_SKETCH_CAPACITY = int(os.environ.get('TEXT_SKETCH_CAPACITY', 100))  # counters per text question
+TEXT_SKETCH_MAX_LENGTH = 200  # characters of an answer kept in a text sketch
+TEXT_SKETCH_MERGE_EVERY = int(os.environ.get('TEXT_SKETCH_MERGE_EVERY', 200))  # pending text answer rows between merges into the sketches
+NUMERIC_SKETCH_RELATIVE_ACCURACY = 0.01  # quantile error; run rebuild_sketches after changing it
+NUMERIC_HISTOGRAM_BINS = 10
+
 # --- Frontend base URL (used for QR codes, etc.) ---
 FRONTEND_BASE_URL = os.environ.get('FRONTEND_BASE_URL', 'http://localhost:5173')
 
@@ -120,3 +143,26 @@ if not DEBUG:
     CSRF_COOKIE_SECURE = True
     SECURE_BROWSER_XSS_FILTER = True
     X_FRAME_OPTIONS = 'DENY'
+
+# --- Response exports ---
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))  # responses read per keyset batch
+EXPORT_BUFFER_SIZE = 64 * 1024  # bytes of output collected before a chunk is sent
+EXPORT_ROW_GROUP_SIZE = 50000  # responses per Parquet row group
+# Seconds a submission must be old before a delta export's high-water mark passes it;
+# must exceed the delay between a submission and its commit (see SUBMISSION_SPOOL_MAX_LATENCY)
+EXPORT_DELTA_SETTLE = int(os.environ.get('EXPORT_DELTA_SETTLE', 60))
+
+# --- Full-text search ---
+SEARCH_MAX_RESULTS = 1000  # ranked responses returned by ?search=
+
+# --- Background export jobs ---
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', 0))  # threads per web process; 0 leaves jobs to run_export_jobs
+# Processes rendering each job's keyset shards (see exports.iter_parallel_export); 1 renders in the runner
+EXPORT_JOB_PROCESSES = int(os.environ.get('EXPORT_JOB_PROCESSES', 1))
+# Seconds a running job may go without progress before another runner takes it over;
+# must exceed the time to render one keyset batch (or shard, with EXPORT_JOB_PROCESSES)
+EXPORT_JOB_STALE_AFTER = int(os.environ.get('EXPORT_JOB_STALE_AFTER', 600))
+EXPORT_ARTIFACT_DIR = os.environ.get('EXPORT_ARTIFACT_DIR', str(BASE_DIR / 'exports'))
+EXPORT_ARTIFACT_MAX_AGE = 24 * 60 * 60  # seconds since an artifact was last used
+EXPORT_ARTIFACT_GRACE = 10 * 60  # seconds after its last use that an artifact is kept even over the size budget
+EXPORT_ARTIFACT_MAX_BYTES = int(os.environ.get('EXPORT_ARTIFACT_MAX_BYTES', 5 * 1024 ** 3))
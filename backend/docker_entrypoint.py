@@ -9,6 +9,8 @@ def run_manage_py(*args: str) -> None:
 
 def main() -> None:
     run_manage_py("migrate")
+    # Recover submissions spooled by a previous run before any worker starts writing
+    run_manage_py("flush_submissions")
 
     email = os.environ.get("DJANGO_SUPERUSER_EMAIL")
     name = os.environ.get("DJANGO_SUPERUSER_NAME")
@@ -0,0 +1,193 @@
+"""
+Per-question aggregates for ``FormViewSet.analytics`` and submission series
+for ``FormViewSet.trends``.
+
+Response, answered and choice counts come from the rollup counters (see
+``rollups.py``), the most frequent text answers and numeric means, percentiles
+and histograms from the answer sketches (see ``sketches.py``); numeric min/max
+are one seek each on the ``(question, numeric_answer)`` index of ``Answer``.
+The number of queries and the rows they read depend on the form's questions,
+never on how many responses it has. Filtered analytics count the matching
+answers instead, but a plain ``start``/``end`` range on whole UTC days still
+merges the numeric distributions from those days' sketches.
+Trend series are summed from the hourly/daily ``SubmissionBucket`` rows.
+"""
+from datetime import time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Max, Min, OuterRef, Subquery
+
+from .models import Answer, Question, SubmissionBucket
+from .rollups import compute_rollups, stored_rollups
+from .sketches import (
+    NUMERIC_TYPES, TEXT_TYPES, numeric_sketches, summarize_numeric_answers, summarize_text_answers, text_sketches,
+)
+
+CHOICE_TYPES = ('multiple_choice', 'multiple_select')
+PERCENTILES = (0.5, 0.9, 0.99)
+
+# Requested granularity -> stored bucket granularity it is summed from
+TREND_GRANULARITIES = {'hour': 'hour', 'day': 'day', 'week': 'day', 'month': 'day'}
+
+
+def _numeric_summary(stats, sketch):
+    low, high = stats['min'], stats['max']
+
+    def percentile(q):
+        value = sketch.quantile(q)
+        # Bucket midpoints can fall just outside the exact range
+        return None if value is None or low is None else min(max(value, low), high)
+
+    return {
+        'min': low,
+        'max': high,
+        'mean': sketch.total / sketch.count if sketch.count else None,
+        'percentiles': {f'p{round(q * 100)}': percentile(q) for q in PERCENTILES},
+        'histogram': sketch.histogram(low, high, settings.NUMERIC_HISTOGRAM_BINS),
+    }
+
+
+def _numeric_extremes(numeric_ids, answers=None):
+    """``{question_id: {'min', 'max'}}`` of the numeric answers, or of ``answers`` (a filtered subset).
+
+    Over all answers each bound is a correlated ``ORDER BY ... LIMIT 1``
+    subquery, a single seek on the ``(question, numeric_answer)`` index; a
+    subset is aggregated from its matching answers.
+    """
+    if answers is not None:
+        return {
+            row.pop('question_id'): row
+            for row in answers.filter(
+                question_id__in=numeric_ids, numeric_answer__isnull=False,
+            ).order_by().values('question_id').annotate(min=Min('numeric_answer'), max=Max('numeric_answer'))
+        }
+    values = Answer.objects.filter(question_id=OuterRef('pk'), numeric_answer__isnull=False).values('numeric_answer')
+    return {
+        row.pop('id'): row
+        for row in Question.objects.filter(id__in=numeric_ids).values('id').annotate(
+            min=Subquery(values.order_by('numeric_answer')[:1]),
+            max=Subquery(values.order_by('-numeric_answer')[:1]),
+        )
+    }
+
+
+def form_questions(form):
+    """Flattened question list from the form's structure document."""
+    structure = form.structure if form.structure is not None else form.build_structure()
+    return [question for section in structure for question in section['questions']]
+
+
+def whole_days(start=None, end=None):
+    """``(start, end)`` as UTC dates when each given bound falls on a UTC midnight, else ``None``."""
+    days = []
+    for bound in (start, end):
+        if bound is not None:
+            bound = bound.astimezone(dt_timezone.utc)
+            if bound.time() != time(0):
+                return None
+            bound = bound.date()
+        days.append(bound)
+    return tuple(days)
+
+
+def build_form_analytics(form, top_n=5, responses=None, days=None):
+    """Return the response count and per-question aggregates for ``form``.
+
+    Choice questions get per-choice counts, number/float questions min/max/mean,
+    p50/p90/p99 and an equal-width histogram, and text questions their
+    ``top_n`` most frequent answers. A top answer's ``count`` may overestimate
+    by up to its ``error``, and answers the sketch does not track were given at
+    most ``top_responses_bound`` times.
+    ``answered_count`` counts answers with a value: text, an upload, or at least
+    one choice.
+
+    ``responses`` restricts the aggregates to a filtered subset of the form's
+    responses (see ``filters.py``). Those are counted and summarized from the
+    matching answers instead of the rollups and sketches, so text counts are
+    exact unless a question has more than ``TEXT_SKETCH_CAPACITY`` distinct
+    answers in the subset. When the subset is just the submissions of the UTC
+    days ``days`` (a ``(start, end)`` pair of dates, ``end`` exclusive, either
+    may be ``None``), numeric distributions are merged from those days' sketches
+    instead of reading every numeric answer in the range.
+    """
+    questions = form_questions(form)
+    by_type = {}
+    for question in questions:
+        by_type.setdefault(question['question_type'], []).append(question['id'])
+    question_ids = [question['id'] for question in questions]
+    numeric_ids = [qid for t in NUMERIC_TYPES for qid in by_type.get(t, [])]
+    text_ids = [qid for t in TEXT_TYPES for qid in by_type.get(t, [])]
+
+    choice_ids = [choice['id'] for question in questions for choice in question['choices']]
+    if responses is None:
+        answers = None
+        form_counts, question_counts, choice_counts = stored_rollups(form, question_ids, choice_ids)
+        distributions = numeric_sketches(numeric_ids)
+        sketches = text_sketches(text_ids)
+    else:
+        answers = Answer.objects.filter(response__in=responses)
+        form_counts, question_counts, choice_counts = compute_rollups(form, responses)
+        if days is not None:
+            distributions = numeric_sketches(numeric_ids, *days)
+        else:
+            distributions = summarize_numeric_answers(numeric_ids, answers)
+        sketches = summarize_text_answers(text_ids, answers)
+
+    numeric_stats = _numeric_extremes(numeric_ids, answers)
+
+    results = []
+    for question in questions:
+        qid = question['id']
+        question_type = question['question_type']
+        item = {
+            'id': qid,
+            'text': question['text'],
+            'question_type': question_type,
+            'answered_count': question_counts[qid]['nonempty_count'],
+        }
+        if question_type in CHOICE_TYPES:
+            item['choices'] = [
+                {'id': choice['id'], 'text': choice['text'], 'count': choice_counts[choice['id']]['count']}
+                for choice in question['choices']
+            ]
+        elif question_type in NUMERIC_TYPES:
+            item['numeric'] = _numeric_summary(numeric_stats.get(qid, {'min': None, 'max': None}), distributions[qid])
+        elif question_type in TEXT_TYPES:
+            item['top_responses'] = sketches[qid].top(top_n)
+            item['top_responses_bound'] = sketches[qid].bound
+        results.append(item)
+
+    return {
+        'response_count': form_counts['response_count'],
+        'questions': results,
+    }
+
+
+def _period_start(day, granularity):
+    if granularity == 'week':
+        # Weeks start on Sunday, like the analytics page always showed them
+        return day - timedelta(days=(day.weekday() + 1) % 7)
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def submission_trend(form, granularity='day', start=None, end=None):
+    """Return ``[{'start', 'count'}]`` for periods with submissions, oldest first.
+
+    Periods are UTC hours, days, weeks or months; ``start``/``end`` bound the
+    stored hour/day buckets (``end`` exclusive).
+    """
+    buckets = SubmissionBucket.objects.filter(
+        form=form, granularity=TREND_GRANULARITIES[granularity], count__gt=0,
+    )
+    if start is not None:
+        buckets = buckets.filter(start__gte=start)
+    if end is not None:
+        buckets = buckets.filter(start__lt=end)
+
+    series = {}
+    for bucket_start, count in buckets.order_by('start').values_list('start', 'count'):
+        period = _period_start(bucket_start, granularity)
+        series[period] = series.get(period, 0) + count
+    return [{'start': period, 'count': count} for period, count in series.items()]
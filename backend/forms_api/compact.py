@@ -0,0 +1,72 @@
+"""
+Compact columnar encoding of responses (``?layout=compact`` on
+``FormViewSet.responses``).
+
+Instead of one nested object per answer, a page carries ``columns``, the form's
+question ids in display order, and each result is an array
+``[id, created_at, value, value, ...]`` whose values line up with ``columns``:
+the text for text and number questions, the selected choice ids for choice
+questions, the file URL for media questions, and ``null`` when unanswered.
+
+Rows are read with ``values_list`` (one query for answers, one for selected
+choices) without instantiating models.
+"""
+from rest_framework import serializers
+
+from .analytics import CHOICE_TYPES, form_questions
+from .models import Answer
+
+_datetime = serializers.DateTimeField()
+
+
+def compact_responses(form, rows, request=None, question_ids=None, choice_texts=False):
+    """``(columns, results)`` for ``rows`` of ``(id, created_at)``, optionally only for ``question_ids``.
+
+    With ``choice_texts`` the selected choices are given as their texts joined
+    with ", " (as in the CSV export), resolved from the form's structure.
+    """
+    questions = form_questions(form)
+    if question_ids is not None:
+        projected = set(question_ids)
+        questions = [question for question in questions if question['id'] in projected]
+    columns = [question['id'] for question in questions]
+    position = {qid: index for index, qid in enumerate(columns)}
+    multi = {question['id'] for question in questions if question['question_type'] in CHOICE_TYPES}
+    storage = Answer._meta.get_field('file_answer').storage
+
+    response_ids = [row[0] for row in rows]
+    values = {response_id: [None] * len(columns) for response_id in response_ids}
+    answer_slots = {}
+    for answer_id, response_id, question_id, text, file_name in Answer.objects.filter(
+        response_id__in=response_ids, question_id__in=columns,
+    ).values_list('id', 'response_id', 'question_id', 'text_answer', 'file_answer'):
+        slot = position[question_id]
+        if question_id in multi:
+            values[response_id][slot] = []
+            answer_slots[answer_id] = (response_id, slot)
+        elif file_name:
+            url = storage.url(file_name)
+            values[response_id][slot] = request.build_absolute_uri(url) if request else url
+        else:
+            values[response_id][slot] = text
+
+    if answer_slots:
+        for answer_id, choice_id in Answer.selected_choices.through.objects.filter(
+            answer_id__in=answer_slots,
+        ).order_by('choice__order', 'choice_id').values_list('answer_id', 'choice_id'):
+            response_id, slot = answer_slots[answer_id]
+            values[response_id][slot].append(choice_id)
+
+    if choice_texts:
+        texts = {choice['id']: choice['text'] for question in questions for choice in question['choices']}
+        choice_slots = [position[qid] for qid in multi]
+        for response_values in values.values():
+            for slot in choice_slots:
+                if response_values[slot] is not None:
+                    response_values[slot] = ', '.join(texts.get(cid, str(cid)) for cid in response_values[slot])
+
+    results = [
+        [response_id, _datetime.to_representation(created_at), *values[response_id]]
+        for response_id, created_at in rows
+    ]
+    return columns, results
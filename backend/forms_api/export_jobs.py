@@ -0,0 +1,289 @@
+"""
+Background export jobs (``FormViewSet.export_jobs``).
+
+A job records what to export (format, compression and response filter) and
+runs outside the web process in ``manage.py run_export_jobs`` or, when
+``settings.EXPORT_JOB_WORKERS`` is above 0, on a pool of that many threads in
+the process that created it. Runners claim a job with a conditional ``UPDATE``,
+so each job runs once, and save its progress and a heartbeat after every keyset
+batch. A ``running`` job without a heartbeat for ``EXPORT_JOB_STALE_AFTER``
+seconds is assumed to have lost its runner and is claimed again. With
+``EXPORT_JOB_PROCESSES`` above 1 the runner renders the export's keyset shards
+in that many processes (``exports.iter_parallel_export``) and saves its
+progress after every shard instead.
+
+The export is written to an artifact in ``settings.EXPORT_ARTIFACT_DIR`` named
+after a hash of the form's state (id, last response id, response count and
+version) and the export's parameters. A job whose artifact already exists is
+done as soon as it is created, so repeating an export with no new submissions
+does not read the responses again. Artifacts unused for
+``EXPORT_ARTIFACT_MAX_AGE`` seconds are evicted, then the least recently used
+ones until the directory fits in ``EXPORT_ARTIFACT_MAX_BYTES``.
+
+Artifacts are downloaded with single-range HTTP ``Range`` support
+(``parse_range``).
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .exports import (
+    COMPRESSIONS, EXPORT_FORMATS, AbsoluteURI, compress, iter_parallel_export, iter_response_batches,
+)
+from .filters import filter_responses
+from .models import ExportJob, FormRollup
+
+logger = logging.getLogger(__name__)
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+def artifact_path(name):
+    return Path(settings.EXPORT_ARTIFACT_DIR) / name
+
+
+def artifact_name(form, fmt, compression='', predicates=(), start=None, end=None, base_uri=''):
+    """File name of the artifact for this export of ``form`` in its current state."""
+    last_id = form.responses.aggregate(last_id=Max('id'))['last_id']
+    count = FormRollup.objects.filter(form=form).values_list('response_count', flat=True).first() or 0
+    state = [
+        form.pk, last_id, count, form.updated_at.isoformat(), fmt, compression, list(predicates),
+        start.isoformat() if start else None, end.isoformat() if end else None, base_uri,
+    ]
+    digest = hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()[:32]
+    extension = EXPORT_FORMATS[fmt].extension
+    if compression:
+        extension = f'{extension}.{COMPRESSIONS[compression].extension}'
+    return f'form-{form.pk}-{digest}.{extension}'
+
+
+def touch_artifact(name):
+    """Mark an artifact as just used; returns its size, or ``None`` if it does not exist."""
+    path = artifact_path(name)
+    try:
+        os.utime(path)
+        return path.stat().st_size
+    except FileNotFoundError:
+        return None
+
+
+def open_artifact(name):
+    """Open an artifact for reading and mark it as just used; raises ``FileNotFoundError`` once evicted.
+
+    An open artifact stays readable to the end even if it is evicted meanwhile.
+    """
+    artifact = open(artifact_path(name), 'rb')
+    os.utime(artifact.fileno())
+    return artifact
+
+
+def create_export_job(form, user, fmt, compression='', predicates=(), start=None, end=None, base_uri=''):
+    """Create a job for this export, done at once if its artifact is cached, else queued."""
+    job = ExportJob(
+        form=form, requested_by=user, format=fmt, compression=compression or '',
+        predicates=list(predicates), start=start, end=end, base_uri=base_uri,
+    )
+    job.artifact = artifact_name(form, fmt, job.compression, job.predicates, start, end, base_uri)
+    if touch_artifact(job.artifact) is not None:
+        previous = ExportJob.objects.filter(artifact=job.artifact, status='done').first()
+        job.status, job.finished_at = 'done', timezone.now()
+        job.progress, job.total = (previous.progress, previous.total) if previous else (0, None)
+    job.save()
+
+    if job.status == 'pending' and settings.EXPORT_JOB_WORKERS > 0:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_background, job.pk))
+    return job
+
+
+def _beat(job_id, **fields):
+    """Save ``fields`` on the job along with a fresh heartbeat."""
+    ExportJob.objects.filter(pk=job_id).update(heartbeat_at=timezone.now(), **fields)
+
+
+def _write_artifact(job, path):
+    form = job.form
+    responses = filter_responses(form.responses.all(), job.predicates, job.start, job.end)
+    _beat(job.pk, total=responses.count())
+
+    exported = 0
+
+    def counted(batches):
+        nonlocal exported
+        for batch in batches:
+            yield batch
+            exported += len(batch)
+            _beat(job.pk, progress=exported)
+
+    request = AbsoluteURI(job.base_uri) if job.base_uri else None
+    if settings.EXPORT_JOB_PROCESSES > 1:
+        chunks = iter_parallel_export(
+            form, responses, job.format, workers=settings.EXPORT_JOB_PROCESSES, request=request,
+            progress=lambda done, total: _beat(job.pk, progress=done),
+        )
+    else:
+        chunks = EXPORT_FORMATS[job.format].render(form, counted(iter_response_batches(form, responses, request)))
+    if job.compression:
+        chunks = compress(chunks, job.compression)
+
+    # Write beside the artifact and rename, so readers never see a partial file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=path.parent, prefix=f'{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _claimable():
+    """Pending jobs, and running ones whose runner has stopped sending heartbeats."""
+    stale = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_STALE_AFTER)
+    return ExportJob.objects.filter(
+        Q(status='pending') | (Q(status='running') & (Q(heartbeat_at__lt=stale) | Q(heartbeat_at__isnull=True))),
+    )
+
+
+def run_export_job(job_id):
+    """Run a pending (or stale running) job; returns ``False`` if another runner claimed it first."""
+    if not _claimable().filter(pk=job_id).update(status='running', progress=0, heartbeat_at=timezone.now()):
+        return False
+    job = ExportJob.objects.select_related('form').get(pk=job_id)
+    try:
+        if touch_artifact(job.artifact) is None:
+            _write_artifact(job, artifact_path(job.artifact))
+    except Exception as exc:
+        logger.exception('Export job %s failed', job_id)
+        ExportJob.objects.filter(pk=job_id).update(status='failed', error=str(exc), finished_at=timezone.now())
+        return True
+    ExportJob.objects.filter(pk=job_id).update(status='done', finished_at=timezone.now())
+    evict_artifacts()
+    return True
+
+
+def run_pending_export_jobs():
+    """Run every pending job and take over stale running ones, oldest first; returns how many this process ran."""
+    pending = _claimable().order_by('created_at').values_list('pk', 'status')
+    ran = 0
+    for job_id, status in list(pending):
+        if status == 'running':
+            logger.warning('Taking over export job %s from an unresponsive runner', job_id)
+        ran += run_export_job(job_id)
+    return ran
+
+
+def evict_artifacts():
+    """Delete expired artifacts, then the least recently used over the size budget; returns the number deleted.
+
+    Artifacts used in the last ``EXPORT_ARTIFACT_GRACE`` seconds are kept even
+    over budget, so a job's download link does not die as soon as it is done.
+    Finished jobs older than ``EXPORT_ARTIFACT_MAX_AGE`` are deleted too.
+    """
+    ExportJob.objects.filter(
+        status__in=('done', 'failed'),
+        created_at__lt=timezone.now() - timedelta(seconds=settings.EXPORT_ARTIFACT_MAX_AGE),
+    ).delete()
+
+    directory = Path(settings.EXPORT_ARTIFACT_DIR)
+    if not directory.is_dir():
+        return 0
+    entries = []
+    for path in directory.iterdir():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+
+    now = time.time()
+    cutoff = now - settings.EXPORT_ARTIFACT_MAX_AGE
+    total = sum(size for _, size, _ in entries)
+    deleted = 0
+    for mtime, size, path in entries:
+        recently_used = mtime >= now - settings.EXPORT_ARTIFACT_GRACE
+        if mtime >= cutoff and (total <= settings.EXPORT_ARTIFACT_MAX_BYTES or recently_used):
+            break
+        if path.suffix == '.tmp' and mtime >= cutoff:
+            continue  # Still being written
+        path.unlink(missing_ok=True)
+        total -= size
+        deleted += 1
+    return deleted
+
+
+def parse_range(header, size):
+    """Inclusive ``(start, end)`` byte range of a ``Range`` header for a file of ``size`` bytes.
+
+    Returns ``None`` when the header is absent, malformed or asks for several
+    ranges, in which case the whole file is sent; raises ``UnsatisfiableRange``
+    when the range lies outside the file.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = (part.strip() for part in spec.partition('-'))
+    if not sep or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if first:
+        if last and int(last) < int(first):
+            return None
+        start, end = int(first), (min(int(last), size - 1) if last else size - 1)
+    else:
+        if int(last) == 0:
+            raise UnsatisfiableRange
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size:
+        raise UnsatisfiableRange
+    return start, end
+
+
+def iter_file_range(artifact, start, end):
+    """Yield bytes ``start`` to ``end`` (inclusive) of the open ``artifact`` in ``EXPORT_BUFFER_SIZE`` chunks; closes it."""
+    with artifact:
+        artifact.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = artifact.read(min(settings.EXPORT_BUFFER_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _run_in_background(job_id):
+    try:
+        run_export_job(job_id)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """Return this process's job thread pool, created from settings on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.EXPORT_JOB_WORKERS, thread_name_prefix='export-job')
+        return _executor
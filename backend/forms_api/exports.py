@@ -0,0 +1,541 @@
+"""
+Response exports behind ``FormViewSet.export``/``export_csv`` and ``manage.py export_responses``.
+
+Responses are walked newest first in keyset batches of
+``settings.EXPORT_BATCH_SIZE`` (see ``pagination.seek``), and each batch's
+answers and selected choices are read with the compact reader (see
+``compact.py``). Choice texts are resolved from the form's structure. Memory
+stays bounded by one batch (or one Parquet row group) however many responses
+the form has.
+
+Formats, keyed by name in ``EXPORT_FORMATS``:
+
+* ``csv``: one text column per question, choices joined with ", ".
+* ``ndjson``: one JSON object per response with typed values.
+* ``arrow`` (Arrow IPC stream) and ``parquet``: typed columns, with
+  ``multiple_select`` answers as ``list<string>`` and questions' texts in the
+  field metadata. Parquet row groups hold ``settings.EXPORT_ROW_GROUP_SIZE``
+  responses. Both need the optional ``pyarrow`` package.
+
+Typed formats name question columns ``question_<id>`` so they stay stable when
+questions are renamed.
+
+Any export can be compressed as it streams (``compress``), one chunk at a time,
+with gzip or, when the optional ``zstandard`` package is installed, zstd; see
+``COMPRESSIONS`` and ``negotiate_compression``.
+
+``iter_parallel_export`` splits the same ordering into contiguous keyset
+ranges ("shards"), renders each one in a process pool with its own database
+connection, and stitches the shard parts back together in order. Parquet parts
+are Parquet files, copied into the export one row group at a time.
+"""
+import csv
+import importlib.util
+import io
+import itertools
+import json
+import math
+import os
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Q, Window
+from django.db.models.functions import Mod, RowNumber
+from rest_framework import serializers
+
+from .analytics import form_questions
+from .compact import compact_responses
+from .models import Form, Response
+from .pagination import seek, seek_ids
+from .schema import numeric_value
+
+_datetime = serializers.DateTimeField()
+
+
+def iter_response_batches(form, responses, request=None, position=None, by_id=False):
+    """Yield ``[(id, created_at, cells)]`` batches for ``responses``, in descending order, just past ``position``.
+
+    Responses are ordered by ``(created_at, id)``, or by id alone with
+    ``by_id`` (for id ranges such as delta exports, which the ``(form, id)``
+    index serves directly; a spooled response flushed late then comes before
+    older ids even if its ``created_at`` is earlier). Cells are as in the compact layout: text, choice id
+    lists or upload URLs.
+    """
+    rows = responses.values_list('id', 'created_at', named=True)
+    while True:
+        if by_id:
+            batch = seek_ids(rows, position, settings.EXPORT_BATCH_SIZE)
+        else:
+            batch = seek(rows, position, settings.EXPORT_BATCH_SIZE)
+        if not batch:
+            return
+        _, results = compact_responses(form, batch, request)
+        yield [(row.id, row.created_at, cells[2:]) for row, cells in zip(batch, results)]
+        position = batch[-1].id if by_id else (batch[-1].created_at, batch[-1].id)
+
+
+def _choice_texts(questions):
+    return {choice['id']: choice['text'] for question in questions for choice in question['choices']}
+
+
+def _typed_cells(questions):
+    """Function turning a row of compact cells into typed values for ``questions``."""
+    texts = _choice_texts(questions)
+
+    def convert(question, value):
+        question_type = question['question_type']
+        if value is None:
+            return None
+        if question_type == 'multiple_select':
+            return [texts.get(choice_id, str(choice_id)) for choice_id in value]
+        if question_type == 'multiple_choice':
+            return texts.get(value[0], str(value[0])) if value else None
+        if question_type == 'number':
+            number = numeric_value(question_type, value)
+            return int(number) if number is not None and number.is_integer() else None
+        if question_type == 'float':
+            return numeric_value(question_type, value)
+        return value
+
+    return lambda cells: [convert(question, value) for question, value in zip(questions, cells)]
+
+
+class _Buffer:
+    """Collects encoded output and hands it out in chunks of about ``EXPORT_BUFFER_SIZE`` bytes."""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.size += len(data)
+
+    def full(self):
+        return self.size >= settings.EXPORT_BUFFER_SIZE
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts, self.size = [], 0
+        return data
+
+
+class TextFormat:
+    """Line-oriented formats whose shard parts are concatenated as they are."""
+    content_type = None
+    extension = None
+    available = True
+    compressible = True
+
+    def header(self, questions):
+        return b''
+
+    def lines(self, questions, batch):
+        raise NotImplementedError
+
+    def render(self, form, batches, header=True):
+        """Yield the encoded export of ``batches`` in chunks of about ``EXPORT_BUFFER_SIZE`` bytes."""
+        questions = form_questions(form)
+        buffer = _Buffer()
+        if header:
+            buffer.write(self.header(questions))
+        for batch in batches:
+            for line in self.lines(questions, batch):
+                buffer.write(line)
+                if buffer.full():
+                    yield buffer.drain()
+        if buffer.size:
+            yield buffer.drain()
+
+    def write_part(self, form, batches, path):
+        with open(path, 'wb') as part:
+            for chunk in self.render(form, batches, header=False):
+                part.write(chunk)
+
+    def stitch(self, form, paths):
+        yield self.header(form_questions(form))
+        for path in paths:
+            with open(path, 'rb') as part:
+                while chunk := part.read(settings.EXPORT_BUFFER_SIZE):
+                    yield chunk
+
+
+class CsvFormat(TextFormat):
+    content_type = 'text/csv'
+    extension = 'csv'
+
+    @staticmethod
+    def _encode(row):
+        output = io.StringIO()
+        csv.writer(output).writerow(row)
+        return output.getvalue().encode()
+
+    def header(self, questions):
+        return self._encode(['Response ID', 'Submitted At'] + [question['text'] for question in questions])
+
+    def lines(self, questions, batch):
+        texts = _choice_texts(questions)
+        choice_columns = [question['question_type'] in ('multiple_choice', 'multiple_select') for question in questions]
+        output = io.StringIO()
+        writer = csv.writer(output)
+        for response_id, created_at, cells in batch:
+            writer.writerow([response_id, created_at.strftime('%Y-%m-%d %H:%M:%S')] + [
+                '' if value is None
+                else ', '.join(texts.get(choice_id, str(choice_id)) for choice_id in value) if is_choice
+                else value
+                for value, is_choice in zip(cells, choice_columns)
+            ])
+            yield output.getvalue().encode()
+            output.seek(0)
+            output.truncate(0)
+
+
+class NdjsonFormat(TextFormat):
+    content_type = 'application/x-ndjson'
+    extension = 'ndjson'
+
+    def lines(self, questions, batch):
+        typed = _typed_cells(questions)
+        names = [f'question_{question["id"]}' for question in questions]
+        for response_id, created_at, cells in batch:
+            record = {'response_id': response_id, 'submitted_at': _datetime.to_representation(created_at)}
+            record.update(zip(names, typed(cells)))
+            yield json.dumps(record, ensure_ascii=False).encode() + b'\n'
+
+
+class Sink:
+    """Write-only file for pyarrow and zipfile writers whose output is drained as it is produced."""
+    closed = False
+
+    def __init__(self):
+        self.buffer = _Buffer()
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.buffer.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class ArrowFormat:
+    """Arrow IPC stream with typed columns; shard parts are IPC streams re-read while stitching."""
+    content_type = 'application/vnd.apache.arrow.stream'
+    extension = 'arrows'
+    compressible = True
+
+    @property
+    def available(self):
+        return importlib.util.find_spec('pyarrow') is not None
+
+    @staticmethod
+    def schema(questions):
+        import pyarrow as pa
+
+        types = {'number': pa.int64(), 'float': pa.float64(), 'multiple_select': pa.list_(pa.string())}
+        return pa.schema([
+            pa.field('response_id', pa.int64(), nullable=False),
+            pa.field('submitted_at', pa.timestamp('us', tz='UTC'), nullable=False),
+        ] + [
+            pa.field(
+                f'question_{question["id"]}', types.get(question['question_type'], pa.string()),
+                metadata={'text': question['text'], 'question_type': question['question_type']},
+            )
+            for question in questions
+        ])
+
+    @staticmethod
+    def record_batches(questions, schema, batches):
+        import pyarrow as pa
+
+        typed = _typed_cells(questions)
+        for batch in batches:
+            columns = [[] for _ in schema]
+            for response_id, created_at, cells in batch:
+                for column, value in zip(columns, [response_id, created_at, *typed(cells)]):
+                    column.append(value)
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema,
+            )
+
+    def open_writer(self, sink, schema):
+        import pyarrow as pa
+
+        return pa.ipc.new_stream(sink, schema)
+
+    def write_all(self, writer, record_batches, sink=None):
+        """Write ``record_batches`` with ``writer``; yields drained output after each write when ``sink`` is given."""
+        for record_batch in record_batches:
+            writer.write_batch(record_batch)
+            if sink is not None and sink.buffer.full():
+                yield sink.buffer.drain()
+
+    def _write(self, schema, record_batches):
+        sink = Sink()
+        writer = self.open_writer(sink, schema)
+        yield from self.write_all(writer, record_batches, sink)
+        writer.close()
+        yield sink.buffer.drain()
+
+    def render(self, form, batches, header=True):
+        questions = form_questions(form)
+        schema = self.schema(questions)
+        return self._write(schema, self.record_batches(questions, schema, batches))
+
+    def write_part(self, form, batches, path):
+        import pyarrow as pa
+
+        questions = form_questions(form)
+        schema = self.schema(questions)
+        with pa.OSFile(path, 'wb') as part, pa.ipc.new_stream(part, schema) as writer:
+            for record_batch in self.record_batches(questions, schema, batches):
+                writer.write_batch(record_batch)
+
+    def stitch(self, form, paths):
+        import pyarrow as pa
+
+        def read_parts():
+            for path in paths:
+                with pa.OSFile(path, 'rb') as part:
+                    yield from pa.ipc.open_stream(part)
+
+        return self._write(self.schema(form_questions(form)), read_parts())
+
+
+class ParquetFormat(ArrowFormat):
+    """Parquet file with one row group per ``EXPORT_ROW_GROUP_SIZE`` responses."""
+    content_type = 'application/vnd.apache.parquet'
+    extension = 'parquet'
+    compressible = False  # Pages are already compressed
+
+    def open_writer(self, sink, schema):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(sink, schema)
+
+    def write_all(self, writer, record_batches, sink=None):
+        import pyarrow as pa
+
+        pending, rows = [], 0
+        for record_batch in itertools.chain(record_batches, [None]):
+            if record_batch is not None:
+                pending.append(record_batch)
+                rows += record_batch.num_rows
+            if pending and (record_batch is None or rows >= settings.EXPORT_ROW_GROUP_SIZE):
+                writer.write_table(pa.Table.from_batches(pending), row_group_size=rows)
+                pending, rows = [], 0
+                if sink is not None:
+                    yield sink.buffer.drain()
+
+    def write_part(self, form, batches, path):
+        import pyarrow.parquet as pq
+
+        questions = form_questions(form)
+        schema = self.schema(questions)
+        with pq.ParquetWriter(path, schema) as writer:
+            for _ in self.write_all(writer, self.record_batches(questions, schema, batches)):
+                pass
+
+    def stitch(self, form, paths):
+        """Copy the row groups of the Parquet parts into one file, keeping their boundaries."""
+        import pyarrow.parquet as pq
+
+        sink = Sink()
+        writer = self.open_writer(sink, self.schema(form_questions(form)))
+        for path in paths:
+            with pq.ParquetFile(path) as part:
+                for index in range(part.num_row_groups):
+                    row_group = part.read_row_group(index)
+                    writer.write_table(row_group, row_group_size=row_group.num_rows)
+                    yield sink.buffer.drain()
+        writer.close()
+        yield sink.buffer.drain()
+
+
+# Format name -> renderer
+EXPORT_FORMATS = {
+    'csv': CsvFormat(),
+    'ndjson': NdjsonFormat(),
+    'arrow': ArrowFormat(),
+    'parquet': ParquetFormat(),
+}
+
+
+def iter_export(form, responses, fmt='csv', request=None, by_id=False):
+    """Yield the ``fmt`` export of ``responses`` as encoded chunks (see ``iter_response_batches``)."""
+    return EXPORT_FORMATS[fmt].render(form, iter_response_batches(form, responses, request, by_id=by_id))
+
+
+class GzipCompression:
+    encoding = 'gzip'
+    extension = 'gz'
+    content_type = 'application/gzip'
+    available = True
+
+    def compressor(self):
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class ZstdCompression:
+    encoding = 'zstd'
+    extension = 'zst'
+    content_type = 'application/zstd'
+
+    @property
+    def available(self):
+        return importlib.util.find_spec('zstandard') is not None
+
+    def compressor(self):
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=3).compressobj()
+
+
+# Compression name -> codec, in order of preference when negotiating
+COMPRESSIONS = {
+    'zstd': ZstdCompression(),
+    'gzip': GzipCompression(),
+}
+
+
+def negotiate_compression(accept_encoding):
+    """Name of the preferred available compression that an ``Accept-Encoding`` header allows, or ``None``."""
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.lower()] = weight
+    for name, compression in COMPRESSIONS.items():
+        if compression.available and weights.get(name, weights.get('*', 0)) > 0:
+            return name
+    return None
+
+
+def compress(chunks, compression):
+    """Yield ``chunks`` compressed with ``compression`` as they arrive."""
+    compressor = COMPRESSIONS[compression].compressor()
+    for chunk in chunks:
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+class AbsoluteURI:
+    """Picklable stand-in for the request when workers build upload URLs."""
+
+    def __init__(self, base):
+        self.base = base
+
+    def build_absolute_uri(self, location):
+        return urljoin(self.base, location)
+
+
+def shard_bounds(responses, shards):
+    """``(total, bounds)`` splitting ``responses`` into up to ``shards`` similar keyset ranges.
+
+    Each bound is ``(after, through)``: the shard starts just past ``after`` and
+    ends with ``through`` (inclusive), either of which is ``None`` when open.
+    """
+    total = responses.count()
+    size = max(math.ceil(total / max(shards, 1)), 1)
+    # Every size-th key in one query, numbered by ROW_NUMBER() rather than one OFFSET seek per cut
+    cuts = list(
+        responses.order_by().alias(
+            position=Window(RowNumber(), order_by=[F('created_at').desc(), F('id').desc()]),
+        ).alias(
+            offset=Mod(F('position'), size),
+        ).filter(offset=0, position__lt=total).order_by('-created_at', '-id').values_list('created_at', 'id')
+    )
+    return total, list(zip([None, *cuts], [*cuts, None]))
+
+
+def _init_worker():
+    django.setup()
+
+
+def _render_shard(form_id, query, after, through, fmt, base_uri, path):
+    """Render one keyset range of ``query`` to ``path``; returns the number of responses written."""
+    form = Form.objects.get(pk=form_id)
+    responses = Response.objects.all()
+    responses.query = query
+    if through is not None:
+        created_at, pk = through
+        responses = responses.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gte=pk))
+
+    written = 0
+
+    def counted(batches):
+        nonlocal written
+        for batch in batches:
+            written += len(batch)
+            yield batch
+
+    request = AbsoluteURI(base_uri) if base_uri else None
+    EXPORT_FORMATS[fmt].write_part(form, counted(iter_response_batches(form, responses, request, after)), path)
+    return written
+
+
+def iter_parallel_export(form, responses, fmt='csv', workers=None, shards=None, request=None, progress=None):
+    """Yield the ``fmt`` export of ``responses`` rendered by ``workers`` processes, in export order.
+
+    ``shards`` defaults to four per worker so that uneven shards balance out;
+    ``progress(done, total)`` is called as each shard is stitched in. With one
+    worker the shards are rendered in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    total, bounds = shard_bounds(responses, shards or workers * 4)
+    base_uri = request.build_absolute_uri('/') if request is not None else None
+
+    directory = tempfile.mkdtemp(prefix='export-')
+    pool = None
+    try:
+        paths = [os.path.join(directory, f'{index:05d}.part') for index in range(len(bounds))]
+        jobs = [
+            (form.pk, responses.query, after, through, fmt, base_uri, path)
+            for (after, through), path in zip(bounds, paths)
+        ]
+        if workers > 1:
+            # Workers must open their own connections rather than share this process's
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+            results = [pool.submit(_render_shard, *job) for job in jobs]
+        else:
+            results = None
+
+        def finished_parts():
+            done = 0
+            for index, (job, path) in enumerate(zip(jobs, paths)):
+                done += results[index].result() if results else _render_shard(*job)
+                yield path
+                os.remove(path)
+                if progress is not None:
+                    progress(done, total)
+
+        yield from EXPORT_FORMATS[fmt].stitch(form, finished_parts())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,91 @@
+"""
+Server-side response filters for ``FormViewSet.responses``, ``export_csv`` and
+``analytics``.
+
+A filter is a JSON list of answer predicates that must all hold, passed as the
+``filter`` query parameter, plus an optional ``[start, end)`` range on
+``Response.created_at``::
+
+    [{"question": 3, "op": "choice_in", "value": [7, 8]},
+     {"question": 4, "op": "between", "value": [18, 30]},
+     {"question": 5, "op": "contains", "value": "late"}]
+
+Each predicate becomes a ``pk IN (SELECT response_id ...)`` semi-join. Choice
+predicates read the ``selected_choices`` through table by choice, text
+predicates read ``Answer`` by question, and numeric predicates are range scans
+on the ``(question, numeric_answer)`` index.
+"""
+import math
+
+from .analytics import CHOICE_TYPES
+from .models import Answer
+from .sketches import NUMERIC_TYPES, TEXT_TYPES
+
+# Operator -> question types it applies to
+OPERATORS = {
+    'choice_in': CHOICE_TYPES,
+    'equals': TEXT_TYPES,
+    'contains': TEXT_TYPES,
+    'eq': NUMERIC_TYPES,
+    'gt': NUMERIC_TYPES,
+    'gte': NUMERIC_TYPES,
+    'lt': NUMERIC_TYPES,
+    'lte': NUMERIC_TYPES,
+    'between': NUMERIC_TYPES,
+}
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError('A number is required.')
+    return float(value)
+
+
+def clean_predicate_value(question, op, value):
+    """Return ``value`` checked against ``op`` and ``question`` (a structure dict), or raise ``ValueError``."""
+    if op == 'choice_in':
+        choice_ids = {choice['id'] for choice in question['choices']}
+        if not isinstance(value, list) or not value:
+            raise ValueError('A non-empty list of choice ids is required.')
+        if any(isinstance(item, bool) or item not in choice_ids for item in value):
+            raise ValueError('Every choice must belong to the question.')
+        return value
+    if op in ('equals', 'contains'):
+        if not isinstance(value, str) or (op == 'contains' and not value.strip()):
+            raise ValueError('A non-empty string is required.' if op == 'contains' else 'A string is required.')
+        return value.strip()
+    if op == 'between':
+        if not isinstance(value, list) or len(value) != 2:
+            raise ValueError('A [low, high] pair is required.')
+        low, high = _number(value[0]), _number(value[1])
+        if low > high:
+            raise ValueError('The low bound must not exceed the high bound.')
+        return [low, high]
+    return _number(value)
+
+
+def _matching_response_ids(predicate):
+    question_id, op, value = predicate['question'], predicate['op'], predicate['value']
+    if op == 'choice_in':
+        return Answer.selected_choices.through.objects.filter(choice_id__in=value).values('answer__response_id')
+    answers = Answer.objects.filter(question_id=question_id)
+    if op == 'equals':
+        answers = answers.filter(text_answer=value)
+    elif op == 'contains':
+        answers = answers.filter(text_answer__icontains=value)
+    elif op == 'between':
+        answers = answers.filter(numeric_answer__range=value)
+    else:
+        answers = answers.filter(**{f'numeric_answer__{"exact" if op == "eq" else op}': value})
+    return answers.values('response_id')
+
+
+def filter_responses(responses, predicates=(), start=None, end=None):
+    """Narrow ``responses`` to those matching every predicate and submitted in ``[start, end)``."""
+    for predicate in predicates:
+        responses = responses.filter(pk__in=_matching_response_ids(predicate))
+    if start is not None:
+        responses = responses.filter(created_at__gte=start)
+    if end is not None:
+        responses = responses.filter(created_at__lt=end)
+    return responses
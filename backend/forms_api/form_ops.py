@@ -0,0 +1,200 @@
+"""
+Incremental builder edits for ``FormViewSet.operations``.
+
+Instead of PUTting the whole tree, the builder sends a list of operations that
+are applied atomically against an expected form version:
+
+    {"op": "add", "type": "question", "parent": 3, "ref": "q1", "data": {...}}
+    {"op": "update", "type": "choice", "id": 9, "data": {"text": "Maybe"}}
+    {"op": "delete", "type": "section", "id": 4}
+    {"op": "move", "type": "question", "id": 7, "parent": "s1", "order": 2}
+    {"op": "reorder", "type": "choice", "ids": [12, 10, 11]}
+
+``parent`` (and ``id``) may be the ``ref`` of a node added earlier in the same
+request. Choices only move within their question, since answers select them by
+id. Each op is a single statement; ``reorder`` rewrites ``order`` for all
+listed rows with one ``UPDATE ... CASE``.
+"""
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+from rest_framework import exceptions, serializers, status
+
+from .models import Choice, Form, Question, Section
+from .rollups import refresh_question_rollups, refresh_question_types
+from .serializers import ChoiceFieldsSerializer, QuestionFieldsSerializer, SectionFieldsSerializer
+
+NODE_TYPES = {
+    'section': (Section, SectionFieldsSerializer, None),
+    'question': (Question, QuestionFieldsSerializer, 'section'),
+    'choice': (Choice, ChoiceFieldsSerializer, 'question'),
+}
+CHILD_TYPES = {'section': 'question', 'question': 'choice'}
+
+
+class FormVersionConflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The form was changed since it was loaded. Reload it and try again.'
+    default_code = 'version_conflict'
+
+
+class FormOperations:
+    """Applies one request's operations to ``form`` inside a transaction."""
+
+    def __init__(self, form):
+        self.form = form
+        # node type -> {id: parent id}; kept in sync as ops run so ids can be checked in memory
+        self.parents = {
+            'section': {pk: form.pk for pk in Section.objects.filter(form=form).values_list('id', flat=True)},
+            'question': dict(Question.objects.filter(section__form=form).values_list('id', 'section_id')),
+            'choice': dict(Choice.objects.filter(question__section__form=form).values_list('id', 'question_id')),
+        }
+        self.refs = {}
+        # Questions whose answers lost selected choices; their rollups are recounted
+        self.stale_questions = set()
+        # Questions whose type changed; their numeric answers and sketches are re-derived
+        self.retyped_questions = set()
+
+    def apply(self, ops):
+        for index, op in enumerate(ops):
+            try:
+                handler = getattr(self, f'_op_{op.get("op")}', None)
+                if handler is None:
+                    raise serializers.ValidationError({'op': ['Expected one of add, update, delete, move, reorder.']})
+                node_type = op.get('type')
+                if node_type not in NODE_TYPES:
+                    raise serializers.ValidationError({'type': ['Expected one of section, question, choice.']})
+                handler(node_type, op)
+            except serializers.ValidationError as exc:
+                raise serializers.ValidationError({'ops': {index: exc.detail}})
+        if self.stale_questions:
+            refresh_question_rollups(self.stale_questions)
+        if self.retyped_questions:
+            refresh_question_types(self.retyped_questions)
+        return dict(self.refs)
+
+    # ------------------------------------------------------------ resolving
+    def _resolve(self, node_type, value, field='id'):
+        pk = self.refs.get(value, value) if isinstance(value, str) else value
+        if isinstance(pk, bool) or not isinstance(pk, int) or pk not in self.parents[node_type]:
+            raise serializers.ValidationError({field: [f'Unknown {node_type} "{value}".']})
+        return pk
+
+    def _resolve_parent(self, node_type, op, required):
+        parent_type = NODE_TYPES[node_type][2]
+        if parent_type is None or (not required and op.get('parent') is None):
+            return None
+        if op.get('parent') is None:
+            raise serializers.ValidationError({'parent': ['This field is required.']})
+        return self._resolve(parent_type, op['parent'], field='parent')
+
+    @staticmethod
+    def _validated(node_type, data, partial):
+        serializer = NODE_TYPES[node_type][1](data=data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        values = dict(serializer.validated_data)
+        if 'media_file' in values:
+            values['media_file'] = values['media_file'] or ''
+        return values
+
+    # ------------------------------------------------------------ operations
+    def _op_add(self, node_type, op):
+        model, _, parent_field = NODE_TYPES[node_type]
+        values = self._validated(node_type, op.get('data') or {}, partial=False)
+        if parent_field is None:
+            parent_id = self.form.pk
+            node = model.objects.create(form=self.form, **values)
+        else:
+            parent_id = self._resolve_parent(node_type, op, required=True)
+            node = model.objects.create(**{f'{parent_field}_id': parent_id}, **values)
+        self.parents[node_type][node.pk] = parent_id
+        if op.get('ref') is not None:
+            self.refs[str(op['ref'])] = node.pk
+
+    def _op_update(self, node_type, op):
+        model = NODE_TYPES[node_type][0]
+        pk = self._resolve(node_type, op.get('id'))
+        values = self._validated(node_type, op.get('data') or {}, partial=True)
+        if 'question_type' in values and model.objects.filter(pk=pk).exclude(
+            question_type=values['question_type'],
+        ).exists():
+            self.retyped_questions.add(pk)
+        if values:
+            model.objects.filter(pk=pk).update(**values)
+
+    def _op_delete(self, node_type, op):
+        model = NODE_TYPES[node_type][0]
+        pk = self._resolve(node_type, op.get('id'))
+        model.objects.filter(pk=pk).delete()
+        if node_type == 'choice':
+            self.stale_questions.add(self.parents['choice'][pk])
+        self._forget(node_type, {pk})
+
+    def _forget(self, node_type, pks):
+        for pk in pks:
+            del self.parents[node_type][pk]
+        child_type = CHILD_TYPES.get(node_type)
+        if child_type:
+            children = {pk for pk, parent in self.parents[child_type].items() if parent in pks}
+            if children:
+                self._forget(child_type, children)
+
+    def _op_move(self, node_type, op):
+        model, _, parent_field = NODE_TYPES[node_type]
+        pk = self._resolve(node_type, op.get('id'))
+        values = {}
+        parent_id = self._resolve_parent(node_type, op, required=False)
+        if node_type == 'choice' and parent_id not in (None, self.parents['choice'][pk]):
+            # Selections point at the choice and would end up answering the other question
+            raise serializers.ValidationError({
+                'parent': ['A choice cannot move to another question; delete it and add a new one there.'],
+            })
+        if parent_id is not None:
+            values[f'{parent_field}_id'] = parent_id
+            self.parents[node_type][pk] = parent_id
+        if op.get('order') is not None:
+            values['order'] = self._order_value(op['order'])
+        if not values:
+            raise serializers.ValidationError({'non_field_errors': ['A move needs a parent, an order, or both.']})
+        model.objects.filter(pk=pk).update(**values)
+
+    def _op_reorder(self, node_type, op):
+        model = NODE_TYPES[node_type][0]
+        ids = op.get('ids')
+        if not isinstance(ids, list) or not ids:
+            raise serializers.ValidationError({'ids': ['Expected a non-empty list of ids.']})
+        start = self._order_value(op.get('start', 0))
+        pks = [self._resolve(node_type, value, field='ids') for value in ids]
+        if len(set(pks)) != len(pks):
+            raise serializers.ValidationError({'ids': ['Ids must be unique.']})
+        model.objects.filter(pk__in=pks).update(order=Case(
+            *[When(pk=pk, then=Value(start + position)) for position, pk in enumerate(pks)],
+            output_field=IntegerField(),
+        ))
+
+    @staticmethod
+    def _order_value(value):
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            raise serializers.ValidationError({'order': ['Expected a non-negative integer.']})
+        return value
+
+
+@transaction.atomic
+def apply_form_operations(form, version, ops):
+    """Apply ``ops`` if ``form`` is still at ``version``; return the new version and created ids."""
+    # Claim the version first: a concurrent editor's request now fails the check
+    now = timezone.now()
+    if not Form.objects.filter(pk=form.pk, updated_at=version).update(updated_at=now):
+        current = Form.objects.filter(pk=form.pk).values_list('updated_at', flat=True).first()
+        raise FormVersionConflict({
+            'detail': FormVersionConflict.default_detail,
+            'version': serializers.DateTimeField().to_representation(current),
+        })
+    form.updated_at = now
+
+    created = FormOperations(form).apply(ops)
+    form.refresh_structure()
+    return {
+        'version': serializers.DateTimeField().to_representation(form.updated_at),
+        'created': created,
+    }
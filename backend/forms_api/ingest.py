@@ -0,0 +1,366 @@
+"""
+Group-commit ingestion spool for public submissions.
+
+When ``SUBMISSION_SPOOL_ENABLED`` is on, ``FormViewSet.submit`` appends each
+validated submission to an append-only JSON-lines segment on local disk and
+answers 202 with a receipt id once the record is on disk. Appends are group
+committed: while one request fsyncs the segment, later requests queue their
+records behind it and the next fsync covers all of them, so concurrent
+submissions share fsyncs instead of taking turns. A background thread seals
+the active segment every ``SUBMISSION_SPOOL_MAX_LATENCY`` seconds (sooner once
+``SUBMISSION_SPOOL_BATCH_SIZE`` records are waiting) and writes sealed segments
+to the database, up to ``SUBMISSION_SPOOL_BATCH_SIZE`` submissions per
+transaction.
+
+Segment lifecycle: ``*.open`` (being appended) → ``*.ready`` (sealed) →
+``*.flushing`` (claimed by a flusher) → deleted once committed. Replays are
+idempotent because every spooled response stores its ``receipt_id``. A segment
+that fails to commit goes back to ``*.ready`` with its attempt count in its
+name, and the flusher moves on to the next one; after
+``SUBMISSION_SPOOL_MAX_ATTEMPTS`` failures it is quarantined as ``*.failed``
+for an operator to inspect, so one bad segment cannot hold up the queue.
+
+Segment names start with the writer's host and PID. The flusher also adopts
+``*.open`` segments left by a crashed or recycled worker: those whose PID is
+gone on this host, or that nobody has written to for
+``SUBMISSION_SPOOL_ORPHAN_AGE`` seconds. A live writer starts a new segment
+before its current one gets that old, so it never appends to an adopted
+segment. ``manage.py flush_submissions`` drains every leftover segment,
+including half-flushed ones; it must run while no web worker is writing to the
+spool, which is why the Docker entrypoint runs it before starting the server.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Answer, Choice, Form, Question, Response
+from .schema import numeric_value
+from .submissions import bulk_create_responses
+
+logger = logging.getLogger(__name__)
+
+_HOST = hashlib.sha1(socket.gethostname().encode()).hexdigest()[:8]
+
+
+def _spooled_answer(answer):
+    """JSON-safe copy of a cleaned answer; uploads are written to storage first."""
+    file_answer = answer['file_answer']
+    if file_answer is not None:
+        field = Answer._meta.get_field('file_answer')
+        file_answer = field.storage.save(field.generate_filename(None, file_answer.name), file_answer)
+    return {
+        'question_id': answer['question_id'],
+        'text_answer': answer['text_answer'],
+        'file_answer': file_answer,
+        'choice_ids': answer['choice_ids'],
+    }
+
+
+class SubmissionSpool:
+    """Per-process writer for the active segment plus its background flusher."""
+
+    def __init__(self, directory, batch_size, max_latency, orphan_age):
+        self.directory = Path(directory)
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.orphan_age = orphan_age
+        self._lock = threading.Lock()
+        self._synced_changed = threading.Condition(self._lock)
+        self._written = 0  # Records appended by this process...
+        self._synced = 0  # ...and how many of them are known to be on disk
+        self._syncing = False
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._file = None
+        self._path = None
+        self._opened_at = None
+        self._pending = 0
+        self._flusher = None
+
+    def append(self, form, answers):
+        """Durably record a validated submission and return its receipt id."""
+        receipt_id = uuid.uuid4()
+        record = {
+            'receipt_id': str(receipt_id),
+            'form_id': form.id,
+            'created_at': timezone.now().isoformat(),
+            'answers': [_spooled_answer(answer) for answer in answers],
+        }
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+
+        with self._lock:
+            if self._file is not None and time.monotonic() - self._opened_at > self.orphan_age / 2:
+                # Idle long enough that another flusher may soon adopt it
+                self._seal()
+            if self._file is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._path = self.directory / f'{_HOST}-{os.getpid()}-{uuid.uuid4().hex}.open'
+                self._file = open(self._path, 'ab')
+                self._opened_at = time.monotonic()
+            self._file.write(line)
+            self._written += 1
+            sequence = self._written
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self._wake.set()
+            self._wait_synced(sequence)
+
+        self._ensure_flusher()
+        return receipt_id
+
+    def _wait_synced(self, sequence):
+        """Block until record ``sequence`` is on disk; called with the lock held.
+
+        The first waiter becomes the leader and fsyncs outside the lock, covering
+        every record written before it started; the rest wait for its result.
+        """
+        while self._synced < sequence:
+            if self._syncing:
+                self._synced_changed.wait()
+                continue
+            self._syncing = True
+            target = self._written
+            self._file.flush()
+            fd = self._file.fileno()
+            self._lock.release()
+            try:
+                os.fsync(fd)
+            finally:
+                self._lock.acquire()
+                self._syncing = False
+                self._synced_changed.notify_all()
+            self._synced = max(self._synced, target)
+
+    def seal(self):
+        """Close the active segment and hand it over to the flusher."""
+        with self._lock:
+            return self._seal()
+
+    def _seal(self):
+        if self._file is None:
+            return None
+        # A leader's fsync must finish before the descriptor is closed, and
+        # records still waiting for one are synced here instead
+        while self._syncing:
+            self._synced_changed.wait()
+        if self._synced < self._written:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._synced = self._written
+            self._synced_changed.notify_all()
+        self._file.close()
+        ready_path = self._path.with_suffix('.ready')
+        try:
+            os.replace(self._path, ready_path)
+        except FileNotFoundError:
+            ready_path = None  # Already adopted by another process's flusher
+        self._file = None
+        self._path = None
+        self._pending = 0
+        return ready_path
+
+    def flush(self):
+        self.seal()
+        try:
+            return flush_segments(self.directory, self.batch_size, orphan_age=self.orphan_age)
+        except Exception:
+            logger.exception('Failed to flush the submission spool; will retry.')
+            return 0
+        finally:
+            close_old_connections()
+
+    def stop(self, flush=True):
+        self._stopped.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.max_latency + 5)
+        if flush:
+            self.flush()
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='submission-spool-flusher', daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.max_latency)
+            if self._stopped.is_set():
+                return
+            self._wake.clear()
+            self.flush()
+
+
+def _read_records(path):
+    with open(path, 'rb') as segment:
+        for line_number, line in enumerate(segment, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Only the tail of a segment can be torn, by a crash mid-append
+                logger.warning('Skipping unreadable record %s:%d', path, line_number)
+
+
+@transaction.atomic
+def _commit_batch(records):
+    """Insert one batch of spooled submissions in a single transaction."""
+    receipts = [record['receipt_id'] for record in records]
+    committed = {str(receipt) for receipt in Response.objects.filter(
+        receipt_id__in=receipts
+    ).values_list('receipt_id', flat=True)}
+
+    # The form may have been edited or deleted since the submission was spooled
+    form_ids = {record['form_id'] for record in records}
+    live_forms = set(Form.objects.filter(id__in=form_ids).values_list('id', flat=True))
+    live_questions = dict(
+        Question.objects.filter(section__form_id__in=live_forms).values_list('id', 'question_type')
+    )
+    live_choices = set(Choice.objects.filter(question_id__in=live_questions).values_list('id', flat=True))
+
+    entries = []
+    for record in records:
+        if record['receipt_id'] in committed or record['form_id'] not in live_forms:
+            continue
+        response = Response(
+            form_id=record['form_id'],
+            receipt_id=uuid.UUID(record['receipt_id']),
+            created_at=parse_datetime(record['created_at']),
+        )
+        answers = [
+            {
+                **answer,
+                'question_type': live_questions[answer['question_id']],
+                'numeric_answer': numeric_value(live_questions[answer['question_id']], answer['text_answer']),
+                'choice_ids': [c for c in answer['choice_ids'] if c in live_choices],
+            }
+            for answer in record['answers']
+            if answer['question_id'] in live_questions
+        ]
+        entries.append((response, answers))
+        committed.add(record['receipt_id'])
+
+    if entries:
+        bulk_create_responses(entries)
+    return len(entries)
+
+
+def _attempts(path):
+    """Failed flushes of a segment so far, kept in its name as ``<id>.<attempts>.<state>``."""
+    _, _, attempts = path.stem.partition('.')
+    return int(attempts or 0)
+
+
+def _with_state(path, state, attempts=0):
+    segment_id = path.stem.partition('.')[0]
+    return path.with_name(f'{segment_id}.{attempts}.{state}' if attempts else f'{segment_id}.{state}')
+
+
+def _is_orphaned(path, max_age):
+    """Whether the open segment ``path`` was left by a process that is gone or has stopped writing it."""
+    host, _, rest = path.stem.partition('-')
+    pid = rest.partition('-')[0]
+    # Signal 0 only probes on POSIX; elsewhere os.kill() would end the process
+    if host == _HOST and pid.isdigit() and os.name == 'posix':
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass  # Alive, but run by another user
+    try:
+        return time.time() - path.stat().st_mtime > max_age
+    except FileNotFoundError:
+        return False
+
+
+def flush_segments(directory, batch_size, include_orphans=False, orphan_age=None):
+    """Commit sealed segments in ``directory`` and delete them; return the row count.
+
+    With ``orphan_age`` the open segments of dead processes, or those untouched
+    for that many seconds, are adopted too. With ``include_orphans`` every open
+    and half-flushed segment is recovered, which is only safe when nothing is
+    appending.
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return 0
+
+    suffixes = {'.ready', '.open', '.flushing'} if include_orphans else {'.ready'}
+    segments = []
+    for path in directory.iterdir():
+        if path.suffix in suffixes or (orphan_age is not None and path.suffix == '.open' and _is_orphaned(path, orphan_age)):
+            try:
+                segments.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue  # Claimed by another flusher since the listing
+    segments.sort()
+
+    total = 0
+    for _, path in segments:
+        claimed = path.with_suffix('.flushing')
+        if path != claimed:
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue  # Claimed by another flusher
+        try:
+            records = list(_read_records(claimed))
+            for start in range(0, len(records), batch_size):
+                total += _commit_batch(records[start:start + batch_size])
+        except Exception:
+            attempts = _attempts(claimed) + 1
+            if attempts >= settings.SUBMISSION_SPOOL_MAX_ATTEMPTS:
+                logger.exception('Quarantined spool segment %s after %d failed flushes', claimed, attempts)
+                os.replace(claimed, _with_state(claimed, 'failed', attempts))
+            else:
+                logger.exception('Failed to flush spool segment %s (attempt %d); will retry', claimed, attempts)
+                os.replace(claimed, _with_state(claimed, 'ready', attempts))
+            continue
+        claimed.unlink()
+    return total
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_spool():
+    """Return this process's spool, created from settings on first use."""
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = SubmissionSpool(
+                settings.SUBMISSION_SPOOL_DIR,
+                settings.SUBMISSION_SPOOL_BATCH_SIZE,
+                settings.SUBMISSION_SPOOL_MAX_LATENCY,
+                settings.SUBMISSION_SPOOL_ORPHAN_AGE,
+            )
+            atexit.register(_spool.stop)
+        return _spool
+
+
+def reset_spool(flush=False):
+    """Stop and discard this process's spool (used when settings change)."""
+    global _spool
+    with _spool_lock:
+        spool, _spool = _spool, None
+    if spool is not None:
+        atexit.unregister(spool.stop)
+        spool.stop(flush=flush)
@@ -0,0 +1,48 @@
+import codecs
+
+from django.core.management.base import BaseCommand, CommandError
+
+from forms_api.exports import COMPRESSIONS, EXPORT_FORMATS, TextFormat, compress, iter_parallel_export
+from forms_api.models import Form
+
+
+class Command(BaseCommand):
+    help = "Exports a form's responses to a file, rendering shards of the responses in parallel worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('form_id', type=int)
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--format', dest='fmt', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--compression', choices=sorted(COMPRESSIONS), help='Compress the output (requires --output)')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+        parser.add_argument('--shards', type=int, help='Keyset ranges to split the responses into (default: 4 per worker)')
+
+    def handle(self, *args, **options):
+        form = Form.objects.filter(pk=options['form_id']).first()
+        if form is None:
+            raise CommandError(f'Form {options["form_id"]} does not exist')
+        if not EXPORT_FORMATS[options['fmt']].available:
+            raise CommandError(f'The {options["fmt"]} export needs the optional pyarrow package')
+        if options['compression'] and not COMPRESSIONS[options['compression']].available:
+            raise CommandError(f'{options["compression"]} compression needs the optional zstandard package')
+
+        def progress(done, total):
+            self.stderr.write(f'Exported {done}/{total} responses')
+
+        chunks = iter_parallel_export(
+            form, form.responses.all(), fmt=options['fmt'],
+            workers=options['workers'], shards=options['shards'], progress=progress,
+        )
+        if options['compression']:
+            chunks = compress(chunks, options['compression'])
+        if not options['output']:
+            if options['compression'] or not isinstance(EXPORT_FORMATS[options['fmt']], TextFormat):
+                raise CommandError('--output is required for binary output')
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            for chunk in chunks:
+                self.stdout.write(decoder.decode(chunk), ending='')
+            return
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
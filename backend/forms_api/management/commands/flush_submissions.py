@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from forms_api.ingest import flush_segments
+
+
+class Command(BaseCommand):
+    help = 'Commits spooled submissions, including segments left behind by crashed processes'
+
+    def handle(self, *args, **options):
+        count = flush_segments(
+            settings.SUBMISSION_SPOOL_DIR,
+            settings.SUBMISSION_SPOOL_BATCH_SIZE,
+            include_orphans=True,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Flushed {count} spooled submission(s)'))
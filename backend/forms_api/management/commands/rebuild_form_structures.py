@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from forms_api.models import Form
+
+
+class Command(BaseCommand):
+    help = "Rebuilds each form's denormalized structure document from its sections, questions and choices"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing-only', action='store_true', help='Only build forms without a structure')
+
+    def handle(self, *args, **options):
+        forms = Form.objects.only('pk')
+        if options['missing_only']:
+            forms = forms.filter(structure__isnull=True)
+
+        count = 0
+        for form in forms.iterator():
+            with transaction.atomic():
+                form.refresh_structure()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} form structure(s)'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from forms_api.models import Form
+from forms_api.rollups import rebuild_rollups, verify_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the analytics rollup counters from the stored answers, or verifies them with --verify'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Only report counters that differ from the answers')
+        parser.add_argument('--form', type=int, action='append', dest='form_ids', help='Limit to this form id (repeatable)')
+
+    def handle(self, *args, **options):
+        forms = Form.objects.only('pk').order_by('pk')
+        if options['form_ids']:
+            forms = forms.filter(pk__in=options['form_ids'])
+
+        if not options['verify']:
+            count = 0
+            for form in forms.iterator():
+                rebuild_rollups(form)
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups for {count} form(s)'))
+            return
+
+        drifted = 0
+        for form in forms.iterator():
+            for label, stored, expected in verify_rollups(form):
+                drifted += 1
+                self.stdout.write(f'{label}: stored {stored}, expected {expected}')
+        if drifted:
+            raise CommandError(f'{drifted} rollup counter(s) drifted; run rebuild_rollups to fix them')
+        self.stdout.write(self.style.SUCCESS('All rollup counters match'))
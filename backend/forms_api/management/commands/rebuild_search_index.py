@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from forms_api.search import is_indexed, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index over answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', type=int, help='Limit to this form id')
+
+    def handle(self, *args, **options):
+        if not is_indexed():
+            raise CommandError('The full-text search index needs SQLite; other backends search without one')
+        with transaction.atomic():
+            rebuild_search_index(options['form'])
+        self.stdout.write(self.style.SUCCESS('Rebuilt the search index'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from forms_api.models import Form, Question
+from forms_api.schema import refresh_numeric_answers
+from forms_api.sketches import rebuild_numeric_sketches, rebuild_text_sketches
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the numeric answer values and analytics answer sketches of each form from its stored answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--form', type=int, action='append', dest='form_ids', help='Limit to this form id (repeatable)')
+
+    def handle(self, *args, **options):
+        forms = Form.objects.only('pk').order_by('pk')
+        if options['form_ids']:
+            forms = forms.filter(pk__in=options['form_ids'])
+
+        text_count = numeric_count = 0
+        for form in forms.iterator():
+            with transaction.atomic():
+                refresh_numeric_answers(Question.objects.filter(section__form=form).values_list('id', flat=True))
+                text_count += rebuild_text_sketches(form)
+                numeric_count += rebuild_numeric_sketches(form)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt sketches for {text_count} text and {numeric_count} numeric question(s)'
+        ))
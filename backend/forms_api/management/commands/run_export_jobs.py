@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from forms_api.export_jobs import evict_artifacts, run_pending_export_jobs
+from forms_api.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = 'Runs pending background export jobs, takes over stale running ones and evicts expired export artifacts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recover', action='store_true',
+            help=(
+                'Re-run jobs left running by a crashed process without waiting for EXPORT_JOB_STALE_AFTER '
+                '(only while no other runner is active)'
+            ),
+        )
+        parser.add_argument('--watch', type=float, metavar='SECONDS', help='Keep polling for new jobs at this interval')
+
+    def handle(self, *args, **options):
+        if options['recover']:
+            ExportJob.objects.filter(status='running').update(status='pending', progress=0)
+
+        while True:
+            count = run_pending_export_jobs()
+            evicted = evict_artifacts()
+            if count or evicted or not options['watch']:
+                self.stdout.write(self.style.SUCCESS(f'Ran {count} export job(s), evicted {evicted} artifact(s)'))
+            if not options['watch']:
+                return
+            time.sleep(options['watch'])
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from django.test import RequestFactory
+from django.utils import timezone
+
+from forms_api.models import Form
+from forms_api.public_forms import get_public_form
+
+
+class Command(BaseCommand):
+    help = 'Pre-renders the public payload of the most-submitted forms into the cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50, help='Number of forms to warm')
+        parser.add_argument('--days', type=int, default=7, help='Rank forms by responses in this many days')
+        parser.add_argument('--host', default='localhost:8000', help='Host the API is served from')
+        parser.add_argument('--secure', action='store_true', help='The API is served over HTTPS')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        forms = (
+            Form.objects
+            .filter(share_id__isnull=False)
+            .annotate(recent_responses=Count('responses', filter=Q(responses__created_at__gte=since)))
+            .order_by('-recent_responses', '-updated_at')
+            .values_list('share_id', flat=True)[:options['limit']]
+        )
+
+        factory = RequestFactory()
+        warmed = 0
+        for share_id in forms:
+            request = factory.get('/', HTTP_HOST=options['host'], secure=options['secure'])
+            if get_public_form(share_id, request) is not None:
+                warmed += 1
+        self.stdout.write(self.style.SUCCESS(f'Warmed {warmed} public form(s)'))
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0005_formarchive_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='response',
+            name='receipt_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
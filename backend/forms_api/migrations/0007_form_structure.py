@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0006_response_receipt_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='form',
+            name='structure',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
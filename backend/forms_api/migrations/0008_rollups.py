@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Q
+
+
+def backfill_rollups(apps, schema_editor):
+    Answer = apps.get_model('forms_api', 'Answer')
+    Response = apps.get_model('forms_api', 'Response')
+    FormRollup = apps.get_model('forms_api', 'FormRollup')
+    QuestionRollup = apps.get_model('forms_api', 'QuestionRollup')
+    ChoiceRollup = apps.get_model('forms_api', 'ChoiceRollup')
+    Through = Answer.selected_choices.through
+
+    FormRollup.objects.bulk_create([
+        FormRollup(form_id=row['form_id'], response_count=row['n'])
+        for row in Response.objects.order_by().values('form_id').annotate(n=Count('id'))
+    ], batch_size=1000)
+
+    nonempty = (
+        (Q(text_answer__isnull=False) & ~Q(text_answer=''))
+        | (Q(file_answer__isnull=False) & ~Q(file_answer=''))
+        | Q(Exists(Through.objects.filter(answer_id=OuterRef('pk'))))
+    )
+    QuestionRollup.objects.bulk_create([
+        QuestionRollup(question_id=row['question_id'], answer_count=row['n'], nonempty_count=row['nonempty'])
+        for row in Answer.objects.order_by().values('question_id').annotate(
+            n=Count('id'), nonempty=Count('id', filter=nonempty),
+        )
+    ], batch_size=1000)
+
+    ChoiceRollup.objects.bulk_create([
+        ChoiceRollup(choice_id=row['choice_id'], count=row['n'])
+        for row in Through.objects.order_by().values('choice_id').annotate(n=Count('id'))
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0007_form_structure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormRollup',
+            fields=[
+                ('form', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='forms_api.form')),
+                ('response_count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionRollup',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='forms_api.question')),
+                ('answer_count', models.BigIntegerField(default=0)),
+                ('nonempty_count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChoiceRollup',
+            fields=[
+                ('choice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='forms_api.choice')),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from datetime import timezone as dt_timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+
+
+def backfill_buckets(apps, schema_editor):
+    Response = apps.get_model('forms_api', 'Response')
+    SubmissionBucket = apps.get_model('forms_api', 'SubmissionBucket')
+
+    for granularity, trunc in (('hour', TruncHour), ('day', TruncDay)):
+        rows = Response.objects.order_by().values(
+            'form_id', bucket=trunc('created_at', tzinfo=dt_timezone.utc),
+        ).annotate(n=Count('id'))
+        SubmissionBucket.objects.bulk_create([
+            SubmissionBucket(form_id=row['form_id'], granularity=granularity, start=row['bucket'], count=row['n'])
+            for row in rows.iterator()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0008_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_buckets', to='forms_api.form')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='submissionbucket',
+            constraint=models.UniqueConstraint(fields=('form', 'granularity', 'start'), name='unique_submission_bucket'),
+        ),
+        migrations.RunPython(backfill_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+# Frozen copies of forms_api.sketches as of this migration, so later changes to
+# the live module cannot change what the backfill writes.
+TEXT_TYPES = ('short_text', 'long_text')
+
+
+def _space_saving(rows, capacity, max_length):
+    """Space-Saving over ``(text, weight)`` rows; return ``(total, counters)`` in the stored layout."""
+    total = 0
+    counters = {}
+    for text, weight in rows:
+        key = ' '.join(str(text).split()).casefold()[:max_length]
+        if not key:
+            continue
+        total += weight
+        entry = counters.get(key)
+        if entry is not None:
+            entry[1] += weight
+            continue
+        floor = 0
+        if len(counters) >= capacity:
+            smallest = min(counters, key=lambda k: counters[k][1])
+            floor = counters.pop(smallest)[1]
+        counters[key] = [text[:max_length], floor + weight, floor]
+    return total, [[key, text, count, error] for key, (text, count, error) in counters.items()]
+
+
+def backfill_sketches(apps, schema_editor):
+    Answer = apps.get_model('forms_api', 'Answer')
+    Question = apps.get_model('forms_api', 'Question')
+    TextAnswerSketch = apps.get_model('forms_api', 'TextAnswerSketch')
+    capacity = getattr(settings, 'TEXT_SKETCH_CAPACITY', 100)
+    max_length = getattr(settings, 'TEXT_SKETCH_MAX_LENGTH', 200)
+
+    for question_id in Question.objects.filter(question_type__in=TEXT_TYPES).values_list('id', flat=True).iterator():
+        total, counters = _space_saving(
+            Answer.objects.filter(
+                Q(text_answer__isnull=False) & ~Q(text_answer=''), question_id=question_id,
+            ).values('text_answer').annotate(n=Count('id')).order_by('-n').values_list('text_answer', 'n').iterator(),
+            capacity, max_length,
+        )
+        if total:
+            TextAnswerSketch.objects.create(question_id=question_id, total=total, counters=counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0009_submissionbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextAnswerSketch',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text_sketch', serialize=False, to='forms_api.question')),
+                ('total', models.BigIntegerField(default=0)),
+                ('counters', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.RunPython(backfill_sketches, migrations.RunPython.noop),
+    ]
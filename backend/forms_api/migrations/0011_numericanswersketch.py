@@ -0,0 +1,84 @@
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+import math
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+
+# Frozen copies of forms_api.sketches as of this migration, so later changes to
+# the live module cannot change what the backfill writes.
+NUMERIC_TYPES = ('number', 'float')
+MIN_MAGNITUDE = 1e-9
+
+
+def _empty_sketch():
+    return {'count': 0, 'total': 0.0, 'zero_count': 0, 'positive': defaultdict(int), 'negative': defaultdict(int)}
+
+
+def backfill_sketches(apps, schema_editor):
+    Answer = apps.get_model('forms_api', 'Answer')
+    NumericAnswerSketch = apps.get_model('forms_api', 'NumericAnswerSketch')
+    alpha = getattr(settings, 'NUMERIC_SKETCH_RELATIVE_ACCURACY', 0.01)
+    log_gamma = math.log((1 + alpha) / (1 - alpha))
+
+    # DDSketch buckets: a magnitude m falls in bucket ceil(log(m) / log(gamma))
+    sketches = defaultdict(_empty_sketch)
+    answers = Answer.objects.filter(
+        Q(text_answer__isnull=False) & ~Q(text_answer=''), question__question_type__in=NUMERIC_TYPES,
+    ).values_list('question_id', 'text_answer', 'response__created_at')
+    for question_id, text, created_at in answers.iterator():
+        try:
+            value = float(text)
+        except ValueError:
+            continue
+        if not math.isfinite(value):
+            continue
+        sketch = sketches[(question_id, created_at.astimezone(dt_timezone.utc).date())]
+        sketch['count'] += 1
+        sketch['total'] += value
+        if abs(value) < MIN_MAGNITUDE:
+            sketch['zero_count'] += 1
+        else:
+            store = sketch['positive'] if value > 0 else sketch['negative']
+            store[math.ceil(math.log(abs(value)) / log_gamma)] += 1
+
+    NumericAnswerSketch.objects.bulk_create([
+        NumericAnswerSketch(
+            question_id=question_id, day=day,
+            count=sketch['count'], total=sketch['total'], zero_count=sketch['zero_count'],
+            positive={str(index): n for index, n in sketch['positive'].items()},
+            negative={str(index): n for index, n in sketch['negative'].items()},
+        )
+        for (question_id, day), sketch in sketches.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0010_textanswersketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumericAnswerSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('zero_count', models.BigIntegerField(default=0)),
+                ('positive', models.JSONField(default=dict)),
+                ('negative', models.JSONField(default=dict)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='numeric_sketches', to='forms_api.question')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='numericanswersketch',
+            constraint=models.UniqueConstraint(fields=('question', 'day'), name='unique_numeric_answer_sketch'),
+        ),
+        migrations.RunPython(backfill_sketches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+import math
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# Frozen copy of forms_api.sketches.NUMERIC_TYPES as of this migration
+NUMERIC_TYPES = ('number', 'float')
+
+
+def _numeric_value(text):
+    """Frozen copy of forms_api.schema.numeric_value for a numeric question's answer."""
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+def backfill_numeric_answers(apps, schema_editor):
+    Answer = apps.get_model('forms_api', 'Answer')
+
+    answers = Answer.objects.filter(
+        question__question_type__in=NUMERIC_TYPES, text_answer__isnull=False,
+    ).exclude(text_answer='').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(answers.filter(pk__gt=last_pk).only('pk', 'text_answer')[:BATCH_SIZE])
+        if not batch:
+            break
+        for answer in batch:
+            answer.numeric_answer = _numeric_value(answer.text_answer)
+        Answer.objects.bulk_update(batch, ['numeric_answer'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0011_numericanswersketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='numeric_answer',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', 'numeric_answer'], name='forms_api_answer_numeric_idx'),
+        ),
+        migrations.RunPython(backfill_numeric_answers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0013_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('response_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='response_deletions', to='forms_api.form')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['form', 'id'], name='forms_api_deletion_form_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# Frozen copy of the index forms_api.search maintains, as of this migration
+TABLE = 'forms_api_answer_search'
+INDEXED_ROWS = (
+    f"INSERT INTO {TABLE}(rowid, text_answer, form_key, response_id, question_id) "
+    "SELECT a.id, a.text_answer, 'form' || r.form_id, a.response_id, a.question_id "
+    "FROM forms_api_answer a JOIN forms_api_response r ON r.id = a.response_id "
+    "WHERE {where}"
+)
+INDEX_NEW_ROW = INDEXED_ROWS.format(where="a.id = NEW.id AND NEW.text_answer <> ''")
+
+CREATE_INDEX = [
+    f"CREATE VIRTUAL TABLE {TABLE} USING fts5("
+    "text_answer, form_key, response_id UNINDEXED, question_id UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    f'CREATE TRIGGER {TABLE}_insert AFTER INSERT ON forms_api_answer BEGIN {INDEX_NEW_ROW}; END',
+    f'CREATE TRIGGER {TABLE}_delete AFTER DELETE ON forms_api_answer BEGIN DELETE FROM {TABLE} WHERE rowid = OLD.id; END',
+    f'CREATE TRIGGER {TABLE}_update AFTER UPDATE OF text_answer ON forms_api_answer BEGIN '
+    f'DELETE FROM {TABLE} WHERE rowid = OLD.id; {INDEX_NEW_ROW}; END',
+    INDEXED_ROWS.format(where="a.text_answer <> ''"),
+]
+DROP_INDEX = [
+    f'DROP TRIGGER IF EXISTS {TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {TABLE}_update',
+    f'DROP TABLE IF EXISTS {TABLE}',
+]
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    """``RunSQL`` that only applies on SQLite; other backends search by scanning (see forms_api.search)."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0014_responsedeletion'),
+    ]
+
+    operations = [
+        SQLiteRunSQL(CREATE_INDEX, DROP_INDEX),
+    ]
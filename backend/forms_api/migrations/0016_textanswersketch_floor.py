@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0015_answer_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='textanswersketch',
+            name='floor',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
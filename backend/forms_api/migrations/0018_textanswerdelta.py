@@ -0,0 +1,21 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forms_api', '0017_exportjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextAnswerDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='text_sketch_deltas', to='forms_api.question')),
+            ],
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 import uuid
 import qrcode
 from io import BytesIO
@@ -56,6 +56,9 @@ class Form(models.Model):
     deadline = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized section/question/choice tree, rebuilt by FormDetailSerializer on every save.
+    # Edits that bypass the serializer leave it stale; `manage.py rebuild_form_structures` repairs it.
+    structure = models.JSONField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['-updated_at']
@@ -74,6 +77,36 @@ class Form(models.Model):
         if is_new and not self.qr_code:
             self._generate_qr_code()
 
+    def build_structure(self):
+        """Return the form's sections, questions and choices as a JSON-ready list.
+
+        Entries carry the same keys as ``SectionSerializer`` output, minus the
+        request-dependent ``media_url``.
+        """
+        sections = [
+            {**section, 'questions': []}
+            for section in self.sections.order_by('order', 'id').values('id', 'title', 'description', 'order')
+        ]
+        questions_by_section = {section['id']: section['questions'] for section in sections}
+        choices_by_question = {}
+        for question in Question.objects.filter(section__form=self).order_by('order', 'id').values(
+            'id', 'section_id', 'text', 'question_type', 'required', 'order', 'media_file',
+        ):
+            section_id = question.pop('section_id')
+            question['media_file'] = question['media_file'] or ''
+            question['choices'] = choices_by_question[question['id']] = []
+            questions_by_section[section_id].append(question)
+        for choice in Choice.objects.filter(question__section__form=self).order_by('order', 'id').values(
+            'id', 'question_id', 'text', 'order',
+        ):
+            choices_by_question[choice.pop('question_id')].append(choice)
+        return sections
+
+    def refresh_structure(self):
+        """Rebuild and store ``structure`` without touching ``updated_at``."""
+        self.structure = self.build_structure()
+        Form.objects.filter(pk=self.pk).update(structure=self.structure)
+
     def _generate_qr_code(self):
         url = f'{getattr(settings, "FRONTEND_BASE_URL", "http://localhost:5173")}/f/{self.share_id}'
         qr = qrcode.QRCode(version=1, box_size=10, border=4)
@@ -140,10 +173,26 @@ class Choice(models.Model):
         return self.text
 
 
+class ResponseQuerySet(models.QuerySet):
+    def delete(self):
+        # Keep the analytics rollups and the deletion log in step; cascades from deleted forms drop them anyway
+        from .deltas import log_deletions
+        from .rollups import forget_responses
+
+        with transaction.atomic(using=self.db):
+            forget_responses(self)
+            log_deletions(self)
+            return super().delete()
+
+
 class Response(models.Model):
     """A submission of a form."""
     form = models.ForeignKey(Form, related_name='responses', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set for submissions accepted through the ingestion spool; makes replays idempotent
+    receipt_id = models.UUIDField(unique=True, null=True, blank=True, editable=False)
+
+    objects = ResponseQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
@@ -151,6 +200,15 @@ class Response(models.Model):
     def __str__(self):
         return f'Response to {self.form.title} at {self.created_at}'
 
+    def delete(self, *args, **kwargs):
+        from .deltas import log_deletions
+        from .rollups import forget_responses
+
+        with transaction.atomic():
+            forget_responses(Response.objects.filter(pk=self.pk))
+            log_deletions(Response.objects.filter(pk=self.pk))
+            return super().delete(*args, **kwargs)
+
 
 class Answer(models.Model):
     """A single answer to a question within a response."""
@@ -160,16 +218,147 @@ class Answer(models.Model):
     # Store text/number answers here
     text_answer = models.TextField(blank=True, null=True)
 
+    # Typed copy of number/float answers for index-backed filters and aggregates
+    numeric_answer = models.FloatField(blank=True, null=True)
+
     # Store uploaded file for media questions
     file_answer = models.FileField(upload_to='uploads/%Y/%m/%d/', blank=True, null=True)
     
     # Store choices for MC/MS here
     selected_choices = models.ManyToManyField(Choice, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['question', 'numeric_answer'], name='forms_api_answer_numeric_idx'),
+        ]
+
     def __str__(self):
         return f'Answer to {self.question.text}'
 
 
+class FormRollup(models.Model):
+    """Response count of a form, maintained by ``rollups``."""
+    form = models.OneToOneField(Form, primary_key=True, related_name='rollup', on_delete=models.CASCADE)
+    response_count = models.BigIntegerField(default=0)
+
+
+class QuestionRollup(models.Model):
+    """Answer counts of a question, maintained by ``rollups``."""
+    question = models.OneToOneField(Question, primary_key=True, related_name='rollup', on_delete=models.CASCADE)
+    # Answer rows, and those with text, an upload or at least one selected choice
+    answer_count = models.BigIntegerField(default=0)
+    nonempty_count = models.BigIntegerField(default=0)
+
+
+class ChoiceRollup(models.Model):
+    """Number of answers that selected a choice, maintained by ``rollups``."""
+    choice = models.OneToOneField(Choice, primary_key=True, related_name='rollup', on_delete=models.CASCADE)
+    count = models.BigIntegerField(default=0)
+
+
+class TextAnswerSketch(models.Model):
+    """Space-Saving top-k summary of a text question's answers, maintained by ``sketches``."""
+    question = models.OneToOneField(Question, primary_key=True, related_name='text_sketch', on_delete=models.CASCADE)
+    total = models.BigIntegerField(default=0)
+    # [[normalized key, text, count, error], ...]
+    counters = models.JSONField(default=list)
+    # The reported bound never drops below this; raised when a delete lowers a counter
+    floor = models.BigIntegerField(default=0)
+
+
+class TextAnswerDelta(models.Model):
+    """Text answers recorded since the question's ``TextAnswerSketch`` was last merged; see ``sketches``."""
+    question = models.ForeignKey(Question, related_name='text_sketch_deltas', on_delete=models.CASCADE)
+    text = models.TextField()
+    weight = models.PositiveIntegerField(default=1)
+
+
+class NumericAnswerSketch(models.Model):
+    """Quantile sketch of a numeric question's answers on one UTC day, maintained by ``sketches``."""
+    question = models.ForeignKey(Question, related_name='numeric_sketches', on_delete=models.CASCADE)
+    day = models.DateField()
+    count = models.BigIntegerField(default=0)
+    total = models.FloatField(default=0)
+    zero_count = models.BigIntegerField(default=0)
+    # Bucket index -> count, for positive and negative values
+    positive = models.JSONField(default=dict)
+    negative = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['question', 'day'], name='unique_numeric_answer_sketch'),
+        ]
+
+
+class SubmissionBucket(models.Model):
+    """Responses to a form per UTC hour or day, maintained by ``rollups``."""
+    GRANULARITIES = (
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    )
+    form = models.ForeignKey(Form, related_name='submission_buckets', on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=4, choices=GRANULARITIES)
+    start = models.DateTimeField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['form', 'granularity', 'start'], name='unique_submission_bucket'),
+        ]
+
+
+class ResponseDeletion(models.Model):
+    """Tombstone of a deleted response, read by delta exports (see ``deltas``)."""
+    form = models.ForeignKey(Form, related_name='response_deletions', on_delete=models.CASCADE)
+    response_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['form', 'id'], name='forms_api_deletion_form_idx'),
+        ]
+
+
+class ExportJob(models.Model):
+    """A background export of a form's responses, run by ``export_jobs``."""
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    form = models.ForeignKey(Form, related_name='export_jobs', on_delete=models.CASCADE)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='export_jobs', on_delete=models.SET_NULL, null=True, blank=True)
+    format = models.CharField(max_length=16)
+    compression = models.CharField(max_length=8, blank=True, default='')
+    # Validated response filter (see ``filters.py``)
+    predicates = models.JSONField(default=list)
+    start = models.DateTimeField(null=True, blank=True)
+    end = models.DateTimeField(null=True, blank=True)
+    # Scheme and host that upload URLs in the export are built against
+    base_uri = models.CharField(max_length=255, blank=True, default='')
+    # File name of the cached artifact in EXPORT_ARTIFACT_DIR
+    artifact = models.CharField(max_length=255)
+    status = models.CharField(max_length=8, choices=STATUSES, default='pending')
+    progress = models.BigIntegerField(default=0)
+    total = models.BigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Last sign of life from the runner; running jobs silent for EXPORT_JOB_STALE_AFTER are taken over
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='forms_api_exportjob_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.format} export of {self.form.title} ({self.status})'
+
+
 class FormPermission(models.Model):
     PERMISSION_CHOICES = (
         ('edit', 'Edit'),
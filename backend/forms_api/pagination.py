@@ -0,0 +1,86 @@
+"""
+Keyset pagination for ``FormViewSet.responses``.
+
+Pages run newest first by ``(created_at, id)``. A page's ``next`` cursor
+encodes its last row, and the next page starts just past it, so every page is a
+single range seek on the ``(form, created_at)`` index no matter how deep it is.
+Responses inserted while a client is paging never shift rows between pages,
+but they sort by ``created_at``, not by when they were inserted. A spooled
+submission flushed late keeps its original ``created_at``, so it can land
+behind a cursor that has already passed it and never appear to that client.
+Syncs that must see every response should page delta exports (``deltas``),
+which follow ids. No ``COUNT(*)`` is run, and
+``count`` is whatever total the view passes in (the rollup counter for an
+unfiltered listing, ``None`` otherwise).
+"""
+import base64
+import binascii
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response as DRFResponse
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(response):
+    """Cursor just past ``response``, a ``Response`` or a row with ``id`` and ``created_at``."""
+    position = f'{response.created_at.isoformat()}|{response.id}'
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """``(created_at, id)`` from a cursor, or ``None`` for an empty one; raises ``NotFound`` if invalid."""
+    if not cursor:
+        return None
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        position = parse_datetime(created_at), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise NotFound('Invalid cursor')
+    if position[0] is None:
+        raise NotFound('Invalid cursor')
+    return position
+
+
+def seek(queryset, position, size):
+    """Up to ``size`` rows of ``queryset``, newest first, just past ``position`` (``(created_at, id)`` or ``None``)."""
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, pk__gte=pk)
+    return list(queryset.order_by('-created_at', '-pk')[:size])
+
+
+def seek_ids(queryset, before, size):
+    """Up to ``size`` rows of ``queryset``, highest id first, with ids below ``before`` (all when ``None``)."""
+    if before is not None:
+        queryset = queryset.filter(pk__lt=before)
+    return list(queryset.order_by('-pk')[:size])
+
+
+class ResponseCursorPagination(BasePagination):
+    cursor_query_param = 'cursor'
+
+    def __init__(self, page_size, count=None):
+        self.page_size = page_size
+        self.count = count
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        position = decode_cursor(request.query_params.get(self.cursor_query_param))
+        rows = seek(queryset, position, self.page_size + 1)
+        self.next_cursor = encode_cursor(rows[self.page_size - 1]) if len(rows) > self.page_size else None
+        return rows[:self.page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return DRFResponse({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
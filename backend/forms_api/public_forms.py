@@ -0,0 +1,61 @@
+"""
+Pre-rendered payloads for the public ``by_share_id`` endpoint.
+
+The fully rendered JSON of a form is cached per share id, form version
+(``Form.updated_at``) and host (``media_url`` is absolute), together with a
+strong ETag derived from the bytes. A cache hit costs one indexed lookup of the
+form's version and a miss renders from the form's ``structure`` document.
+Anything that changes the rendered form bumps ``updated_at`` (builder saves,
+question media removal) so stale entries are never served.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.renderers import JSONRenderer
+
+from .models import Form
+from .serializers import FormDetailSerializer
+
+
+def public_form_cache():
+    return caches[settings.PUBLIC_FORM_CACHE]
+
+
+def _cache_key(share_id, version, request):
+    return f'public-form:{share_id}:{version.isoformat()}:{request.scheme}://{request.get_host()}'
+
+
+def render_public_form(form, request):
+    """Render ``form`` exactly as ``by_share_id`` returns it; returns ``(etag, body)``."""
+    data = FormDetailSerializer(form, context={'request': request}).data
+    body = JSONRenderer().render(data)
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+    return etag, body
+
+
+def get_public_form(share_id, request):
+    """Return ``(etag, body)`` for the form shared as ``share_id``, or ``None``."""
+    try:
+        share_id = uuid.UUID(str(share_id))
+    except ValueError:
+        return None
+
+    version = Form.objects.filter(share_id=share_id).values_list('updated_at', flat=True).first()
+    if version is None:
+        return None
+
+    cache = public_form_cache()
+    key = _cache_key(share_id, version, request)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    form = Form.objects.filter(share_id=share_id).first()
+    if form is None:
+        return None
+    rendered = render_public_form(form, request)
+    # Key on the version read above, so a concurrent save can only orphan this entry
+    cache.set(key, rendered, settings.PUBLIC_FORM_CACHE_TIMEOUT)
+    return rendered
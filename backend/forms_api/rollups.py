@@ -0,0 +1,275 @@
+"""
+Incrementally maintained counters behind ``FormViewSet.analytics`` and
+``FormViewSet.trends``.
+
+``FormRollup`` (responses per form), ``QuestionRollup`` (answer and non-empty
+answer counts per question), ``ChoiceRollup`` (selections per choice) and
+``SubmissionBucket`` (responses per form and UTC hour/day) are incremented
+inside the submission transaction and decremented when responses are deleted,
+so analytics reads cost O(questions) and trend reads O(buckets) instead of a
+scan of every answer or response. The text and numeric sketches in
+``sketches.py`` are kept up to date alongside them. Counters change with
+``UPDATE ... SET n = n + delta`` and rows are created on first use.
+
+Builder edits that delete choices drop answer↔choice rows, which can turn an
+answer empty; the affected questions are recounted with
+``refresh_question_rollups``; questions whose type changed go through
+``refresh_question_types``. ``manage.py rebuild_rollups`` recomputes
+everything from the answers (``--verify`` only reports drift); run it while no
+submissions are being written, since it stores absolute values.
+"""
+import operator
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, Exists, F, OuterRef, Q, Value, When
+from django.db.models.functions import TruncDay, TruncHour
+
+from .models import Answer, Choice, ChoiceRollup, FormRollup, Question, QuestionRollup, Response, SubmissionBucket
+from .schema import refresh_numeric_answers
+from .sketches import (
+    forget_numeric_answers, forget_text_answers, rebuild_question_sketches, record_numeric_answers,
+    record_text_answers,
+)
+
+BUCKET_KEY = ('form_id', 'granularity', 'start')
+
+QUESTION_FIELDS = ('answer_count', 'nonempty_count')
+
+
+def _nonempty():
+    selected = Answer.selected_choices.through.objects.filter(answer_id=OuterRef('pk'))
+    return (
+        (Q(text_answer__isnull=False) & ~Q(text_answer=''))
+        | (Q(file_answer__isnull=False) & ~Q(file_answer=''))
+        | Q(Exists(selected))
+    )
+
+
+def _question_counts(answers):
+    """``{question_id: {'answer_count', 'nonempty_count'}}`` for ``answers``."""
+    return {
+        row.pop('question_id'): row
+        for row in answers.order_by().values('question_id').annotate(
+            answer_count=Count('id'),
+            nonempty_count=Count('id', filter=_nonempty()),
+        )
+    }
+
+
+def _choice_counts(selections):
+    return dict(selections.order_by().values('choice_id').annotate(n=Count('id')).values_list('choice_id', 'n'))
+
+
+def _delta_expression(field, keys, deltas, lookups):
+    amounts = {key: deltas[key].get(field, 0) for key in keys}
+    if len(set(amounts.values())) == 1:
+        return F(field) + Value(next(iter(amounts.values())))
+    return F(field) + Case(
+        *[When(**lookups[key], then=Value(amount)) for key, amount in amounts.items() if amount],
+        default=Value(0),
+        output_field=BigIntegerField(),
+    )
+
+
+def _add(model, deltas, key_fields=('pk',)):
+    """Add ``deltas`` (``{key: {field: amount}}``) to rollup rows, creating missing rows.
+
+    Keys are primary keys, or tuples of ``key_fields`` values for rows with a
+    composite unique key.
+    """
+    deltas = {key: fields for key, fields in deltas.items() if any(fields.values())}
+    if not deltas:
+        return
+    names = sorted({field for fields in deltas.values() for field in fields})
+    composite = len(key_fields) > 1
+    lookups = {key: dict(zip(key_fields, key if composite else (key,))) for key in deltas}
+
+    def rows(keys):
+        if not composite:
+            return model.objects.filter(pk__in=keys)
+        return model.objects.filter(reduce(operator.or_, (Q(**lookups[key]) for key in keys)))
+
+    def update(keys):
+        return rows(keys).update(**{field: _delta_expression(field, keys, deltas, lookups) for field in names})
+
+    keys = list(deltas)
+    if update(keys) == len(keys):
+        return
+    existing = set(rows(keys).values_list(*key_fields, flat=not composite))
+    missing = [key for key in keys if key not in existing]
+    # Another transaction may create the same rows first; its rows get our delta below
+    model.objects.bulk_create([model(**lookups[key]) for key in missing], ignore_conflicts=True)
+    update(missing)
+
+
+def _bucket_start(created_at, granularity):
+    created_at = created_at.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return created_at.replace(hour=0) if granularity == 'day' else created_at
+
+
+def _bucket_counts(responses):
+    """``{(form_id, granularity, start): count}`` for ``responses``, bucketed in UTC."""
+    counts = {}
+    for granularity, trunc in (('hour', TruncHour), ('day', TruncDay)):
+        for row in responses.order_by().values('form_id', bucket=trunc('created_at', tzinfo=dt_timezone.utc)).annotate(
+            n=Count('id'),
+        ):
+            counts[(row['form_id'], granularity, row['bucket'])] = row['n']
+    return counts
+
+
+def record_responses(entries):
+    """Count freshly inserted ``(response, answers_data)`` pairs into the rollups."""
+    forms = defaultdict(lambda: {'response_count': 0})
+    questions = defaultdict(lambda: dict.fromkeys(QUESTION_FIELDS, 0))
+    choices = defaultdict(lambda: {'count': 0})
+    buckets = defaultdict(lambda: {'count': 0})
+    for response, answers in entries:
+        forms[response.form_id]['response_count'] += 1
+        for granularity in ('hour', 'day'):
+            buckets[(response.form_id, granularity, _bucket_start(response.created_at, granularity))]['count'] += 1
+        for answer in answers:
+            counts = questions[answer['question_id']]
+            counts['answer_count'] += 1
+            if answer['text_answer'] or answer['file_answer'] or answer['choice_ids']:
+                counts['nonempty_count'] += 1
+            for choice_id in answer['choice_ids']:
+                choices[choice_id]['count'] += 1
+
+    _add(FormRollup, forms)
+    _add(QuestionRollup, questions)
+    _add(ChoiceRollup, choices)
+    _add(SubmissionBucket, buckets, BUCKET_KEY)
+    record_text_answers(entries)
+    record_numeric_answers(entries)
+
+
+def forget_responses(responses):
+    """Subtract ``responses`` (a queryset, about to be deleted) from the rollups."""
+    response_ids = responses.values('pk')
+    answers = Answer.objects.filter(response_id__in=response_ids)
+    forms = Response.objects.filter(pk__in=response_ids).order_by().values('form_id').annotate(n=Count('id'))
+    questions = _question_counts(answers)
+    choices = _choice_counts(
+        Answer.selected_choices.through.objects.filter(answer__response_id__in=response_ids)
+    )
+
+    _add(FormRollup, {row['form_id']: {'response_count': -row['n']} for row in forms})
+    _add(QuestionRollup, {
+        pk: {field: -amount for field, amount in counts.items()} for pk, counts in questions.items()
+    })
+    _add(ChoiceRollup, {pk: {'count': -n} for pk, n in choices.items()})
+    _add(SubmissionBucket, {
+        key: {'count': -n} for key, n in _bucket_counts(Response.objects.filter(pk__in=response_ids)).items()
+    }, BUCKET_KEY)
+    forget_text_answers(answers)
+    forget_numeric_answers(answers)
+
+
+def refresh_question_rollups(question_ids):
+    """Recount the answers of ``question_ids`` from scratch (after choices were deleted)."""
+    question_ids = list(Question.objects.filter(id__in=question_ids).values_list('id', flat=True))
+    if not question_ids:
+        return
+    counts = _question_counts(Answer.objects.filter(question_id__in=question_ids))
+    QuestionRollup.objects.bulk_create(
+        [QuestionRollup(question_id=qid, **counts.get(qid, {})) for qid in question_ids],
+        update_conflicts=True,
+        unique_fields=['question'],
+        update_fields=list(QUESTION_FIELDS),
+    )
+
+
+def refresh_question_types(question_ids):
+    """Re-derive the numeric answers and sketches of ``question_ids`` (after their type changed)."""
+    refresh_numeric_answers(question_ids)
+    rebuild_question_sketches(question_ids)
+
+
+def compute_rollups(form, responses=None):
+    """Count ``form``'s responses, answers and selections; returns ``(form, questions, choices)``.
+
+    ``responses`` narrows the counts to a subset of the form's responses.
+    """
+    question_ids = list(Question.objects.filter(section__form=form).values_list('id', flat=True))
+    answers = Answer.objects.filter(question_id__in=question_ids)
+    selections = Answer.selected_choices.through.objects.filter(choice__question__section__form=form)
+    if responses is None:
+        responses = Response.objects.filter(form=form)
+    else:
+        answers = answers.filter(response__in=responses)
+        selections = selections.filter(answer__response__in=responses)
+    counts = _question_counts(answers)
+    selections = _choice_counts(selections)
+    choice_ids = Choice.objects.filter(question_id__in=question_ids).values_list('id', flat=True)
+    return (
+        {'response_count': responses.count()},
+        {qid: {**dict.fromkeys(QUESTION_FIELDS, 0), **counts.get(qid, {})} for qid in question_ids},
+        {cid: {'count': selections.get(cid, 0)} for cid in choice_ids},
+    )
+
+
+def stored_rollups(form, question_ids, choice_ids):
+    """Read the stored counters in the shape returned by ``compute_rollups``."""
+    form_row = FormRollup.objects.filter(form=form).values('response_count').first()
+    questions = {
+        row.pop('question_id'): row
+        for row in QuestionRollup.objects.filter(question_id__in=question_ids).values('question_id', *QUESTION_FIELDS)
+    }
+    choices = dict(ChoiceRollup.objects.filter(choice_id__in=choice_ids).values_list('choice_id', 'count'))
+    return (
+        form_row or {'response_count': 0},
+        {qid: questions.get(qid, dict.fromkeys(QUESTION_FIELDS, 0)) for qid in question_ids},
+        {cid: {'count': choices.get(cid, 0)} for cid in choice_ids},
+    )
+
+
+@transaction.atomic
+def rebuild_rollups(form):
+    """Overwrite ``form``'s counters with freshly computed values."""
+    form_counts, questions, choices = compute_rollups(form)
+    FormRollup.objects.update_or_create(form=form, defaults=form_counts)
+    QuestionRollup.objects.bulk_create(
+        [QuestionRollup(question_id=qid, **counts) for qid, counts in questions.items()],
+        update_conflicts=True,
+        unique_fields=['question'],
+        update_fields=list(QUESTION_FIELDS),
+    )
+    ChoiceRollup.objects.bulk_create(
+        [ChoiceRollup(choice_id=cid, **counts) for cid, counts in choices.items()],
+        update_conflicts=True,
+        unique_fields=['choice'],
+        update_fields=['count'],
+    )
+    SubmissionBucket.objects.filter(form=form).delete()
+    SubmissionBucket.objects.bulk_create([
+        SubmissionBucket(form_id=form_id, granularity=granularity, start=start, count=n)
+        for (form_id, granularity, start), n in _bucket_counts(Response.objects.filter(form=form)).items()
+    ])
+
+
+def verify_rollups(form):
+    """Return ``[(label, stored, expected)]`` for every counter of ``form`` that drifted."""
+    expected = compute_rollups(form)
+    stored = stored_rollups(form, list(expected[1]), list(expected[2]))
+    mismatches = []
+    if stored[0] != expected[0]:
+        mismatches.append((f'form {form.pk}', stored[0], expected[0]))
+    for kind, stored_rows, expected_rows in (('question', stored[1], expected[1]), ('choice', stored[2], expected[2])):
+        for pk, counts in expected_rows.items():
+            if stored_rows[pk] != counts:
+                mismatches.append((f'{kind} {pk}', stored_rows[pk], counts))
+
+    expected_buckets = _bucket_counts(Response.objects.filter(form=form))
+    stored_buckets = {
+        (form.pk, granularity, start): n
+        for granularity, start, n in SubmissionBucket.objects.filter(form=form).values_list('granularity', 'start', 'count')
+    }
+    for key in sorted(expected_buckets.keys() | stored_buckets.keys(), key=lambda key: (key[1], key[2])):
+        if stored_buckets.get(key, 0) != expected_buckets.get(key, 0):
+            label = f'{key[1]} bucket {key[2].isoformat()} of form {form.pk}'
+            mismatches.append((label, stored_buckets.get(key, 0), expected_buckets.get(key, 0)))
+    return mismatches
@@ -0,0 +1,293 @@
+"""
+Compiled per-form validation schema for the submit endpoint.
+
+A ``FormSchema`` maps question ids to their type, required flag and allowed
+choice ids, and validates a submission payload in plain Python without touching
+the database. Schemas are compiled once per form version (``Form.updated_at``)
+and kept in a process-local LRU, optionally backed by a shared Django cache
+named by ``settings.FORM_SCHEMA_SHARED_CACHE``.
+
+Every builder save goes through ``Form.save()`` and therefore bumps
+``updated_at``; structural edits made elsewhere (e.g. the Django admin) are only
+picked up once the form itself is saved again.
+"""
+import math
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import serializers
+from rest_framework.fields import empty
+
+from .models import Answer, Choice, Question
+from .sketches import NUMERIC_TYPES
+
+
+def _clean_text(value):
+    return value
+
+
+def _clean_number(value):
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError('A valid integer is required for this question.')
+    if not math.isfinite(number) or number != int(number):
+        raise ValueError('A whole number is required for this question.')
+    # Normalise: remove leading zeros, store canonical int string
+    return str(int(number))
+
+
+def _clean_float(value):
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError('A valid number is required for this question.')
+    if not math.isfinite(number):
+        raise ValueError('A valid number is required for this question.')
+    # Normalise: remove leading/trailing zeros artefacts
+    return str(number)
+
+
+TEXT_VALIDATORS = {
+    'number': _clean_number,
+    'float': _clean_float,
+}
+
+
+def numeric_value(question_type, text):
+    """The value stored in ``Answer.numeric_answer`` for a cleaned ``text`` answer."""
+    if question_type not in NUMERIC_TYPES or not text:
+        return None
+    try:
+        value = float(text)
+    except ValueError:
+        return None  # Answered before the question became numeric
+    return value if math.isfinite(value) else None
+
+
+NUMERIC_REFRESH_BATCH_SIZE = 1000
+
+
+def refresh_numeric_answers(question_ids):
+    """Re-derive ``Answer.numeric_answer`` of ``question_ids`` from the stored text; returns the rows changed.
+
+    Submissions fill the column in, so this is only needed once a question's
+    type changed after it was answered.
+    """
+    types = dict(Question.objects.filter(id__in=question_ids).values_list('id', 'question_type'))
+    numeric = [qid for qid, question_type in types.items() if question_type in NUMERIC_TYPES]
+    changed = Answer.objects.filter(
+        question_id__in=types.keys() - set(numeric), numeric_answer__isnull=False,
+    ).update(numeric_answer=None)
+
+    answers = Answer.objects.filter(question_id__in=numeric).only(
+        'pk', 'question_id', 'text_answer', 'numeric_answer',
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(answers.filter(pk__gt=last_pk)[:NUMERIC_REFRESH_BATCH_SIZE])
+        if not batch:
+            return changed
+        stale = []
+        for answer in batch:
+            value = numeric_value(types[answer.question_id], answer.text_answer)
+            if value != answer.numeric_answer:
+                answer.numeric_answer = value
+                stale.append(answer)
+        Answer.objects.bulk_update(stale, ['numeric_answer'])
+        changed += len(stale)
+        last_pk = batch[-1].pk
+
+
+class CompiledQuestion:
+    __slots__ = ('id', 'question_type', 'required', 'choice_ids', 'clean_text')
+
+    def __init__(self, question_id, question_type, required, choice_ids):
+        self.id = question_id
+        self.question_type = question_type
+        self.required = required
+        self.choice_ids = frozenset(choice_ids)
+        self.clean_text = TEXT_VALIDATORS.get(question_type, _clean_text)
+
+
+class FormSchema:
+    """Validation rules for one version of a form's question tree."""
+
+    def __init__(self, form_id, version, questions):
+        self.form_id = form_id
+        self.version = version
+        # question id -> (question_type, required, choice ids)
+        self.raw = questions
+        self.questions = {
+            question_id: CompiledQuestion(question_id, question_type, required, choice_ids)
+            for question_id, (question_type, required, choice_ids) in questions.items()
+        }
+        self.required_ids = [q.id for q in self.questions.values() if q.required]
+
+    def validate(self, answers=empty):
+        """Return cleaned answers or raise ``ValidationError`` with per-answer errors.
+
+        Cleaned answers are dicts with ``question_id``, ``question_type``,
+        ``text_answer``, ``numeric_answer``, ``file_answer`` and ``choice_ids``,
+        ready for ``create_response``. ``answers`` is ``empty`` when the payload
+        has no ``answers`` key; only an explicit empty list submits no answers.
+        """
+        if answers is empty:
+            raise serializers.ValidationError({'answers': ['This field is required.']})
+        if answers is None:
+            raise serializers.ValidationError({'answers': ['This field may not be null.']})
+        if isinstance(answers, (str, dict)) or not hasattr(answers, '__iter__'):
+            raise serializers.ValidationError(
+                {'answers': [f'Expected a list of items but got type "{type(answers).__name__}".']}
+            )
+
+        cleaned = []
+        errors = []
+        seen = set()
+        answered = set()
+        for answer in answers:
+            try:
+                item = self._clean_answer(answer, seen)
+            except serializers.ValidationError as exc:
+                errors.append(exc.detail)
+                continue
+            errors.append({})
+            cleaned.append(item)
+            seen.add(item['question_id'])
+            if item['text_answer'] or item['file_answer'] or item['choice_ids']:
+                answered.add(item['question_id'])
+
+        if any(errors):
+            raise serializers.ValidationError({'answers': errors})
+
+        missing = [question_id for question_id in self.required_ids if question_id not in answered]
+        if missing:
+            raise serializers.ValidationError({
+                'detail': 'Please answer all required questions.',
+                'missing_required': {question_id: ['This question is required.'] for question_id in missing},
+            })
+        return cleaned
+
+    def _clean_answer(self, answer, seen):
+        if not isinstance(answer, dict):
+            raise serializers.ValidationError(
+                {'non_field_errors': [f'Invalid data. Expected a dictionary, but got {type(answer).__name__}.']}
+            )
+
+        question_id = answer.get('question_id')
+        if question_id is None or question_id == '':
+            raise serializers.ValidationError({'question_id': ['This field is required.']})
+        try:
+            question = self.questions.get(int(question_id)) if not isinstance(question_id, bool) else None
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({'question_id': ['Incorrect type. Expected pk value.']})
+        if question is None:
+            raise serializers.ValidationError({'question_id': [f'Invalid pk "{question_id}" - object does not exist.']})
+        if question.id in seen:
+            raise serializers.ValidationError({'question_id': ['This question was answered more than once.']})
+
+        text_answer = self._clean_text_answer(question, answer.get('text_answer'))
+        return {
+            'question_id': question.id,
+            'question_type': question.question_type,
+            'text_answer': text_answer,
+            'numeric_answer': numeric_value(question.question_type, text_answer),
+            'file_answer': self._clean_file_answer(answer.get('file_answer')),
+            'choice_ids': self._clean_choice_ids(question, answer.get('selected_choices')),
+        }
+
+    @staticmethod
+    def _clean_text_answer(question, value):
+        if value is None:
+            return None
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise serializers.ValidationError({'text_answer': ['Not a valid string.']})
+        # Normalise whitespace for all text answers first
+        value = str(value).strip()
+        if value == '':
+            return value
+        try:
+            return question.clean_text(value)
+        except ValueError as exc:
+            raise serializers.ValidationError({'text_answer': [str(exc)]})
+
+    @staticmethod
+    def _clean_file_answer(value):
+        if value is None or value == '':
+            return None
+        if not getattr(value, 'name', None) or not hasattr(value, 'size'):
+            raise serializers.ValidationError(
+                {'file_answer': ['The submitted data was not a file. Check the encoding type on the form.']}
+            )
+        if not value.size:
+            raise serializers.ValidationError({'file_answer': ['The submitted file is empty.']})
+        return value
+
+    @staticmethod
+    def _clean_choice_ids(question, value):
+        if value is None:
+            return []
+        if isinstance(value, (str, dict)) or not hasattr(value, '__iter__'):
+            raise serializers.ValidationError(
+                {'selected_choices': [f'Expected a list of items but got type "{type(value).__name__}".']}
+            )
+        choice_ids = []
+        for choice_id in value:
+            try:
+                choice_id = int(choice_id) if not isinstance(choice_id, bool) else None
+            except (TypeError, ValueError):
+                choice_id = None
+            if choice_id is None or choice_id not in question.choice_ids:
+                raise serializers.ValidationError(
+                    {'selected_choices': ['Selected choices must belong to this question.']}
+                )
+            if choice_id not in choice_ids:
+                choice_ids.append(choice_id)
+        if question.question_type == 'multiple_choice' and len(choice_ids) > 1:
+            raise serializers.ValidationError({'selected_choices': ['Select only one option.']})
+        return choice_ids
+
+
+def compile_form_schema(form_id, version):
+    """Build a ``FormSchema`` from the database with two queries."""
+    questions = {
+        question_id: (question_type, required, [])
+        for question_id, question_type, required in Question.objects.filter(
+            section__form_id=form_id
+        ).order_by().values_list('id', 'question_type', 'required')
+    }
+    for choice_id, question_id in Choice.objects.filter(
+        question__section__form_id=form_id
+    ).order_by().values_list('id', 'question_id'):
+        questions[question_id][2].append(choice_id)
+    return FormSchema(form_id, version, questions)
+
+
+def _shared_cache():
+    alias = getattr(settings, 'FORM_SCHEMA_SHARED_CACHE', None)
+    return caches[alias] if alias else None
+
+
+@lru_cache(maxsize=getattr(settings, 'FORM_SCHEMA_CACHE_SIZE', 256))
+def _load_form_schema(form_id, version):
+    shared = _shared_cache()
+    key = f'form-schema:{form_id}:{version}'
+    if shared is not None:
+        raw = shared.get(key)
+        if raw is not None:
+            return FormSchema(form_id, version, raw)
+
+    schema = compile_form_schema(form_id, version)
+    if shared is not None:
+        shared.set(key, schema.raw)
+    return schema
+
+
+def get_form_schema(form):
+    """Return the compiled schema for the current version of ``form``."""
+    return _load_form_schema(form.id, form.updated_at.isoformat())
+
+
+def clear_schema_cache():
+    _load_form_schema.cache_clear()
@@ -0,0 +1,163 @@
+"""
+Full-text search over answers (``?search=`` on ``FormViewSet.responses``).
+
+On SQLite, non-empty ``Answer.text_answer`` values are indexed in the FTS5
+table ``forms_api_answer_search``. Triggers on ``forms_api_answer`` keep it in
+step within the same transaction: submissions, deleted responses and cascades
+from deleted questions or forms all update it. Each row also carries a
+``form<id>`` token, so a search intersects with one form's postings instead of
+filtering every match. ``response_id`` and ``question_id`` are stored
+unindexed. ``manage.py rebuild_search_index`` repopulates the table.
+
+A query's terms must all appear in one answer, and the last term also matches
+as a prefix. Responses are ranked by the BM25 score of their best answer, up to
+``settings.SEARCH_MAX_RESULTS`` of them. Each result carries a snippet of that
+answer, HTML-escaped with the matched terms in ``<mark>``.
+
+Other database backends have no index. They fall back to a case-insensitive
+scan of the form's answers, newest responses first.
+"""
+import html
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Answer, Response
+
+TABLE = 'forms_api_answer_search'
+SNIPPET_TOKENS = 12
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+_INDEXED_ROWS = (
+    f"INSERT INTO {TABLE}(rowid, text_answer, form_key, response_id, question_id) "
+    "SELECT a.id, a.text_answer, 'form' || r.form_id, a.response_id, a.question_id "
+    "FROM forms_api_answer a JOIN forms_api_response r ON r.id = a.response_id "
+    "WHERE {where}"
+)
+_INDEX_NEW_ROW = _INDEXED_ROWS.format(where="a.id = NEW.id AND NEW.text_answer <> ''")
+_INDEX_STATEMENTS = [
+    f"CREATE VIRTUAL TABLE {TABLE} USING fts5("
+    "text_answer, form_key, response_id UNINDEXED, question_id UNINDEXED, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    f'CREATE TRIGGER {TABLE}_insert AFTER INSERT ON forms_api_answer BEGIN {_INDEX_NEW_ROW}; END',
+    f'CREATE TRIGGER {TABLE}_delete AFTER DELETE ON forms_api_answer BEGIN DELETE FROM {TABLE} WHERE rowid = OLD.id; END',
+    f'CREATE TRIGGER {TABLE}_update AFTER UPDATE OF text_answer ON forms_api_answer BEGIN '
+    f'DELETE FROM {TABLE} WHERE rowid = OLD.id; {_INDEX_NEW_ROW}; END',
+]
+
+
+def is_indexed():
+    return connection.vendor == 'sqlite'
+
+
+def create_search_index(cursor):
+    """Create the FTS5 table and its triggers, and index the existing answers."""
+    for statement in _INDEX_STATEMENTS:
+        cursor.execute(statement)
+    cursor.execute(_INDEXED_ROWS.format(where="a.text_answer <> ''"))
+
+
+def drop_search_index(cursor):
+    for name in ('insert', 'delete', 'update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {TABLE}_{name}')
+    cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+def rebuild_search_index(form_id=None):
+    """Re-index every answer, or only those of ``form_id``."""
+    with connection.cursor() as cursor:
+        if form_id is None:
+            cursor.execute(f'DELETE FROM {TABLE}')
+            cursor.execute(_INDEXED_ROWS.format(where="a.text_answer <> ''"))
+        else:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE form_key MATCH %s', [f'form{int(form_id)}'])
+            cursor.execute(_INDEXED_ROWS.format(where="a.text_answer <> '' AND r.form_id = %s"), [form_id])
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+
+
+def search_terms(query):
+    """Words of a search query; punctuation-only words are dropped."""
+    return [term for term in query.split() if any(char.isalnum() for char in term)]
+
+
+def _match_expression(form_id, terms):
+    phrases = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+    return f'form_key : form{int(form_id)} AND text_answer : ({phrases}*)'
+
+
+def rank_responses(form, terms, responses=None):
+    """``[(response_id, score)]`` of ``form``'s responses with an answer containing every term, best first.
+
+    ``responses`` (a queryset) narrows the candidates. Scores are BM25, lower is
+    better, and ``None`` without the index.
+    """
+    if not terms:
+        return []
+    if not is_indexed():
+        return _scan_responses(form, terms, responses)
+
+    sql = f'SELECT response_id, bm25({TABLE}, 1.0, 0.0) AS score FROM {TABLE} WHERE {TABLE} MATCH %s'
+    params = [_match_expression(form.pk, terms)]
+    if responses is not None:
+        subquery, subquery_params = responses.order_by().values('pk').query.sql_with_params()
+        sql += f' AND response_id IN ({subquery})'
+        params.extend(subquery_params)
+    # Materialized so that bm25() is evaluated in the full-text scan, not the aggregate
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH matches AS MATERIALIZED ({sql}) '
+            'SELECT response_id, MIN(score) AS best FROM matches GROUP BY response_id ORDER BY best, response_id LIMIT %s',
+            [*params, settings.SEARCH_MAX_RESULTS],
+        )
+        return cursor.fetchall()
+
+
+def _matching_answers(form, terms):
+    answers = Answer.objects.filter(response__form=form)
+    for term in terms:
+        answers = answers.filter(text_answer__icontains=term)
+    return answers
+
+
+def _scan_responses(form, terms, responses):
+    matched = Response.objects.filter(form=form, pk__in=_matching_answers(form, terms).values('response_id'))
+    if responses is not None:
+        matched = matched.filter(pk__in=responses.order_by().values('pk'))
+    return [(pk, None) for pk in matched.order_by('-created_at', '-id').values_list('pk', flat=True)[:settings.SEARCH_MAX_RESULTS]]
+
+
+def _marked(text):
+    return html.escape(text).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def _scanned_snippet(text, terms):
+    lowered = text.lower()
+    start = max(lowered.find(terms[0].lower()), 0)
+    end = start + len(terms[0])
+    window_start, window_end = max(start - 40, 0), min(end + 40, len(text))
+    snippet = text[window_start:start] + _MARK_START + text[start:end] + _MARK_END + text[end:window_end]
+    return ('…' if window_start else '') + snippet + ('…' if window_end < len(text) else '')
+
+
+def search_snippets(form, terms, response_ids):
+    """``{response_id: (question_id, snippet)}`` from each response's best matching answer."""
+    if not terms or not response_ids:
+        return {}
+    found = {}
+    if is_indexed():
+        placeholders = ', '.join(['%s'] * len(response_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT response_id, question_id, snippet({TABLE}, 0, char(2), char(3), '…', %s) FROM {TABLE} "
+                f'WHERE {TABLE} MATCH %s AND response_id IN ({placeholders}) ORDER BY bm25({TABLE}, 1.0, 0.0)',
+                [SNIPPET_TOKENS, _match_expression(form.pk, terms), *response_ids],
+            )
+            for response_id, question_id, snippet in cursor.fetchall():
+                found.setdefault(response_id, (question_id, _marked(snippet)))
+        return found
+
+    for response_id, question_id, text in _matching_answers(form, terms).filter(
+        response_id__in=response_ids,
+    ).order_by('question__order', 'question_id').values_list('response_id', 'question_id', 'text_answer'):
+        found.setdefault(response_id, (question_id, _marked(_scanned_snippet(text, terms))))
+    return found
@@ -1,5 +1,12 @@
+from django.db import transaction
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Form, Section, Question, Choice, Response, Answer, FormPermission, FormArchive
+from .models import Form, Section, Question, Choice, Response, Answer, FormPermission, FormArchive, ExportJob
+from .analytics import TREND_GRANULARITIES, form_questions
+from .exports import COMPRESSIONS, EXPORT_FORMATS
+from .filters import OPERATORS as FILTER_OPERATORS, clean_predicate_value
+from .spreadsheet import SORT_FIELDS as SPREADSHEET_SORT_FIELDS
+from .rollups import refresh_question_rollups, refresh_question_types
 
 
 class ChoiceSerializer(serializers.ModelSerializer):
@@ -10,6 +17,11 @@ class ChoiceSerializer(serializers.ModelSerializer):
         fields = ['id', 'text', 'order']
 
 
+def _media_url(name, request):
+    url = Question._meta.get_field('media_file').storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
 class QuestionSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
     choices = ChoiceSerializer(many=True, required=False, default=[])
@@ -22,13 +34,38 @@ class QuestionSerializer(serializers.ModelSerializer):
 
     def get_media_url(self, obj):
         if obj.media_file:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.media_file.url)
-            return obj.media_file.url
+            return _media_url(obj.media_file.name, self.context.get('request'))
         return None
 
 
+class SectionListSerializer(serializers.ListSerializer):
+    """Renders a form's sections from its denormalized ``Form.structure`` document."""
+
+    def get_attribute(self, instance):
+        if instance.structure is None:
+            return instance.build_structure()
+        return instance.structure
+
+    def to_representation(self, data):
+        request = self.context.get('request')
+        return [
+            {**section, 'questions': [
+                {
+                    'id': question['id'],
+                    'text': question['text'],
+                    'question_type': question['question_type'],
+                    'required': question['required'],
+                    'order': question['order'],
+                    'choices': question['choices'],
+                    'media_file': question['media_file'],
+                    'media_url': _media_url(question['media_file'], request) if question['media_file'] else None,
+                }
+                for question in section['questions']
+            ]}
+            for section in data
+        ]
+
+
 class SectionSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
     questions = QuestionSerializer(many=True, required=False, default=[])
@@ -36,6 +73,146 @@ class SectionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Section
         fields = ['id', 'title', 'description', 'order', 'questions']
+        list_serializer_class = SectionListSerializer
+
+
+class SectionFieldsSerializer(serializers.ModelSerializer):
+    """Own fields of a section, without children (used by form operations)."""
+
+    class Meta:
+        model = Section
+        fields = ['title', 'description', 'order']
+
+
+class QuestionFieldsSerializer(serializers.ModelSerializer):
+    """Own fields of a question, without children (used by form operations)."""
+    media_file = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    class Meta:
+        model = Question
+        fields = ['text', 'question_type', 'required', 'order', 'media_file']
+
+
+class ChoiceFieldsSerializer(serializers.ModelSerializer):
+    """Own fields of a choice (used by form operations)."""
+
+    class Meta:
+        model = Choice
+        fields = ['text', 'order']
+
+
+class FormOperationsSerializer(serializers.Serializer):
+    """Envelope of ``FormViewSet.operations``: the form version the ops apply to and the ops."""
+    version = serializers.DateTimeField()
+    ops = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=1000)
+
+
+class TrendQuerySerializer(serializers.Serializer):
+    """Query parameters of ``FormViewSet.trends``; naive dates and times are UTC."""
+    granularity = serializers.ChoiceField(choices=list(TREND_GRANULARITIES), default='day')
+    start = serializers.DateTimeField(required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+    end = serializers.DateTimeField(required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+
+
+class AnswerPredicateSerializer(serializers.Serializer):
+    """One ``{question, op, value}`` predicate; ``context['questions']`` maps ids to structure dicts."""
+    question = serializers.IntegerField()
+    op = serializers.ChoiceField(choices=list(FILTER_OPERATORS))
+    value = serializers.JSONField()
+
+    def validate(self, attrs):
+        question = self.context['questions'].get(attrs['question'])
+        if question is None:
+            raise serializers.ValidationError({'question': ['Not a question of this form.']})
+        if question['question_type'] not in FILTER_OPERATORS[attrs['op']]:
+            raise serializers.ValidationError(
+                {'op': [f'"{attrs["op"]}" does not apply to {question["question_type"]} questions.']}
+            )
+        try:
+            attrs['value'] = clean_predicate_value(question, attrs['op'], attrs['value'])
+        except ValueError as exc:
+            raise serializers.ValidationError({'value': [str(exc)]})
+        return attrs
+
+
+class ResponseFilterSerializer(serializers.Serializer):
+    """Query parameters narrowing a form's responses (see ``filters.py``); ``context['form']`` is required."""
+    filter = serializers.JSONField(binary=True, required=False, source='predicates')
+    start = serializers.DateTimeField(required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+    end = serializers.DateTimeField(required=False, input_formats=['iso-8601', '%Y-%m-%d'])
+
+    def form_questions(self):
+        """The form's questions from its structure, keyed by id."""
+        if not hasattr(self, '_questions'):
+            self._questions = {question['id']: question for question in form_questions(self.context['form'])}
+        return self._questions
+
+    def validate_filter(self, value):
+        if not isinstance(value, list):
+            raise serializers.ValidationError('Expected a list of predicates.')
+        predicates = AnswerPredicateSerializer(data=value, many=True, context={'questions': self.form_questions()})
+        predicates.is_valid(raise_exception=True)
+        return predicates.validated_data
+
+
+class ExportQuerySerializer(ResponseFilterSerializer):
+    """Query parameters of ``FormViewSet.export``; the response filter applies too."""
+    type = serializers.ChoiceField(choices=list(EXPORT_FORMATS), default='csv')
+    compression = serializers.ChoiceField(choices=list(COMPRESSIONS), required=False)
+    # Delta export high-water mark, a response id (see ``deltas``); blank exports from the beginning
+    since = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_type(self, value):
+        if not EXPORT_FORMATS[value].available:
+            raise serializers.ValidationError(f'The {value} export needs the optional pyarrow package.')
+        return value
+
+    def validate_compression(self, value):
+        if not COMPRESSIONS[value].available:
+            raise serializers.ValidationError(f'{value} compression needs the optional zstandard package.')
+        return value
+
+    def validate_since(self, value):
+        if not value:
+            return None
+        if not value.isdigit():
+            raise serializers.ValidationError('Invalid cursor.')
+        return int(value)
+
+
+class MediaExportQuerySerializer(ResponseFilterSerializer):
+    """Query parameters of ``FormViewSet.export_media``; the response filter applies too."""
+    include_csv = serializers.BooleanField(default=False)
+
+
+class DeletionLogQuerySerializer(serializers.Serializer):
+    """Query parameters of ``FormViewSet.deletions``."""
+    since = serializers.IntegerField(min_value=0, default=0)
+    page_size = serializers.IntegerField(min_value=1, max_value=10000, default=1000)
+
+
+class SpreadsheetQuerySerializer(ResponseFilterSerializer):
+    """Query parameters of ``FormViewSet.spreadsheet``; the response filter applies too."""
+    columns = serializers.CharField(required=False)
+    sort = serializers.CharField(default='submitted_at')
+    direction = serializers.ChoiceField(choices=['asc', 'desc'], default='desc')
+    offset = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=100)
+
+    def _question_id(self, value):
+        try:
+            question_id = int(value)
+        except ValueError:
+            question_id = None
+        if question_id not in self.form_questions():
+            raise serializers.ValidationError(f'"{value}" is not a question of this form.')
+        return question_id
+
+    def validate_columns(self, value):
+        return [self._question_id(part.strip()) for part in value.split(',') if part.strip()]
+
+    def validate_sort(self, value):
+        return value if value in SPREADSHEET_SORT_FIELDS else self._question_id(value)
 
 
 from django.contrib.auth import get_user_model
@@ -183,13 +360,17 @@ class FormDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at', 'share_id', 'qr_code']
 
     # ------------------------------------------------------------------ create
+    @transaction.atomic
     def create(self, validated_data):
         sections_data = validated_data.pop('sections', [])
         form = Form.objects.create(**validated_data)
-        self._create_sections(form, sections_data)
+        self._sync_sections(form, sections_data, existing=False)
+        form.refresh_structure()
         return form
 
     # ------------------------------------------------------------------ update
+    # Atomic so readers never see the new updated_at (the cache version) with the old tree
+    @transaction.atomic
     def update(self, instance, validated_data):
         sections_data = validated_data.pop('sections', None)
         instance.title = validated_data.get('title', instance.title)
@@ -198,168 +379,161 @@ class FormDetailSerializer(serializers.ModelSerializer):
         instance.save()
 
         if sections_data is None:
+            if instance.structure is None:
+                instance.refresh_structure()
             return instance
 
-        # Diff-based update: keep existing sections/questions, create new, delete removed
-        incoming_section_ids = {s.get('id') for s in sections_data if s.get('id')}
-        existing_sections = {s.id: s for s in instance.sections.all()}
+        self._sync_sections(instance, sections_data)
+        instance.refresh_structure()
+        return instance
 
-        # Delete sections that are no longer in the payload
-        for section_id in existing_sections:
-            if section_id not in incoming_section_ids:
-                existing_sections[section_id].delete()
+    # ---------------------------------------------------------------- helpers
+    SECTION_FIELDS = ['title', 'description', 'order']
+    QUESTION_FIELDS = ['section', 'text', 'question_type', 'required', 'order', 'media_file']
+    CHOICE_FIELDS = ['text', 'order']
+
+    @staticmethod
+    def _assign(instance, values):
+        """Set ``values`` on ``instance`` and return whether any of them changed."""
+        changed = False
+        for attr, value in values.items():
+            field = instance._meta.get_field(attr)
+            if field.is_relation:
+                current, incoming = getattr(instance, field.attname), value.pk
+            else:
+                current, incoming = getattr(instance, attr), value
+            if current != incoming:
+                setattr(instance, attr, value)
+                changed = True
+        return changed
+
+    @classmethod
+    def _sync_sections(cls, form, sections_data, existing=True):
+        """Make the form's tree match ``sections_data`` with a constant number of statements.
+
+        The diff is computed against one snapshot of the form's sections,
+        questions and choices: nodes whose id is in the snapshot are updated
+        (moving between parents if needed), nodes without a known id are
+        created, and snapshot nodes missing from the payload are deleted. Only
+        rows that actually changed are written.
+
+        Choices are matched within their question only, since answers keep
+        pointing at a choice: a choice id sent under another question becomes a
+        new choice there, and the original is deleted with its selections.
+        """
+        if existing:
+            sections = {s.id: s for s in Section.objects.filter(form=form)}
+            questions = {q.id: q for q in Question.objects.filter(section__form=form)}
+            choices = {c.id: c for c in Choice.objects.filter(question__section__form=form)}
+        else:
+            sections, questions, choices = {}, {}, {}
+        choices_by_question = {}
+        for choice in choices.values():
+            choices_by_question.setdefault(choice.question_id, {})[choice.id] = choice
+
+        new_sections, changed_sections, kept_sections = [], [], set()
+        new_questions, changed_questions, kept_questions = [], [], set()
+        retyped_questions = set()
+        new_choices, changed_choices, kept_choices = [], [], set()
 
         for s_data in sections_data:
+            s_data = dict(s_data)
             questions_data = s_data.pop('questions', [])
-            section_id = s_data.pop('id', None)
-
-            if section_id and section_id in existing_sections:
-                # Update existing section
-                section = existing_sections[section_id]
-                for attr, val in s_data.items():
-                    setattr(section, attr, val)
-                section.save()
+            section = sections.get(s_data.pop('id', None))
+            if section is None or section.id in kept_sections:
+                section = Section(form=form, **s_data)
+                new_sections.append(section)
             else:
-                # Create new section
-                section = Section.objects.create(form=instance, **s_data)
-
-            # Handle questions within this section
-            incoming_q_ids = {q.get('id') for q in questions_data if q.get('id')}
-            existing_questions = {q.id: q for q in section.questions.all()}
-
-            # Delete questions no longer present
-            for q_id in existing_questions:
-                if q_id not in incoming_q_ids:
-                    existing_questions[q_id].delete()
+                kept_sections.add(section.id)
+                if cls._assign(section, s_data):
+                    changed_sections.append(section)
 
             for q_data in questions_data:
+                q_data = dict(q_data)
                 choices_data = q_data.pop('choices', [])
-                q_id = q_data.pop('id', None)
-                media_file = q_data.pop('media_file', None) or ''
                 q_data.pop('media_url', None)
-
-                if q_id and q_id in existing_questions:
-                    # Update existing question
-                    question = existing_questions[q_id]
-                    question.media_file = media_file
-                    for attr, val in q_data.items():
-                        setattr(question, attr, val)
-                    question.save()
+                q_data['media_file'] = q_data.pop('media_file', None) or ''
+                question = questions.get(q_data.pop('id', None))
+                if question is None or question.id in kept_questions:
+                    question = Question(section=section, **q_data)
+                    new_questions.append(question)
                 else:
-                    # Create new question
-                    question = Question.objects.create(section=section, media_file=media_file, **q_data)
-
-                # Handle choices
-                incoming_c_ids = {c.get('id') for c in choices_data if c.get('id')}
-                existing_choices = {c.id: c for c in question.choices.all()}
-
-                for c_id in existing_choices:
-                    if c_id not in incoming_c_ids:
-                        existing_choices[c_id].delete()
-
+                    kept_questions.add(question.id)
+                    question_type = question.question_type
+                    if cls._assign(question, {'section': section, **q_data}):
+                        changed_questions.append(question)
+                        if question.question_type != question_type:
+                            retyped_questions.add(question.id)
+
+                question_choices = choices_by_question.get(question.id, {}) if question.id else {}
                 for c_data in choices_data:
-                    c_id = c_data.pop('id', None)
-                    if c_id and c_id in existing_choices:
-                        choice = existing_choices[c_id]
-                        for attr, val in c_data.items():
-                            setattr(choice, attr, val)
-                        choice.save()
+                    c_data = dict(c_data)
+                    choice = question_choices.get(c_data.pop('id', None))
+                    if choice is None or choice.id in kept_choices:
+                        new_choices.append(Choice(question=question, **c_data))
                     else:
-                        Choice.objects.create(question=question, **c_data)
-
-        return instance
-
-    # ---------------------------------------------------------------- helpers
-    @staticmethod
-    def _create_sections(form, sections_data):
-        for s_data in sections_data:
-            questions_data = s_data.pop('questions', [])
-            s_data.pop('id', None)
-            section = Section.objects.create(form=form, **s_data)
-
-            question_objects = []
-            question_choices_map = []
-
-            for q_data in questions_data:
-                choices_data = q_data.pop('choices', [])
-                q_data.pop('id', None)
-                media_file = q_data.pop('media_file', None) or ''
-                q_data.pop('media_url', None)
-                q = Question(section=section, media_file=media_file, **q_data)
-                question_objects.append(q)
-                question_choices_map.append(choices_data)
-
-            created_questions = Question.objects.bulk_create(question_objects)
-
-            all_choices = []
-            for question, choices_data in zip(created_questions, question_choices_map):
-                for c_data in choices_data:
-                    c_data.pop('id', None)
-                    all_choices.append(Choice(question=question, **c_data))
-
-            if all_choices:
-                Choice.objects.bulk_create(all_choices)
+                        kept_choices.add(choice.id)
+                        if cls._assign(choice, c_data):
+                            changed_choices.append(choice)
+
+        # Parents first so children pick up freshly assigned primary keys
+        Section.objects.bulk_create(new_sections)
+        Section.objects.bulk_update(changed_sections, cls.SECTION_FIELDS)
+        Question.objects.bulk_create(new_questions)
+        Question.objects.bulk_update(changed_questions, cls.QUESTION_FIELDS)
+        Choice.objects.bulk_create(new_choices)
+        Choice.objects.bulk_update(changed_choices, cls.CHOICE_FIELDS)
+
+        # Delete after moves so re-parented nodes are not cascaded away
+        for model, snapshot, kept in (
+            (Choice, choices, kept_choices),
+            (Question, questions, kept_questions),
+            (Section, sections, kept_sections),
+        ):
+            removed = snapshot.keys() - kept
+            if removed:
+                model.objects.filter(id__in=removed).delete()
+
+        # Answers that only selected deleted choices are now empty
+        removed_choices = choices.keys() - kept_choices
+        if removed_choices:
+            refresh_question_rollups({choices[pk].question_id for pk in removed_choices})
+        # Answers given under the old type need their numeric value and sketches redone
+        if retyped_questions:
+            refresh_question_types(retyped_questions)
 
 
 class AnswerSerializer(serializers.ModelSerializer):
-    question_id = serializers.PrimaryKeyRelatedField(
-        queryset=Question.objects.all(), source='question', write_only=True
-    )
-    question = serializers.PrimaryKeyRelatedField(read_only=True)
+    """Read-only answer representation; submissions are validated by ``FormSchema``."""
 
     class Meta:
         model = Answer
-        fields = ['id', 'question_id', 'question', 'text_answer', 'file_answer', 'selected_choices']
-
-    def validate(self, data):
-        question = data.get('question')
-        text_answer = data.get('text_answer')
-
-        if question and text_answer is not None and text_answer != '':
-            # Normalise whitespace for all text answers first
-            text_answer = text_answer.strip()
-
-            if question.question_type == 'number':
-                try:
-                    float_val = float(text_answer)
-                    if float_val != int(float_val):
-                        raise serializers.ValidationError(
-                            {'text_answer': 'A whole number is required for this question.'}
-                        )
-                    # Normalise: remove leading zeros, store canonical int string
-                    text_answer = str(int(float_val))
-                except (ValueError, TypeError):
-                    raise serializers.ValidationError(
-                        {'text_answer': 'A valid integer is required for this question.'}
-                    )
-            elif question.question_type == 'float':
-                try:
-                    float_val = float(text_answer)
-                    # Normalise: remove leading/trailing zeros artefacts
-                    text_answer = str(float_val)
-                except (ValueError, TypeError):
-                    raise serializers.ValidationError(
-                        {'text_answer': 'A valid number is required for this question.'}
-                    )
-
-            data['text_answer'] = text_answer
-
-        return data
+        fields = ['id', 'question', 'text_answer', 'file_answer', 'selected_choices']
+        read_only_fields = fields
 
 
 class ResponseSerializer(serializers.ModelSerializer):
-    answers = AnswerSerializer(many=True)
+    answers = AnswerSerializer(many=True, read_only=True)
 
     class Meta:
         model = Response
         fields = ['id', 'form', 'created_at', 'answers']
+        read_only_fields = ['form']
 
-    def create(self, validated_data):
-        answers_data = validated_data.pop('answers', [])
-        response = Response.objects.create(**validated_data)
-        for answer_data in answers_data:
-            selected_choices = answer_data.pop('selected_choices', [])
-            answer = Answer.objects.create(response=response, **answer_data)
-            answer.selected_choices.set(selected_choices)
-        return response
 
+class ExportJobSerializer(serializers.ModelSerializer):
+    """Status of a background export job; ``download_url`` is set once it is done."""
+    type = serializers.CharField(source='format', read_only=True)
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = ['id', 'type', 'compression', 'status', 'progress', 'total', 'error', 'created_at', 'finished_at', 'download_url']
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        if obj.status != 'done':
+            return None
+        url = reverse('form-export-job-download', args=[obj.form_id, obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
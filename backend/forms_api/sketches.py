@@ -0,0 +1,442 @@
+"""
+Bounded-memory answer summaries behind ``FormViewSet.analytics``.
+
+Each ``short_text``/``long_text`` question keeps a Space-Saving sketch
+(Metwally et al., 2005) of its answers in ``TextAnswerSketch``: at most
+``TEXT_SKETCH_CAPACITY`` counters over normalized text (case-folded, whitespace
+collapsed, cut to ``TEXT_SKETCH_MAX_LENGTH`` characters). A tracked answer's
+``count`` overestimates its true frequency by at most its ``error``, and no
+untracked answer was given more than ``bound`` times. Deleting a tracked answer
+lowers its counter, so the sketch first raises a persisted ``floor`` to the old
+bound: ``bound`` never drops below it and newcomers inherit it as their error.
+Both guarantees therefore survive deletes, at the price of a looser bound until
+the sketch is rebuilt.
+
+Each ``number``/``float`` question keeps one ``QuantileSketch`` per UTC day in
+``NumericAnswerSketch``. Its buckets are fixed, so daily sketches merge into
+any date range by adding counts, and quantiles are accurate to within
+``NUMERIC_SKETCH_RELATIVE_ACCURACY``.
+
+A submission does not rewrite a text sketch's counters. Its text answers are
+appended to ``TextAnswerDelta`` (one row per distinct answer and question), and
+the pending rows are folded into the sketches in one locked pass every
+``TEXT_SKETCH_MERGE_EVERY`` rows, before answers are subtracted and before a
+rebuild. Reads fold the rows still pending in memory. Numeric sketches are
+updated in the submission transaction with their rows locked. Both are
+decremented for deleted responses. Builder edits that change a question's type
+re-derive its ``numeric_answer`` column and sketches in the same transaction
+(``rollups.refresh_question_types``). ``manage.py rebuild_sketches`` recomputes
+everything from the stored answers, e.g. after the accuracy setting was changed
+or a type was changed in the Django admin.
+"""
+import math
+import operator
+from collections import Counter, defaultdict
+from datetime import timezone as dt_timezone
+from functools import reduce
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+from .models import Answer, NumericAnswerSketch, Question, TextAnswerDelta, TextAnswerSketch
+
+TEXT_TYPES = ('short_text', 'long_text')
+NUMERIC_TYPES = ('number', 'float')
+HAS_TEXT = Q(text_answer__isnull=False) & ~Q(text_answer='')
+TEXT_DELTA_DELETE_BATCH_SIZE = 500
+
+
+def normalize_text(text):
+    return ' '.join(str(text).split()).casefold()[:settings.TEXT_SKETCH_MAX_LENGTH]
+
+
+class SpaceSaving:
+    """Space-Saving top-k summary; ``counters`` maps a key to ``[text, count, error]``.
+
+    ``floor`` is the bound in force before the latest deletes; see the module docstring.
+    """
+
+    def __init__(self, capacity, total=0, counters=(), floor=0):
+        self.capacity = capacity
+        self.total = total
+        self.counters = {key: [text, count, error] for key, text, count, error in counters}
+        self.floor = floor
+
+    def add(self, text, weight=1):
+        key = normalize_text(text)
+        if not key:
+            return
+        self.total += weight
+        entry = self.counters.get(key)
+        if entry is not None:
+            entry[1] += weight
+        else:
+            # The newcomer may already have been given up to ``bound`` times; that is its error
+            floor = self.bound
+            if len(self.counters) >= self.capacity:
+                # Replace the smallest counter
+                del self.counters[min(self.counters, key=lambda k: self.counters[k][1])]
+            self.counters[key] = [text[:settings.TEXT_SKETCH_MAX_LENGTH], floor + weight, floor]
+
+    def remove(self, text):
+        key = normalize_text(text)
+        if not key:
+            return
+        self.total = max(self.total - 1, 0)
+        entry = self.counters.get(key)
+        if entry is not None:
+            # Untracked answers may be as frequent as the current bound, however low this counter goes
+            self.floor = self.bound
+            entry[1] -= 1
+            entry[2] = min(entry[2], entry[1])
+            if entry[1] <= 0:
+                del self.counters[key]
+
+    @property
+    def bound(self):
+        """Upper bound on the count of any answer that is not tracked."""
+        if len(self.counters) < self.capacity:
+            return self.floor
+        return max(self.floor, min(count for _, count, _ in self.counters.values()))
+
+    def top(self, n):
+        ranked = sorted(self.counters.values(), key=lambda entry: (-entry[1], entry[2], entry[0]))
+        return [{'text': text, 'count': count, 'error': error} for text, count, error in ranked[:n]]
+
+    def dump(self):
+        return [[key, text, count, error] for key, (text, count, error) in self.counters.items()]
+
+
+def _load(sketch):
+    return SpaceSaving(settings.TEXT_SKETCH_CAPACITY, sketch.total, sketch.counters, sketch.floor)
+
+
+def _locked_rows(model, key_fields, keys):
+    """Return the ``model`` rows for ``keys`` (tuples of ``key_fields``) locked for update, creating missing ones."""
+    def select(keys):
+        condition = reduce(operator.or_, (Q(**dict(zip(key_fields, key))) for key in keys))
+        return list(model.objects.select_for_update().filter(condition))
+
+    rows = select(keys)
+    found = {tuple(getattr(row, field) for field in key_fields) for row in rows}
+    missing = [key for key in keys if key not in found]
+    if missing:
+        model.objects.bulk_create([model(**dict(zip(key_fields, key))) for key in missing], ignore_conflicts=True)
+        rows += select(missing)
+    return rows
+
+
+def _add_texts(summary, counts):
+    """Add ``counts`` (``[text, weight]`` pairs) heaviest first, so a batch evicts as few counters as possible."""
+    for text, weight in sorted(counts, key=lambda item: -item[1]):
+        summary.add(text, weight)
+
+
+def _pending_texts(question_ids):
+    """``(delta ids, {question_id: [[text, weight], ...]})`` of the deltas of ``question_ids`` not yet merged."""
+    ids = []
+    texts = defaultdict(dict)  # question id -> normalized key -> [first text, weight]
+    for pk, question_id, text, weight in TextAnswerDelta.objects.filter(
+        question_id__in=question_ids,
+    ).values_list('id', 'question_id', 'text', 'weight').iterator():
+        ids.append(pk)
+        texts[question_id].setdefault(normalize_text(text), [text, 0])[1] += weight
+    return ids, {qid: list(counts.values()) for qid, counts in texts.items()}
+
+
+def _update_text_sketches(texts_by_question, apply):
+    """Lock the sketches of ``texts_by_question``'s keys, merge their pending deltas, run ``apply(summary, texts)`` and save."""
+    if not texts_by_question:
+        return
+    sketches = _locked_rows(TextAnswerSketch, ('question_id',), [(qid,) for qid in texts_by_question])
+    # Read only once the sketches are locked, so concurrent merges cannot both apply a delta
+    delta_ids, pending = _pending_texts(list(texts_by_question))
+    for sketch in sketches:
+        summary = _load(sketch)
+        _add_texts(summary, pending.get(sketch.question_id, ()))
+        apply(summary, texts_by_question[sketch.question_id])
+        sketch.total, sketch.counters, sketch.floor = summary.total, summary.dump(), summary.floor
+    TextAnswerSketch.objects.bulk_update(sketches, ['total', 'counters', 'floor'])
+    # By id: rows committed after the read above were not applied and must stay pending
+    for start in range(0, len(delta_ids), TEXT_DELTA_DELETE_BATCH_SIZE):
+        TextAnswerDelta.objects.filter(id__in=delta_ids[start:start + TEXT_DELTA_DELETE_BATCH_SIZE]).delete()
+
+
+def merge_text_deltas(question_ids=None):
+    """Fold the pending text answers of ``question_ids`` (default: every question with any) into their sketches."""
+    pending = TextAnswerDelta.objects.all()
+    if question_ids is not None:
+        pending = pending.filter(question_id__in=question_ids)
+    question_ids = set(pending.values_list('question_id', flat=True).distinct())
+    _update_text_sketches(dict.fromkeys(question_ids, ()), lambda summary, texts: None)
+
+
+def record_text_answers(entries):
+    """Append the text answers of freshly inserted ``(response, answers_data)`` pairs as pending deltas."""
+    texts = defaultdict(dict)  # question id -> normalized key -> [first text, weight]
+    for _, answers in entries:
+        for answer in answers:
+            text = answer['text_answer']
+            if answer.get('question_type') in TEXT_TYPES and text:
+                texts[answer['question_id']].setdefault(normalize_text(text), [text, 0])[1] += 1
+
+    deltas = TextAnswerDelta.objects.bulk_create([
+        TextAnswerDelta(question_id=question_id, text=text, weight=weight)
+        for question_id, counts in texts.items() for text, weight in counts.values()
+    ])
+    # Ids double as a row counter, so no COUNT(*) is needed; a large batch (a spool flush) merges at once.
+    # Backends that return no ids merge every batch.
+    every = settings.TEXT_SKETCH_MERGE_EVERY
+    if len(deltas) >= every or any(delta.pk is None or delta.pk % every == 0 for delta in deltas):
+        merge_text_deltas()
+
+
+def forget_text_answers(answers):
+    """Subtract ``answers`` (a queryset of answers about to be deleted) from the sketches."""
+    texts = defaultdict(list)
+    for question_id, text in answers.filter(
+        HAS_TEXT, question__question_type__in=TEXT_TYPES,
+    ).values_list('question_id', 'text_answer').iterator():
+        texts[question_id].append(text)
+
+    def apply(summary, values):
+        for text in values:
+            summary.remove(text)
+
+    _update_text_sketches(texts, apply)
+
+
+def text_sketches(question_ids):
+    """``{question_id: SpaceSaving}`` for the given questions (empty if never answered), pending deltas included."""
+    stored = {sketch.question_id: _load(sketch) for sketch in TextAnswerSketch.objects.filter(question_id__in=question_ids)}
+    summaries = {qid: stored.get(qid) or SpaceSaving(settings.TEXT_SKETCH_CAPACITY) for qid in question_ids}
+    for question_id, counts in _pending_texts(question_ids)[1].items():
+        _add_texts(summaries[question_id], counts)
+    return summaries
+
+
+def summarize_text_answers(question_ids, answers):
+    """``{question_id: SpaceSaving}`` built from ``answers``; the database collapses exact duplicates."""
+    summaries = {qid: SpaceSaving(settings.TEXT_SKETCH_CAPACITY) for qid in question_ids}
+    for question_id, text, weight in answers.filter(
+        HAS_TEXT, question_id__in=question_ids,
+    ).values('question_id', 'text_answer').annotate(n=Count('id')).order_by('-n').values_list(
+        'question_id', 'text_answer', 'n',
+    ).iterator():
+        summaries[question_id].add(text, weight)
+    return summaries
+
+
+def _rebuild_text_sketches(questions):
+    """Recompute the text sketches of ``questions`` (a question queryset) from their stored answers."""
+    question_ids = list(questions.filter(question_type__in=TEXT_TYPES).values_list('id', flat=True))
+    TextAnswerDelta.objects.filter(question__in=questions).delete()
+    sketches = [
+        TextAnswerSketch(question_id=question_id, total=summary.total, counters=summary.dump(), floor=summary.floor)
+        for question_id, summary in summarize_text_answers(question_ids, Answer.objects.all()).items()
+    ]
+    TextAnswerSketch.objects.filter(question__in=questions).exclude(question_id__in=question_ids).delete()
+    TextAnswerSketch.objects.bulk_create(
+        sketches, update_conflicts=True, unique_fields=['question'], update_fields=['total', 'counters', 'floor'],
+    )
+    return len(sketches)
+
+
+def rebuild_text_sketches(form):
+    """Recompute the text sketches of ``form`` from its stored answers."""
+    return _rebuild_text_sketches(Question.objects.filter(section__form=form))
+
+
+class QuantileSketch:
+    """Log-bucketed quantile sketch (DDSketch, Masson et al., 2019).
+
+    Non-zero values are counted in buckets whose bounds grow by a factor of
+    ``gamma = (1 + alpha) / (1 - alpha)``, which returns every quantile with a
+    relative error of at most ``alpha``. Sketches with the same ``alpha`` share
+    their buckets, so they merge by adding counts and values can be removed
+    exactly.
+    """
+
+    MIN_MAGNITUDE = 1e-9  # smaller magnitudes are counted as zero
+
+    def __init__(self, alpha, count=0, total=0.0, zero_count=0, positive=None, negative=None):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.count = count
+        self.total = total
+        self.zero_count = zero_count
+        self.positive = Counter({int(index): n for index, n in (positive or {}).items()})
+        self.negative = Counter({int(index): n for index, n in (negative or {}).items()})
+
+    def _index(self, magnitude):
+        return math.ceil(math.log(magnitude) / self.log_gamma)
+
+    def _value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value, weight=1):
+        self.count += weight
+        self.total += value * weight
+        if abs(value) < self.MIN_MAGNITUDE:
+            self.zero_count += weight
+            return
+        store = self.positive if value > 0 else self.negative
+        index = self._index(abs(value))
+        store[index] += weight
+        if store[index] <= 0:
+            del store[index]
+
+    def remove(self, value):
+        self.add(value, -1)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.zero_count += other.zero_count
+        self.positive.update(other.positive)
+        self.negative.update(other.negative)
+
+    def buckets(self):
+        """Yield ``(representative value, count)`` in ascending order."""
+        for index in sorted(self.negative, reverse=True):
+            yield -self._value(index), self.negative[index]
+        if self.zero_count:
+            yield 0.0, self.zero_count
+        for index in sorted(self.positive):
+            yield self._value(index), self.positive[index]
+
+    def quantile(self, q):
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        value = None
+        for value, n in self.buckets():
+            seen += n
+            if seen > rank:
+                break
+        return value
+
+    def histogram(self, low, high, bins):
+        """Counts in ``bins`` equal-width bins spanning ``[low, high]``."""
+        if self.count <= 0 or low is None or high is None:
+            return []
+        width = (high - low) / bins if high > low else 0
+        counts = [0] * (bins if width else 1)
+        for value, n in self.buckets():
+            position = int((value - low) / width) if width else 0
+            counts[min(max(position, 0), len(counts) - 1)] += n
+        return [
+            {'start': low + i * width, 'end': low + (i + 1) * width if width else high, 'count': n}
+            for i, n in enumerate(counts)
+        ]
+
+    def to_fields(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'zero_count': self.zero_count,
+            'positive': {str(index): n for index, n in self.positive.items()},
+            'negative': {str(index): n for index, n in self.negative.items()},
+        }
+
+
+NUMERIC_SKETCH_FIELDS = ('count', 'total', 'zero_count', 'positive', 'negative')
+
+
+def _load_numeric(row):
+    return QuantileSketch(
+        settings.NUMERIC_SKETCH_RELATIVE_ACCURACY,
+        row.count, row.total, row.zero_count, row.positive, row.negative,
+    )
+
+
+def _update_numeric_sketches(values, apply):
+    """Lock the ``(question_id, day)`` sketches of ``values``, run ``apply(sketch, value)`` for each value and save."""
+    if not values:
+        return
+    rows = _locked_rows(NumericAnswerSketch, ('question_id', 'day'), list(values))
+    for row in rows:
+        sketch = _load_numeric(row)
+        for value in values[(row.question_id, row.day)]:
+            apply(sketch, value)
+        for field, value in sketch.to_fields().items():
+            setattr(row, field, value)
+    NumericAnswerSketch.objects.bulk_update(rows, NUMERIC_SKETCH_FIELDS)
+
+
+def _utc_day(created_at):
+    return created_at.astimezone(dt_timezone.utc).date()
+
+
+def record_numeric_answers(entries):
+    """Add the numeric answers of freshly inserted ``(response, answers_data)`` pairs."""
+    values = defaultdict(list)
+    for response, answers in entries:
+        for answer in answers:
+            if answer['numeric_answer'] is not None:
+                values[(answer['question_id'], _utc_day(response.created_at))].append(answer['numeric_answer'])
+    _update_numeric_sketches(values, QuantileSketch.add)
+
+
+def _iter_numeric_values(answers):
+    """Yield ``((question_id, day), value)`` for the numeric answers in ``answers``."""
+    for question_id, value, created_at in answers.filter(
+        numeric_answer__isnull=False, question__question_type__in=NUMERIC_TYPES,
+    ).values_list('question_id', 'numeric_answer', 'response__created_at').iterator():
+        yield (question_id, _utc_day(created_at)), value
+
+
+def forget_numeric_answers(answers):
+    """Subtract ``answers`` (a queryset of answers about to be deleted) from the sketches."""
+    values = defaultdict(list)
+    for key, value in _iter_numeric_values(answers):
+        values[key].append(value)
+    _update_numeric_sketches(values, QuantileSketch.remove)
+
+
+def numeric_sketches(question_ids, start=None, end=None):
+    """``{question_id: QuantileSketch}`` merged over the days in ``[start, end)``."""
+    merged = {qid: QuantileSketch(settings.NUMERIC_SKETCH_RELATIVE_ACCURACY) for qid in question_ids}
+    rows = NumericAnswerSketch.objects.filter(question_id__in=question_ids)
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    if end is not None:
+        rows = rows.filter(day__lt=end)
+    for row in rows:
+        merged[row.question_id].merge(_load_numeric(row))
+    return merged
+
+
+def summarize_numeric_answers(question_ids, answers):
+    """``{question_id: QuantileSketch}`` built from ``answers`` rather than the daily sketches."""
+    summaries = {qid: QuantileSketch(settings.NUMERIC_SKETCH_RELATIVE_ACCURACY) for qid in question_ids}
+    for (question_id, _), value in _iter_numeric_values(answers.filter(question_id__in=question_ids)):
+        summaries[question_id].add(value)
+    return summaries
+
+
+def _rebuild_numeric_sketches(questions):
+    """Recompute the daily numeric sketches of ``questions`` (a question queryset) from their stored answers."""
+    sketches = defaultdict(lambda: QuantileSketch(settings.NUMERIC_SKETCH_RELATIVE_ACCURACY))
+    for key, value in _iter_numeric_values(Answer.objects.filter(question__in=questions)):
+        sketches[key].add(value)
+    NumericAnswerSketch.objects.filter(question__in=questions).delete()
+    NumericAnswerSketch.objects.bulk_create([
+        NumericAnswerSketch(question_id=qid, day=day, **sketch.to_fields())
+        for (qid, day), sketch in sketches.items()
+    ])
+    return len({qid for qid, _ in sketches})
+
+
+def rebuild_numeric_sketches(form):
+    """Recompute the daily numeric sketches of ``form`` from its stored answers."""
+    return _rebuild_numeric_sketches(Question.objects.filter(section__form=form))
+
+
+def rebuild_question_sketches(question_ids):
+    """Recompute both kinds of sketch for ``question_ids``, e.g. after their type changed."""
+    questions = Question.objects.filter(id__in=question_ids)
+    _rebuild_text_sketches(questions)
+    _rebuild_numeric_sketches(questions)
@@ -0,0 +1,69 @@
+"""
+Pivoted response grid behind ``FormViewSet.spreadsheet``.
+
+Each row is ``[id, created_at, cell, cell, ...]`` with one cell per projected
+question, read like the compact layout (see ``compact.py``) but with selected
+choices resolved to their texts, joined like the CSV export. Rows are sorted
+in the database (by id, submission time or any question's answer) and only
+the ``[offset, offset + limit)`` window is read, so a virtualized grid never
+downloads rows or columns it is not showing.
+
+Number and float columns sort numerically, text columns case-insensitively,
+choice columns by their first selected choice, and unanswered cells sort first
+ascending and last descending.
+"""
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Lower
+
+from .analytics import CHOICE_TYPES, form_questions
+from .compact import compact_responses
+from .models import Answer
+from .sketches import NUMERIC_TYPES
+
+# Sort keys besides question ids -> Response field
+SORT_FIELDS = {'id': 'id', 'submitted_at': 'created_at'}
+
+
+def _sort_expression(question):
+    qid = question['id']
+    if question['question_type'] in CHOICE_TYPES:
+        first_choice = Answer.selected_choices.through.objects.filter(
+            answer__response_id=OuterRef('pk'), answer__question_id=qid,
+        ).order_by('choice__order', 'choice_id').values('choice__text')[:1]
+        return Lower(Subquery(first_choice))
+    answers = Answer.objects.filter(response_id=OuterRef('pk'), question_id=qid)
+    if question['question_type'] in NUMERIC_TYPES:
+        return Subquery(answers.values('numeric_answer')[:1])
+    if question['question_type'] == 'media':
+        return Subquery(answers.values('file_answer')[:1])
+    return Lower(Subquery(answers.values('text_answer')[:1]))
+
+
+def build_spreadsheet(form, responses, columns=None, sort='submitted_at', direction='desc',
+                      offset=0, limit=100, request=None):
+    """Window ``[offset, offset + limit)`` of ``responses`` pivoted over ``columns`` (question ids, default all)."""
+    questions = form_questions(form)
+    if sort in SORT_FIELDS:
+        key = F(SORT_FIELDS[sort])
+    else:
+        question = next(question for question in questions if question['id'] == sort)
+        responses = responses.annotate(sort_value=_sort_expression(question))
+        key = F('sort_value')
+    if direction == 'desc':
+        ordering = (key.desc(nulls_last=True), '-id')
+    else:
+        ordering = (key.asc(nulls_first=True), 'id')
+    rows = responses.order_by(*ordering).values_list('id', 'created_at')[offset:offset + limit]
+
+    question_ids, results = compact_responses(form, list(rows), request, columns, choice_texts=True)
+    by_id = {question['id']: question for question in questions}
+
+    return {
+        'offset': offset,
+        'limit': limit,
+        'columns': [
+            {'id': qid, 'text': by_id[qid]['text'], 'question_type': by_id[qid]['question_type']}
+            for qid in question_ids
+        ],
+        'rows': results,
+    }
@@ -0,0 +1,82 @@
+"""
+Submission engine behind ``FormViewSet.submit``.
+
+Answers are validated by the form's compiled schema (see ``schema.py``) and
+responses are persisted with a fixed number of inserts (responses, answers,
+answer↔choice rows) regardless of how many questions the form has or how many
+responses are written together. The analytics rollups (``rollups.py``) are
+updated in the same transaction.
+"""
+from django.db import transaction
+
+from .models import Answer, Choice, Response
+from .rollups import record_responses
+
+
+def _cache_related(instance, name, objects):
+    """Seed the prefetch cache of ``instance.<name>`` so reads don't hit the DB."""
+    queryset = getattr(instance, name).get_queryset()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault('_prefetched_objects_cache', {})[name] = queryset
+
+
+@transaction.atomic
+def bulk_create_responses(entries):
+    """Persist many responses in one transaction with bulk inserts.
+
+    ``entries`` is a list of ``(response, answers_data)`` pairs where
+    ``response`` is an unsaved ``Response`` and ``answers_data`` is the list
+    returned by ``FormSchema.validate``. Responses that carry an explicit
+    ``created_at`` keep it (``auto_now_add`` would otherwise stamp insert time).
+    The saved responses have ``answers`` and each answer's ``selected_choices``
+    cached, so serializing them with ``ResponseSerializer`` costs no extra queries.
+    """
+    responses = [response for response, _ in entries]
+    submitted_at = [response.created_at for response in responses]
+    Response.objects.bulk_create(responses)
+    backdated = []
+    for response, created_at in zip(responses, submitted_at):
+        if created_at is not None:
+            response.created_at = created_at
+            backdated.append(response)
+    if backdated:
+        Response.objects.bulk_update(backdated, ['created_at'])
+
+    answers = []
+    answers_data = []
+    for response, response_answers in entries:
+        for answer_data in response_answers:
+            answers.append(Answer(
+                response=response,
+                question_id=answer_data['question_id'],
+                text_answer=answer_data['text_answer'],
+                numeric_answer=answer_data['numeric_answer'],
+                file_answer=answer_data['file_answer'],
+            ))
+            answers_data.append(answer_data)
+    Answer.objects.bulk_create(answers)
+
+    through_model = Answer.selected_choices.through
+    through_rows = [
+        through_model(answer_id=answer.id, choice_id=choice_id)
+        for answer, answer_data in zip(answers, answers_data)
+        for choice_id in answer_data['choice_ids']
+    ]
+    if through_rows:
+        through_model.objects.bulk_create(through_rows)
+    record_responses(entries)
+
+    answers_by_response = {}
+    for answer, answer_data in zip(answers, answers_data):
+        selected = [Choice(id=choice_id, question_id=answer.question_id) for choice_id in answer_data['choice_ids']]
+        _cache_related(answer, 'selected_choices', selected)
+        answers_by_response.setdefault(answer.response_id, []).append(answer)
+    for response in responses:
+        _cache_related(response, 'answers', answers_by_response.get(response.id, []))
+    return responses
+
+
+def create_response(form, answers_data):
+    """Persist a single response and its answers using bulk inserts."""
+    return bulk_create_responses([(Response(form=form), answers_data)])[0]
@@ -1,13 +1,47 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.test import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APIClient
-from datetime import timedelta
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
 from pathlib import Path
+import csv
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
 import tempfile
+import time
+import uuid
+import zipfile
+from unittest import mock, skipUnless
 
-from .models import Choice, Form, FormArchive, FormPermission, Question, Section, User
+from .export_jobs import evict_artifacts, parse_range
+from .exports import COMPRESSIONS, EXPORT_FORMATS, iter_export, iter_parallel_export, shard_bounds
+from . import ingest
+from .form_ops import apply_form_operations
+from .ingest import flush_segments, get_spool, reset_spool
+from .models import (
+    Answer, Choice, ExportJob, Form, FormArchive, FormPermission, Question, QuestionRollup, Response, Section,
+    TextAnswerDelta, TextAnswerSketch, User,
+)
+from .schema import clear_schema_cache, get_form_schema, numeric_value
+from .sketches import (
+    SpaceSaving, merge_text_deltas, normalize_text, numeric_sketches, summarize_numeric_answers, text_sketches,
+)
+from .submissions import bulk_create_responses
 
 
 class UserSearchTests(TestCase):
@@ -86,6 +120,7 @@ class FormAccessTests(TestCase):
             description='A form owned by another user.',
             owner=self.owner,
         )
+        cache.clear()
 
     def test_admin_can_retrieve_non_owned_form(self):
         self.client.force_authenticate(user=self.admin)
@@ -140,7 +175,7 @@ class FormAccessTests(TestCase):
         self.assertEqual(self.form.title, 'Renamed Form')
         self.assertEqual(self.form.sections.count(), 1)
 
-    def test_share_lookup_prefetches_nested_form_data(self):
+    def _add_nested_sections(self):
         for section_index in range(2):
             section = Section.objects.create(
                 form=self.form,
@@ -161,13 +196,1668 @@ class FormAccessTests(TestCase):
                         order=choice_index,
                     )
 
-        with self.assertNumQueries(4):
-            response = self.client.get(
-                reverse('form-by-share-id', kwargs={'share_id': self.form.share_id})
+    def test_share_lookup_render_queries_each_nesting_level_once(self):
+        self._add_nested_sections()
+        url = reverse('form-by-share-id', kwargs={'share_id': self.form.share_id})
+
+        # Cold cache: version lookup, form row, then one prefetch per level
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['sections']), 2)
+        tables = Counter(
+            table for query in queries.captured_queries
+            for table in ('forms_api_form', 'forms_api_section', 'forms_api_question', 'forms_api_choice')
+            if f'FROM "{table}"' in query['sql']
+        )
+        self.assertEqual(tables, {
+            'forms_api_form': 2, 'forms_api_section': 1, 'forms_api_question': 1, 'forms_api_choice': 1,
+        })
+        self.assertEqual(len(queries), 5)
+
+    def test_share_lookup_serves_the_cached_payload_after_a_version_lookup(self):
+        self._add_nested_sections()
+        url = reverse('form-by-share-id', kwargs={'share_id': self.form.share_id})
+        response = self.client.get(url)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(url)
+
+        self.assertEqual(cached.content, response.content)
+
+    def test_share_lookup_revalidates_with_etag(self):
+        url = reverse('form-by-share-id', kwargs={'share_id': self.form.share_id})
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_share_lookup_revalidates_with_a_weakened_etag(self):
+        url = reverse('form-by-share-id', kwargs={'share_id': self.form.share_id})
+        etag = self.client.get(url)['ETag']
+
+        # Compressing proxies hand the client W/"..." in place of the strong tag
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"stale", W/{etag}')
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_share_lookup_reflects_form_updates(self):
+        url = reverse('form-by-share-id', kwargs={'share_id': self.form.share_id})
+        etag = self.client.get(url)['ETag']
+        self.client.force_authenticate(user=self.owner)
+
+        self.client.patch(reverse('form-detail', args=[self.form.id]), {'title': 'Renamed'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Renamed')
+
+    def test_share_lookup_returns_404_for_unknown_share_id(self):
+        response = self.client.get(reverse('form-by-share-id', kwargs={'share_id': 'not-a-uuid'}))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class FormStructureTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email='structure-owner@example.com',
+            password='password123',
+            name='Structure Owner',
+            role='user',
+        )
+        self.client.force_authenticate(user=self.owner)
+
+    def _create_form(self):
+        response = self.client.post(reverse('form-list'), {
+            'title': 'Structured',
+            'sections': [{
+                'title': 'Section',
+                'order': 0,
+                'questions': [{
+                    'text': 'Pick one',
+                    'question_type': 'multiple_choice',
+                    'order': 0,
+                    'choices': [{'text': 'A', 'order': 0}, {'text': 'B', 'order': 1}],
+                }],
+            }],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Form.objects.get(pk=response.data['id'])
+
+    def test_create_stores_structure_document(self):
+        form = self._create_form()
+
+        question = form.structure[0]['questions'][0]
+        self.assertEqual(question['text'], 'Pick one')
+        self.assertEqual([c['text'] for c in question['choices']], ['A', 'B'])
+
+    def test_retrieve_reads_single_form_row(self):
+        form = self._create_form()
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('form-detail', args=[form.id]))
+
+        self.assertEqual(response.status_code, 200)
+        question = response.data['sections'][0]['questions'][0]
+        self.assertEqual(question['media_file'], '')
+        self.assertIsNone(question['media_url'])
+
+    def test_update_rebuilds_structure_document(self):
+        form = self._create_form()
+        payload = self.client.get(reverse('form-detail', args=[form.id])).data
+        payload['sections'][0]['questions'][0]['choices'].pop()
+        payload['sections'][0]['questions'][0]['text'] = 'Pick again'
+
+        response = self.client.put(reverse('form-detail', args=[form.id]), payload, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        form.refresh_from_db()
+        question = form.structure[0]['questions'][0]
+        self.assertEqual(question['text'], 'Pick again')
+        self.assertEqual([c['text'] for c in question['choices']], ['A'])
+        self.assertEqual(response.data['sections'], payload['sections'])
+
+
+class FormBuilderUpdateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email='builder-owner@example.com',
+            password='password123',
+            name='Builder Owner',
+            role='user',
+        )
+        self.client.force_authenticate(user=self.owner)
+
+    def _payload(self, question_count):
+        return {
+            'title': 'Builder Form',
+            'sections': [
+                {
+                    'title': f'Section {section_index}',
+                    'order': section_index,
+                    'questions': [
+                        {
+                            'text': f'Question {index}',
+                            'question_type': 'multiple_select',
+                            'order': index,
+                            'choices': [{'text': 'Yes', 'order': 0}, {'text': 'No', 'order': 1}],
+                        }
+                        for index in range(question_count)
+                    ],
+                }
+                for section_index in range(2)
+            ],
+        }
+
+    def _save_and_edit(self, question_count):
+        created = self.client.post(reverse('form-list'), self._payload(question_count), format='json')
+        payload = created.data
+        for section in payload['sections']:
+            section['questions'].pop()
+            for question in section['questions']:
+                question['text'] += ' (edited)'
+                question['choices'].append({'text': 'Maybe', 'order': 2})
+            section['questions'].append({'text': 'New', 'question_type': 'short_text', 'order': 99})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(reverse('form-detail', args=[payload['id']]), payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), payload['id']
+
+    def test_update_statement_count_does_not_grow_with_form_size(self):
+        small_count, _ = self._save_and_edit(3)
+        large_count, form_id = self._save_and_edit(60)
+
+        self.assertEqual(small_count, large_count)
+        form = Form.objects.get(pk=form_id)
+        self.assertEqual(Question.objects.filter(section__form=form).count(), 2 * 60)
+        self.assertEqual(Choice.objects.filter(question__section__form=form).count(), 2 * 59 * 3)
+        self.assertTrue(Question.objects.filter(section__form=form, text='Question 0 (edited)').exists())
+
+    def test_question_moved_between_sections_keeps_its_answers(self):
+        created = self.client.post(reverse('form-list'), self._payload(1), format='json').data
+        question = Question.objects.get(pk=created['sections'][0]['questions'][0]['id'])
+        response = Response.objects.create(form_id=created['id'])
+        Answer.objects.create(response=response, question=question)
+
+        moved = created['sections'][0]['questions'].pop()
+        created['sections'][1]['questions'].append(moved)
+        self.client.put(reverse('form-detail', args=[created['id']]), created, format='json')
+
+        question.refresh_from_db()
+        self.assertEqual(question.section_id, created['sections'][1]['id'])
+        self.assertEqual(question.answers.count(), 1)
+
+
+class FormOperationsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email='ops-owner@example.com',
+            password='password123',
+            name='Ops Owner',
+            role='user',
+        )
+        self.client.force_authenticate(user=self.owner)
+        self.form = Form.objects.create(title='Ops Form', owner=self.owner)
+        self.section = Section.objects.create(form=self.form, title='Section')
+        self.questions = [
+            Question.objects.create(section=self.section, text=f'Question {index}', order=index)
+            for index in range(3)
+        ]
+        self.url = reverse('form-operations', args=[self.form.id])
+
+    def _version(self):
+        return self.client.get(reverse('form-detail', args=[self.form.id])).data['updated_at']
+
+    def test_operations_apply_atomically_and_return_new_version(self):
+        version = self._version()
+
+        response = self.client.post(self.url, {'version': version, 'ops': [
+            {'op': 'add', 'type': 'section', 'ref': 's2', 'data': {'title': 'Second', 'order': 1}},
+            {'op': 'add', 'type': 'question', 'ref': 'q', 'parent': 's2', 'data': {'text': 'Pick', 'question_type': 'multiple_choice'}},
+            {'op': 'add', 'type': 'choice', 'parent': 'q', 'data': {'text': 'A'}},
+            {'op': 'update', 'type': 'question', 'id': self.questions[0].id, 'data': {'text': 'Renamed'}},
+            {'op': 'move', 'type': 'question', 'id': self.questions[1].id, 'parent': 's2', 'order': 5},
+            {'op': 'delete', 'type': 'question', 'id': self.questions[2].id},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['version'], version)
+        new_section = Section.objects.get(pk=response.data['created']['s2'])
+        self.assertEqual(
+            set(new_section.questions.values_list('text', flat=True)),
+            {'Pick', 'Question 1'},
+        )
+        self.assertEqual(Question.objects.get(pk=self.questions[0].id).text, 'Renamed')
+        self.assertFalse(Question.objects.filter(pk=self.questions[2].id).exists())
+        self.form.refresh_from_db()
+        self.assertEqual([s['title'] for s in self.form.structure], ['Section', 'Second'])
+
+    def test_reorder_rewrites_order_in_one_statement(self):
+        ids = [question.id for question in reversed(self.questions)]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'version': self._version(), 'ops': [
+                {'op': 'reorder', 'type': 'question', 'ids': ids},
+            ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.section.questions.values_list('id', flat=True)), ids)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "forms_api_question"')]
+        self.assertEqual(len(updates), 1)
+
+    def test_stale_version_is_rejected(self):
+        version = self._version()
+        self.client.post(self.url, {'version': version, 'ops': [
+            {'op': 'update', 'type': 'section', 'id': self.section.id, 'data': {'title': 'First'}},
+        ]}, format='json')
+
+        response = self.client.post(self.url, {'version': version, 'ops': [
+            {'op': 'update', 'type': 'section', 'id': self.section.id, 'data': {'title': 'Second'}},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Section.objects.get(pk=self.section.id).title, 'First')
+
+    def test_choice_cannot_move_to_another_question(self):
+        first, second = self.questions[:2]
+        choice = Choice.objects.create(question=first, text='A')
+        response_row = Response.objects.create(form=self.form)
+        Answer.objects.create(response=response_row, question=first).selected_choices.add(choice)
+
+        response = self.client.post(self.url, {'version': self._version(), 'ops': [
+            {'op': 'move', 'type': 'choice', 'id': choice.id, 'parent': second.id},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.data['ops'][0])
+        self.assertEqual(Choice.objects.get(pk=choice.id).question_id, first.id)
+
+        moved = self.client.post(self.url, {'version': self._version(), 'ops': [
+            {'op': 'move', 'type': 'choice', 'id': choice.id, 'parent': first.id, 'order': 3},
+        ]}, format='json')
+        self.assertEqual(moved.status_code, 200)
+
+    def test_invalid_operation_rolls_back_earlier_ones(self):
+        other_section = Section.objects.create(form=Form.objects.create(title='Other'), title='Foreign')
+
+        response = self.client.post(self.url, {'version': self._version(), 'ops': [
+            {'op': 'update', 'type': 'section', 'id': self.section.id, 'data': {'title': 'Changed'}},
+            {'op': 'delete', 'type': 'section', 'id': other_section.id},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(1, response.data['ops'])
+        self.assertEqual(Section.objects.get(pk=self.section.id).title, 'Section')
+        self.assertTrue(Section.objects.filter(pk=other_section.id).exists())
+
+
+class FormSubmissionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email='submit-owner@example.com',
+            password='password123',
+            name='Submit Owner',
+            role='user',
+        )
+        self.form = Form.objects.create(title='Submission Form', owner=self.owner)
+        self.section = Section.objects.create(form=self.form, title='Section')
+        clear_schema_cache()
+
+    def _build_questions(self, count):
+        questions = []
+        for index in range(count):
+            question = Question.objects.create(
+                section=self.section,
+                text=f'Question {index}',
+                question_type='multiple_select' if index % 2 else 'number',
+                order=index,
             )
+            for choice_index in range(3):
+                Choice.objects.create(question=question, text=f'Choice {choice_index}', order=choice_index)
+            questions.append(question)
+        return questions
+
+    def _answers_for(self, questions):
+        answers = []
+        for question in questions:
+            if question.question_type == 'number':
+                answers.append({'question_id': question.id, 'text_answer': ' 007 '})
+            else:
+                answers.append({
+                    'question_id': question.id,
+                    'selected_choices': list(question.choices.values_list('id', flat=True)[:2]),
+                })
+        return answers
+
+    def test_submit_query_count_does_not_grow_with_answer_count(self):
+        questions = self._build_questions(40)
+        answers = self._answers_for(questions)
+        url = reverse('form-submit', args=[self.form.id])
+
+        # First submit compiles the schema (two queries) and creates the rollup
+        # and sketch rows (four queries per table); later ones reuse both
+        with self.assertNumQueries(28):
+            response = self.client.post(url, {'answers': answers}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        with self.assertNumQueries(12):
+            response = self.client.post(url, {'answers': answers}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['answers']), 40)
+        self.assertEqual(response.data['answers'][0]['text_answer'], '7')
+        self.assertEqual(len(response.data['answers'][1]['selected_choices']), 2)
+        self.assertEqual(Answer.objects.filter(response_id=response.data['id']).count(), 40)
+        self.assertEqual(Answer.objects.filter(response_id=response.data['id'], numeric_answer=7).count(), 20)
+        self.assertEqual(
+            Answer.selected_choices.through.objects.filter(answer__response_id=response.data['id']).count(),
+            40,
+        )
+
+    def test_submit_rejects_choice_from_another_question(self):
+        first, second = self._build_questions(2)
+        foreign_choice = first.choices.first()
+
+        response = self.client.post(
+            reverse('form-submit', args=[self.form.id]),
+            {'answers': [{'question_id': second.id, 'selected_choices': [foreign_choice.id]}]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('selected_choices', response.data['answers'][0])
+
+    def test_submit_rejects_question_from_another_form(self):
+        other_form = Form.objects.create(title='Other Form', owner=self.owner)
+        other_section = Section.objects.create(form=other_form, title='Other')
+        foreign_question = Question.objects.create(section=other_section, text='Foreign')
+
+        response = self.client.post(
+            reverse('form-submit', args=[self.form.id]),
+            {'answers': [{'question_id': foreign_question.id, 'text_answer': 'hi'}]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('question_id', response.data['answers'][0])
+
+
+    def test_submit_requires_the_answers_key(self):
+        url = reverse('form-submit', args=[self.form.id])
+
+        missing = self.client.post(url, {}, format='json')
+        empty_list = self.client.post(url, {'answers': []}, format='json')
+
+        self.assertEqual(missing.status_code, 400)
+        self.assertEqual(missing.data['answers'], ['This field is required.'])
+        self.assertEqual(empty_list.status_code, 201)
+
+    def test_submit_enforces_required_questions(self):
+        optional, required = self._build_questions(2)
+        required.required = True
+        required.save()
+        self.form.save()
+
+        response = self.client.post(
+            reverse('form-submit', args=[self.form.id]),
+            {'answers': [{'question_id': optional.id, 'text_answer': '3'}]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data['missing_required']), [required.id])
+
+    def test_submit_rejects_invalid_number(self):
+        question = self._build_questions(1)[0]
+
+        response = self.client.post(
+            reverse('form-submit', args=[self.form.id]),
+            {'answers': [{'question_id': question.id, 'text_answer': '2.5'}]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['answers'][0]['text_answer'][0],
+            'A whole number is required for this question.',
+        )
+
+    def test_schema_is_recompiled_when_form_is_saved(self):
+        question = self._build_questions(1)[0]
+        first = get_form_schema(self.form)
+        self.assertIs(get_form_schema(self.form), first)
+
+        new_question = Question.objects.create(section=self.section, text='Added later')
+        self.form.save()
+
+        second = get_form_schema(self.form)
+        self.assertIsNot(second, first)
+        self.assertEqual(set(second.questions), {question.id, new_question.id})
+
+
+class SubmissionSpoolTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.form = Form.objects.create(title='Spool Form')
+        section = Section.objects.create(form=self.form, title='Section')
+        self.question = Question.objects.create(section=section, text='Name')
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spool_dir = Path(self.temp_dir.name)
+        self.settings_override = override_settings(
+            SUBMISSION_SPOOL_ENABLED=True,
+            SUBMISSION_SPOOL_DIR=self.spool_dir,
+            SUBMISSION_SPOOL_BATCH_SIZE=1000,
+            SUBMISSION_SPOOL_MAX_LATENCY=3600,
+        )
+        self.settings_override.enable()
+        reset_spool()
+        clear_schema_cache()
+
+    def tearDown(self):
+        reset_spool()
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def _submit(self, text):
+        return self.client.post(
+            reverse('form-submit', args=[self.form.id]),
+            {'answers': [{'question_id': self.question.id, 'text_answer': text}]},
+            format='json',
+        )
+
+    def test_submit_is_queued_and_flushed_in_batches(self):
+        receipts = [self._submit(f'Person {index}').data['receipt_id'] for index in range(3)]
+        self.assertFalse(Response.objects.exists())
+
+        get_spool().seal()
+        self.assertEqual(flush_segments(self.spool_dir, 2), 3)
+
+        self.assertEqual(
+            set(Response.objects.values_list('receipt_id', flat=True)),
+            set(receipts),
+        )
+        self.assertEqual(Answer.objects.filter(question=self.question).count(), 3)
+        self.assertEqual(list(self.spool_dir.iterdir()), [])
+
+    def test_submit_returns_accepted_with_receipt(self):
+        response = self._submit('Ada')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertIsNotNone(response.data['receipt_id'])
+
+    def test_concurrent_appends_share_fsyncs(self):
+        spool = get_spool()
+        answers = [{'question_id': self.question.id, 'text_answer': 'Ada', 'file_answer': None, 'choice_ids': []}]
+        fsync = os.fsync
+        fsyncs = []
+
+        def slow_fsync(fd):
+            fsyncs.append(fd)
+            time.sleep(0.05)
+            fsync(fd)
+
+        with mock.patch('forms_api.ingest.os.fsync', slow_fsync), ThreadPoolExecutor(max_workers=8) as pool:
+            receipts = list(pool.map(lambda _: spool.append(self.form, answers), range(16)))
+
+        self.assertLess(len(fsyncs), len(receipts))
+        segment = spool.seal()
+        self.assertEqual(len(segment.read_bytes().splitlines()), 16)
+
+    @override_settings(SUBMISSION_SPOOL_MAX_ATTEMPTS=2)
+    def test_failing_segment_is_retried_then_quarantined_without_blocking_the_queue(self):
+        self._submit('poison')
+        poisoned = get_spool().seal()
+        os.utime(poisoned, (0, 0))  # Oldest, so it is flushed first
+        self._submit('Ada')
+        get_spool().seal()
+        commit_batch = ingest._commit_batch
+
+        def failing_commit_batch(records):
+            if any(answer['text_answer'] == 'poison' for record in records for answer in record['answers']):
+                raise DatabaseError('poisoned batch')
+            return commit_batch(records)
+
+        with mock.patch('forms_api.ingest._commit_batch', failing_commit_batch), self.assertLogs('forms_api.ingest', 'ERROR'):
+            self.assertEqual(flush_segments(self.spool_dir, 10), 1)
+            self.assertEqual([path.suffix for path in self.spool_dir.iterdir()], ['.ready'])
+            self.assertEqual(flush_segments(self.spool_dir, 10), 0)
+
+        self.assertEqual(list(Answer.objects.values_list('text_answer', flat=True)), ['Ada'])
+        self.assertEqual([path.name for path in self.spool_dir.iterdir()], [f'{poisoned.stem}.2.failed'])
+
+    @skipUnless(os.name == 'posix', 'Owner PIDs are only probed on POSIX')
+    def test_flusher_adopts_open_segments_of_dead_or_idle_workers(self):
+        def write_segment(name, text):
+            record = {
+                'receipt_id': str(uuid.uuid4()),
+                'form_id': self.form.id,
+                'created_at': timezone.now().isoformat(),
+                'answers': [{'question_id': self.question.id, 'text_answer': text, 'file_answer': None, 'choice_ids': []}],
+            }
+            path = self.spool_dir / name
+            path.write_text(json.dumps(record) + '\n')
+            return path
+
+        worker = subprocess.Popen([sys.executable, '-c', ''])
+        worker.wait()
+        write_segment(f'{ingest._HOST}-{worker.pid}-crashed.open', 'Ada')
+        os.utime(write_segment('elsewhere-1-idle.open', 'Grace'), (0, 0))
+        write_segment('elsewhere-1-busy.open', 'Edsger')
+
+        self.assertEqual(get_spool().flush(), 2)
+
+        self.assertEqual(set(Answer.objects.values_list('text_answer', flat=True)), {'Ada', 'Grace'})
+        self.assertEqual([path.name for path in self.spool_dir.iterdir()], ['elsewhere-1-busy.open'])
+
+    def test_segments_claimed_by_another_flusher_are_skipped(self):
+        self._submit('Ada')
+        segment = get_spool().seal()
+        listing = [self.spool_dir / 'taken.ready', segment]
+
+        with mock.patch.object(Path, 'iterdir', lambda directory: iter(listing)):
+            self.assertEqual(flush_segments(self.spool_dir, 10), 1)
+
+        self.assertEqual(list(Answer.objects.values_list('text_answer', flat=True)), ['Ada'])
+
+    def test_flush_command_recovers_orphaned_segments_idempotently(self):
+        self._submit('Ada')
+        segment = next(self.spool_dir.iterdir())
+        self.assertEqual(segment.suffix, '.open')
+        # Simulate a crash after commit but before the segment was deleted
+        replay = self.spool_dir / 'crashed.flushing'
+        replay.write_bytes(segment.read_bytes() + b'{"torn":')
+        reset_spool()
+
+        with self.assertLogs('forms_api.ingest', 'WARNING') as logs:
+            call_command('flush_submissions', stdout=io.StringIO())
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('Skipping unreadable record', logs.output[0])
+        self.assertEqual(Response.objects.count(), 1)
+        self.assertEqual(list(self.spool_dir.iterdir()), [])
+
+    @override_settings(EXPORT_DELTA_SETTLE=0)
+    def test_late_flushed_submission_sorts_by_time_in_pages_and_by_id_in_deltas(self):
+        owner = User.objects.create_user(email='spool-owner@example.com', password='password123', name='Owner')
+        self.form.owner = owner
+        self.form.save(update_fields=['owner'])
+        self.client.force_authenticate(user=owner)
+        now = timezone.now()
+        with mock.patch('forms_api.ingest.timezone.now', return_value=now - timedelta(days=1)):
+            self._submit('Late')
+        newest, oldest = bulk_create_responses([
+            (Response(form=self.form, created_at=now), []),
+            (Response(form=self.form, created_at=now - timedelta(days=2)), []),
+        ])
+        responses_url = reverse('form-responses', args=[self.form.id])
+        first = self.client.get(responses_url, {'cursor': '', 'page_size': 1}).data
+        second = self.client.get(responses_url, {'cursor': first['next_cursor'], 'page_size': 1}).data
+        export_url = reverse('form-export-csv', args=[self.form.id])
+        mark = self.client.get(export_url, {'since': ''})['X-Export-Cursor']
+
+        get_spool().seal()
+        flush_segments(self.spool_dir, 10)
+        late = Response.objects.get(receipt_id__isnull=False)
+
+        # The late response has the highest id but sorts between the two by its original time
+        self.assertEqual(late.created_at, now - timedelta(days=1))
+        self.assertGreater(late.id, oldest.id)
+        self.assertEqual([row['id'] for row in (first['results'] + second['results'])], [newest.id, oldest.id])
+        listing = self.client.get(responses_url, {'cursor': ''}).data['results']
+        self.assertEqual([row['id'] for row in listing], [newest.id, late.id, oldest.id])
+        # Not on the first page: it turns up past the first page's cursor, which a client
+        # that had already read the second page has gone by
+        resumed = self.client.get(responses_url, {'cursor': first['next_cursor'], 'page_size': 1}).data
+        self.assertEqual([row['id'] for row in resumed['results']], [late.id])
+        # The delta export after the old mark picks it up by id
+        export = self.client.get(export_url, {'since': mark})
+        rows = list(csv.reader(io.StringIO(b''.join(export.streaming_content).decode())))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [late.id])
+
+
+class AnsweredFormTestCase(TestCase):
+    """A form with choice, number and text questions and four answered responses."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(
+            email='analytics-owner@example.com',
+            password='password123',
+            name='Analytics Owner',
+            role='user',
+        )
+        cls.viewer = User.objects.create_user(
+            email='analytics-viewer@example.com',
+            password='password123',
+            name='Analytics Viewer',
+            role='user',
+        )
+        cls.form = Form.objects.create(title='Analytics Form', owner=cls.owner)
+        section = Section.objects.create(form=cls.form, title='Section')
+        cls.color = Question.objects.create(section=section, text='Colors', question_type='multiple_select', order=0)
+        cls.red = Choice.objects.create(question=cls.color, text='Red', order=0)
+        cls.blue = Choice.objects.create(question=cls.color, text='Blue', order=1)
+        cls.age = Question.objects.create(section=section, text='Age', question_type='number', order=1)
+        cls.comment = Question.objects.create(section=section, text='Comment', question_type='short_text', order=2)
+        cls.form.refresh_structure()
+
+        rows = [
+            ([cls.red.id, cls.blue.id], '20', 'great'),
+            ([cls.red.id], '30', 'great'),
+            ([], '', 'ok'),
+            ([cls.blue.id], '41', ''),
+        ]
+        bulk_create_responses([
+            (Response(form=cls.form), [
+                cls._answer(cls.color, None, choices),
+                cls._answer(cls.age, age),
+                cls._answer(cls.comment, comment),
+            ])
+            for choices, age, comment in rows
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    @staticmethod
+    def _answer(question, text, choice_ids=()):
+        return {
+            'question_id': question.id,
+            'question_type': question.question_type,
+            'text_answer': text,
+            'numeric_answer': numeric_value(question.question_type, text),
+            'file_answer': None,
+            'choice_ids': list(choice_ids),
+        }
+
+    def _newest_first(self):
+        return list(Response.objects.filter(form=self.form).order_by('-created_at', '-id').values_list('id', flat=True))
+
+
+class FormAnalyticsTests(AnsweredFormTestCase):
+    def test_analytics_aggregates_every_response_in_fixed_queries(self):
+        self.client.force_authenticate(user=self.owner)
+
+        # Form, owner, three rollup tables, numeric stats, text and numeric sketches, pending text deltas
+        with self.assertNumQueries(9):
+            response = self.client.get(reverse('form-analytics', args=[self.form.id]), {'top': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['response_count'], 4)
+        color, age, comment = response.data['questions']
+        self.assertEqual(color['answered_count'], 3)
+        self.assertEqual(
+            [(choice['text'], choice['count']) for choice in color['choices']],
+            [('Red', 2), ('Blue', 2)],
+        )
+        self.assertEqual(age['answered_count'], 3)
+        numeric = age['numeric']
+        self.assertEqual((numeric['min'], numeric['max'], numeric['mean']), (20.0, 41.0, 91 / 3))
+        self.assertAlmostEqual(numeric['percentiles']['p50'], 30.0, delta=0.3)
+        self.assertTrue(all(20.0 <= value <= 41.0 for value in numeric['percentiles'].values()))
+        self.assertEqual(sum(entry['count'] for entry in numeric['histogram']), 3)
+        self.assertEqual(comment['answered_count'], 3)
+        self.assertEqual(comment['top_responses'], [{'text': 'great', 'count': 2, 'error': 0}])
+        self.assertEqual(comment['top_responses_bound'], 0)
+
+    def test_numeric_min_and_max_seek_the_answer_index(self):
+        self.client.force_authenticate(user=self.owner)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('form-analytics', args=[self.form.id]))
+
+        # One ORDER BY ... LIMIT 1 subquery per bound rather than an aggregate over every answer
+        extremes, = [query['sql'] for query in queries if 'numeric_answer' in query['sql'] and 'forms_api_answer' in query['sql']]
+        self.assertEqual(extremes.count('LIMIT 1'), 2)
+        self.assertNotIn('MIN(', extremes)
+
+    def test_analytics_requires_view_responses_permission(self):
+        url = reverse('form-analytics', args=[self.form.id])
+        FormPermission.objects.create(form=self.form, user=self.viewer, permission_type='edit')
+        self.client.force_authenticate(user=self.viewer)
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        FormPermission.objects.create(form=self.form, user=self.viewer, permission_type='view_responses')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class RollupTests(AnsweredFormTestCase):
+    def test_rollups_count_submissions(self):
+        self.assertEqual(self.form.rollup.response_count, 4)
+        self.assertEqual(self.comment.rollup.nonempty_count, 3)
+
+    def test_rollups_follow_deletes(self):
+        Response.objects.filter(answers__text_answer='ok').delete()
+        # The builder recounts questions whose answers lost their selected choices
+        apply_form_operations(self.form, self.form.updated_at, [{'op': 'delete', 'type': 'choice', 'id': self.blue.id}])
+
+        self.form.rollup.refresh_from_db()
+        self.color.rollup.refresh_from_db()
+        self.red.rollup.refresh_from_db()
+        self.assertEqual(self.form.rollup.response_count, 3)
+        self.assertEqual(self.color.rollup.answer_count, 3)
+        self.assertEqual(self.color.rollup.nonempty_count, 2)
+        self.assertEqual(self.red.rollup.count, 2)
+
+    def _analytics(self):
+        response = self.client.get(reverse('form-analytics', args=[self.form.id]))
+        return {
+            question['text']: (question['answered_count'], [(choice['text'], choice['count']) for choice in question['choices']])
+            for question in response.data['questions'] if question['question_type'] == 'multiple_select'
+        }
+
+    def _colors_column(self):
+        rows = list(csv.reader(io.StringIO(b''.join(iter_export(self.form, self.form.responses.all())).decode())))
+        return sorted(row[2] for row in rows[1:])
+
+    def test_choice_sent_under_another_question_is_recreated_there(self):
+        shade = Question.objects.create(section=self.color.section, text='Shade', question_type='multiple_select', order=3)
+        Choice.objects.create(question=shade, text='Dark', order=0)
+        self.form.refresh_structure()
+        self.client.force_authenticate(user=self.owner)
+        payload = self.client.get(reverse('form-detail', args=[self.form.id])).data
+        color, shade_data = (
+            next(q for q in payload['sections'][0]['questions'] if q['id'] == pk) for pk in (self.color.id, shade.id)
+        )
+        red = next(choice for choice in color['choices'] if choice['id'] == self.red.id)
+        color['choices'].remove(red)
+        shade_data['choices'].append(red)
+
+        response = self.client.put(reverse('form-detail', args=[self.form.id]), payload, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Choice.objects.filter(pk=self.red.id).exists())
+        self.assertEqual(self._analytics(), {
+            'Colors': (2, [('Blue', 2)]),
+            'Shade': (0, [('Dark', 0), ('Red', 0)]),
+        })
+        self.assertEqual(self._colors_column(), ['', '', 'Blue', 'Blue'])
+
+    def test_rebuild_rollups_verifies_counters(self):
+        out = io.StringIO()
+        call_command('rebuild_rollups', '--verify', stdout=out)
+        self.assertIn('All rollup counters match', out.getvalue())
+
+        QuestionRollup.objects.filter(pk=self.age.id).update(answer_count=99)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--verify', stdout=io.StringIO())
+
+    def test_rebuild_rollups_repairs_counters(self):
+        QuestionRollup.objects.filter(pk=self.age.id).update(answer_count=99)
+
+        call_command('rebuild_rollups', '--form', str(self.form.id), stdout=io.StringIO())
+
+        self.assertEqual(QuestionRollup.objects.get(pk=self.age.id).answer_count, 4)
+
+
+@override_settings(TEXT_SKETCH_CAPACITY=3)
+class TextSketchTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        texts = ['Yes'] * 6 + ['no'] * 4 + [f'other {n}' for n in range(5)] + ['  YES ', 'No']
+        bulk_create_responses([
+            (Response(form=self.form), [self._answer(self.comment, text)]) for text in texts
+        ])
+
+    def _exact_counts(self):
+        return Counter(
+            normalize_text(text)
+            for text in Answer.objects.filter(question=self.comment).exclude(text_answer='').values_list('text_answer', flat=True)
+        )
+
+    def test_tracked_counts_are_within_their_error(self):
+        sketch = text_sketches([self.comment.id])[self.comment.id]
+        exact = self._exact_counts()
+
+        self.assertEqual(sketch.total, sum(exact.values()))
+        self.assertEqual(len(sketch.counters), 3)
+        for key, (text, count, error) in sketch.counters.items():
+            self.assertLessEqual(count - error, exact[key])
+            self.assertGreaterEqual(count, exact[key])
+        self.assertEqual(normalize_text(sketch.top(1)[0]['text']), 'yes')
+
+    def test_untracked_answers_stay_under_the_bound(self):
+        sketch = text_sketches([self.comment.id])[self.comment.id]
+
+        self.assertTrue(all(n <= sketch.bound for key, n in self._exact_counts().items() if key not in sketch.counters))
+
+    def _assert_guarantees(self, sketch):
+        exact = self._exact_counts()
+        self.assertEqual(sketch.total, sum(exact.values()))
+        for key, (text, count, error) in sketch.counters.items():
+            self.assertLessEqual(count - error, exact[key])
+            self.assertGreaterEqual(count, exact[key])
+        self.assertTrue(all(n <= sketch.bound for key, n in exact.items() if key not in sketch.counters))
+
+    def test_deletes_are_subtracted_from_the_sketch(self):
+        Response.objects.filter(answers__text_answer='other 4').delete()
+
+        self._assert_guarantees(text_sketches([self.comment.id])[self.comment.id])
+
+    def test_deleting_tracked_answers_keeps_the_bound(self):
+        Response.objects.filter(answers__text_answer__in=['Yes', '  YES ', 'no', 'No']).delete()
+        bulk_create_responses([(Response(form=self.form), [self._answer(self.comment, 'late')])])
+
+        sketch = text_sketches([self.comment.id])[self.comment.id]
+        self._assert_guarantees(sketch)
+        self.assertGreater(sketch.bound, 0)
+
+    def _stored_sketch(self):
+        return SpaceSaving(3, *TextAnswerSketch.objects.filter(question=self.comment).values_list('total', 'counters', 'floor').get())
+
+    @override_settings(TEXT_SKETCH_MERGE_EVERY=10 ** 6)
+    def test_submissions_append_deltas_until_a_merge(self):
+        merge_text_deltas()
+        stored = TextAnswerSketch.objects.get(question=self.comment)
+
+        with CaptureQueriesContext(connection) as queries:
+            bulk_create_responses([(Response(form=self.form), [self._answer(self.comment, 'fresh')])])
+
+        self.assertFalse(any('forms_api_textanswersketch' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(TextAnswerSketch.objects.get(question=self.comment).counters, stored.counters)
+        self.assertEqual(TextAnswerDelta.objects.filter(question=self.comment).count(), 1)
+        # Reads already count the pending answer
+        self._assert_guarantees(text_sketches([self.comment.id])[self.comment.id])
+
+        merge_text_deltas()
+
+        self.assertFalse(TextAnswerDelta.objects.exists())
+        self._assert_guarantees(self._stored_sketch())
+
+    @override_settings(TEXT_SKETCH_MERGE_EVERY=2)
+    def test_large_batches_merge_at_once(self):
+        bulk_create_responses([
+            (Response(form=self.form), [self._answer(self.comment, text)]) for text in ('late', 'later')
+        ])
+
+        self.assertFalse(TextAnswerDelta.objects.exists())
+        self._assert_guarantees(self._stored_sketch())
+
+    def test_rebuild_sketches_recounts_text_answers(self):
+        call_command('rebuild_sketches', '--form', str(self.form.id), stdout=io.StringIO())
+
+        rebuilt = text_sketches([self.comment.id])[self.comment.id]
+        self.assertEqual(rebuilt.top(1), [{'text': 'Yes', 'count': 7, 'error': 0}])
+
+
+class NumericSketchTests(AnsweredFormTestCase):
+    base = datetime(2026, 3, 2, 9, 30, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        bulk_create_responses([
+            (Response(form=self.form, created_at=self.base + timedelta(days=value % 3)), [self._answer(self.age, str(value))])
+            for value in range(1, 1001)
+        ])
+        # Drops the fixture's three ages and their duplicates among the new ones
+        Response.objects.filter(answers__question=self.age, answers__text_answer__in=['20', '30', '41']).delete()
+
+    def test_quantiles_follow_deletes(self):
+        sketch = numeric_sketches([self.age.id])[self.age.id]
+
+        self.assertEqual(sketch.count, 997)
+        self.assertEqual(sketch.total, 500500 - 91)
+        alpha = settings.NUMERIC_SKETCH_RELATIVE_ACCURACY
+        for q, exact in ((0.5, 501), (0.9, 899), (0.99, 988)):
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), exact * alpha + 1)
+
+    def test_daily_sketches_merge_over_a_date_range(self):
+        one_day = numeric_sketches([self.age.id], start=self.base.date(), end=self.base.date() + timedelta(days=1))
+
+        self.assertEqual(one_day[self.age.id].count, 332)
+
+    def test_analytics_merges_daily_sketches_over_a_day_range(self):
+        self.client.force_authenticate(user=self.owner)
+        url = reverse('form-analytics', args=[self.form.id])
+        start, end = self.base.date(), self.base.date() + timedelta(days=2)
+
+        with mock.patch('forms_api.analytics.summarize_numeric_answers') as summarize:
+            response = self.client.get(url, {'start': start.isoformat(), 'end': end.isoformat()})
+
+        summarize.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['response_count'], 666)
+        numeric = next(question for question in response.data['questions'] if question['id'] == self.age.id)['numeric']
+        # Days 0 and 1 hold the values that are not 2 mod 3
+        self.assertEqual((numeric['min'], numeric['max']), (1.0, 1000.0))
+        self.assertLessEqual(abs(numeric['percentiles']['p50'] - 500), 500 * settings.NUMERIC_SKETCH_RELATIVE_ACCURACY + 2)
+        histogram = numeric['histogram']
+        self.assertEqual(sum(bin['count'] for bin in histogram), 666)
+        self.assertEqual(len(histogram), settings.NUMERIC_HISTOGRAM_BINS)
+        widths = {round(bin['end'] - bin['start'], 9) for bin in histogram}
+        self.assertEqual(widths, {round(999 / settings.NUMERIC_HISTOGRAM_BINS, 9)})
+
+        # A range that does not start on a UTC midnight reads the answers themselves
+        with mock.patch('forms_api.analytics.summarize_numeric_answers', wraps=summarize_numeric_answers) as summarize:
+            self.client.get(url, {'start': (self.base + timedelta(hours=1)).isoformat(), 'end': end.isoformat()})
+        summarize.assert_called_once()
+
+    def test_rebuild_sketches_matches_the_incremental_sketch(self):
+        sketch = numeric_sketches([self.age.id])[self.age.id]
+
+        call_command('rebuild_sketches', '--form', str(self.form.id), stdout=io.StringIO())
+
+        rebuilt = numeric_sketches([self.age.id])[self.age.id]
+        self.assertEqual((rebuilt.count, list(rebuilt.buckets())), (sketch.count, list(sketch.buckets())))
+
+    def test_type_changes_rederive_numeric_answers_and_sketches(self):
+        self.client.force_authenticate(user=self.owner)
+        payload = self.client.get(reverse('form-detail', args=[self.form.id])).data
+        for section in payload['sections']:
+            for question in section['questions']:
+                if question['id'] == self.age.id:
+                    question['question_type'] = 'short_text'
+        self.client.put(reverse('form-detail', args=[self.form.id]), payload, format='json')
+
+        self.assertFalse(Answer.objects.filter(question=self.age, numeric_answer__isnull=False).exists())
+        self.assertEqual(numeric_sketches([self.age.id])[self.age.id].count, 0)
+        self.assertEqual(text_sketches([self.age.id])[self.age.id].total, 997)
+
+        self.form.refresh_from_db()
+        apply_form_operations(self.form, self.form.updated_at, [
+            {'op': 'update', 'type': 'question', 'id': self.age.id, 'data': {'question_type': 'number'}},
+        ])
+
+        self.assertEqual(Answer.objects.filter(question=self.age, numeric_answer__isnull=False).count(), 997)
+        self.assertEqual(numeric_sketches([self.age.id])[self.age.id].count, 997)
+        self.assertFalse(TextAnswerSketch.objects.filter(question=self.age).exists())
+
+    def test_rebuild_sketches_picks_up_type_changes_made_outside_the_builder(self):
+        Question.objects.filter(pk=self.comment.pk).update(question_type='number')
+        Answer.objects.filter(pk=Answer.objects.filter(question=self.comment).values('pk')[:1]).update(text_answer='7')
+
+        call_command('rebuild_sketches', '--form', str(self.form.id), stdout=io.StringIO())
+
+        self.assertEqual(
+            list(Answer.objects.filter(question=self.comment, numeric_answer__isnull=False).values_list('numeric_answer', flat=True)),
+            [7.0],
+        )
+        self.assertEqual(numeric_sketches([self.comment.id])[self.comment.id].count, 1)
+
+
+class SubmissionTrendsTests(AnsweredFormTestCase):
+    base = datetime(2026, 3, 2, 9, 30, tzinfo=dt_timezone.utc)  # A Monday
+
+    def setUp(self):
+        super().setUp()
+        bulk_create_responses([
+            (Response(form=self.form, created_at=self.base + offset), [])
+            for offset in (timedelta(0), timedelta(minutes=10), timedelta(hours=3), timedelta(days=6))
+        ])
+        Response.objects.filter(created_at=self.base + timedelta(hours=3)).delete()
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('form-trends', args=[self.form.id])
+
+    def _series(self, params):
+        response = self.client.get(self.url, params)
+        return [(point['start'], point['count']) for point in response.data['series']]
+
+    def test_hourly_trends_read_fixed_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'granularity': 'hour', 'start': '2026-03-01', 'end': '2026-03-05'})
 
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data['sections']), 2)
+        self.assertEqual(
+            [(point['start'], point['count']) for point in response.data['series']],
+            [(self.base.replace(minute=0), 2)],
+        )
+
+    def test_weekly_trends_sum_daily_buckets(self):
+        series = self._series({'granularity': 'week', 'start': '2026-03-01', 'end': '2026-04-01'})
+
+        self.assertEqual(
+            series,
+            [(datetime(2026, 3, 1, tzinfo=dt_timezone.utc), 2), (datetime(2026, 3, 8, tzinfo=dt_timezone.utc), 1)],
+        )
+
+    def test_unbounded_trends_cover_every_submission(self):
+        series = self._series({'granularity': 'day'})
+
+        self.assertEqual(sum(count for _, count in series), 7)
+
+    def test_trends_reject_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'granularity': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': 'yesterday'}).status_code, 400)
+
+
+class ResponseFilterTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.owner)
+
+    @staticmethod
+    def _filter(*predicates):
+        return json.dumps(list(predicates))
+
+    def _export_lines(self, params):
+        response = self.client.get(reverse('form-export-csv', args=[self.form.id]), params)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_filter_narrows_responses(self):
+        response = self.client.get(reverse('form-responses', args=[self.form.id]), {'filter': self._filter(
+            {'question': self.color.id, 'op': 'choice_in', 'value': [self.red.id]},
+            {'question': self.age.id, 'op': 'gte', 'value': 25},
+        )})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(
+            [answer['text_answer'] for answer in response.data['results'][0]['answers'] if answer['question'] == self.age.id],
+            ['30'],
+        )
+
+    def test_numeric_eq_filter_matches_the_exact_value(self):
+        response = self.client.get(reverse('form-responses', args=[self.form.id]), {'filter': self._filter(
+            {'question': self.age.id, 'op': 'eq', 'value': 30.0},
+        )})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [answer['text_answer'] for result in response.data['results'] for answer in result['answers'] if answer['question'] == self.age.id],
+            ['30'],
+        )
+
+    def test_filter_narrows_analytics(self):
+        response = self.client.get(reverse('form-analytics', args=[self.form.id]), {'filter': self._filter(
+            {'question': self.color.id, 'op': 'choice_in', 'value': [self.blue.id]},
+        )})
+
+        self.assertEqual(response.data['response_count'], 2)
+        color, age, comment = response.data['questions']
+        self.assertEqual([choice['count'] for choice in color['choices']], [1, 2])
+        self.assertEqual((age['numeric']['min'], age['numeric']['max']), (20.0, 41.0))
+        self.assertEqual(comment['top_responses'], [{'text': 'great', 'count': 1, 'error': 0}])
+
+    def test_filter_narrows_csv_export(self):
+        lines = self._export_lines({
+            'filter': self._filter({'question': self.comment.id, 'op': 'contains', 'value': 'GRE'}),
+            'start': '2000-01-01',
+        })
+
+        self.assertEqual(len(lines), 3)
+
+    def test_date_range_narrows_csv_export(self):
+        self.assertEqual(len(self._export_lines({'end': '2000-01-01'})), 1)
+
+    def test_invalid_filters_are_rejected(self):
+        for bad_filter in (
+            'not json',
+            self._filter({'question': self.age.id, 'op': 'contains', 'value': 'x'}),
+            self._filter({'question': self.color.id, 'op': 'choice_in', 'value': [self.red.id + 100]}),
+            self._filter({'question': self.age.id, 'op': 'between', 'value': [30, 20]}),
+        ):
+            response = self.client.get(reverse('form-responses', args=[self.form.id]), {'filter': bad_filter})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('filter', response.data)
+
+
+class ResponseCursorTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        tied = datetime(2026, 3, 2, 9, 30, tzinfo=dt_timezone.utc)
+        bulk_create_responses([
+            (Response(form=self.form, created_at=tied), [self._answer(self.comment, 'tied')]) for _ in range(5)
+        ])
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('form-responses', args=[self.form.id])
+
+    def _walk(self, on_page=None):
+        """Follow ``next_cursor`` from the first page; returns the ids seen and each page's query count."""
+        seen, cursor, query_counts = [], '', []
+        while cursor is not None:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(self.url, {'cursor': cursor, 'page_size': 2}).data
+            query_counts.append(len(queries))
+            seen += [response['id'] for response in page['results']]
+            cursor = page['next_cursor']
+            if on_page:
+                on_page(seen)
+        return seen, query_counts
+
+    def test_cursor_pages_cost_a_fixed_number_of_queries(self):
+        expected = self._newest_first()
+
+        seen, query_counts = self._walk()
+
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(set(query_counts)), 1)
+
+    def test_new_submissions_do_not_shift_later_pages(self):
+        expected = self._newest_first()
+
+        def submit_after_first_page(seen):
+            if len(seen) == 2:
+                bulk_create_responses([(Response(form=self.form), [])])
+
+        seen, _ = self._walk(submit_after_first_page)
+
+        self.assertEqual(seen, expected)
+
+    def test_unknown_cursor_returns_404(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'bogus'}).status_code, 404)
+
+
+class CompactLayoutTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('form-responses', args=[self.form.id])
+
+    def test_compact_rows_match_nested_answers(self):
+        nested = self.client.get(self.url).data
+        compact = self.client.get(self.url, {'layout': 'compact'}).data
+
+        self.assertEqual(compact['count'], nested['count'])
+        self.assertEqual(compact['columns'], [self.color.id, self.age.id, self.comment.id])
+        for row, response in zip(compact['results'], nested['results']):
+            self.assertEqual(row[:2], [response['id'], response['created_at']])
+            answers = {answer['question']: answer for answer in response['answers']}
+            self.assertEqual(row[2:], [
+                answers[self.color.id]['selected_choices'],
+                answers[self.age.id]['text_answer'],
+                answers[self.comment.id]['text_answer'],
+            ])
+
+    def test_compact_layout_pages_by_cursor(self):
+        compact = self.client.get(self.url, {'layout': 'compact'}).data
+
+        page = self.client.get(self.url, {'layout': 'compact', 'cursor': '', 'page_size': 3}).data
+        self.assertEqual([row[0] for row in page['results']], [row[0] for row in compact['results'][:3]])
+        page = self.client.get(self.url, {'layout': 'compact', 'cursor': page['next_cursor'], 'page_size': 3}).data
+        self.assertEqual(page['results'], compact['results'][3:])
+
+
+class SpreadsheetTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('form-spreadsheet', args=[self.form.id])
+
+    def test_spreadsheet_projects_and_sorts_columns(self):
+        data = self.client.get(self.url, {'columns': f'{self.age.id},{self.color.id}', 'sort': self.age.id, 'direction': 'asc'}).data
+
+        self.assertEqual(data['count'], 4)
+        self.assertEqual([column['id'] for column in data['columns']], [self.color.id, self.age.id])
+        self.assertEqual([row[2:] for row in data['rows']], [['', ''], ['Red, Blue', '20'], ['Red', '30'], ['Blue', '41']])
+
+    def test_spreadsheet_windows_rows(self):
+        window = self.client.get(self.url, {'columns': self.comment.id, 'sort': self.comment.id, 'offset': 1, 'limit': 2}).data
+
+        self.assertEqual([row[2:] for row in window['rows']], [['great'], ['great']])
+        self.assertEqual((window['offset'], window['limit']), (1, 2))
+
+    def test_spreadsheet_accepts_the_response_filter(self):
+        filtered = self.client.get(self.url, {
+            'filter': json.dumps([{'question': self.comment.id, 'op': 'equals', 'value': 'ok'}]),
+        }).data
+
+        self.assertEqual(filtered['count'], 1)
+        self.assertEqual(filtered['rows'][0][2:], ['', '', 'ok'])
+
+    def test_spreadsheet_rejects_unknown_columns(self):
+        self.assertEqual(self.client.get(self.url, {'sort': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'columns': '999999'}).status_code, 400)
+
+
+class ResponseExportTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('form-export', args=[self.form.id])
+
+    @override_settings(EXPORT_BATCH_SIZE=3, EXPORT_BUFFER_SIZE=1)
+    def test_export_csv_walks_keyset_batches(self):
+        tied = datetime(2026, 3, 2, 9, 30, tzinfo=dt_timezone.utc)
+        bulk_create_responses([
+            (Response(form=self.form, created_at=tied), [self._answer(self.color, None, [self.blue.id, self.red.id])])
+            for _ in range(4)
+        ])
+
+        response = self.client.get(reverse('form-export-csv', args=[self.form.id]))
+        chunks = list(response.streaming_content)
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+
+        self.assertEqual(rows[0], ['Response ID', 'Submitted At', 'Colors', 'Age', 'Comment'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], self._newest_first())
+        self.assertEqual(rows[1][2:], ['Blue', '41', ''])
+        self.assertEqual(rows[-1][1:], ['2026-03-02 09:30:00', 'Red, Blue', '', ''])
+        self.assertEqual(len(chunks), len(rows) - 1)  # The header goes out with the first row
+
+    @override_settings(EXPORT_BATCH_SIZE=2)
+    def test_sharded_export_matches_the_streaming_export(self):
+        tied = datetime(2026, 3, 2, 9, 30, tzinfo=dt_timezone.utc)
+        bulk_create_responses([(Response(form=self.form, created_at=tied), []) for _ in range(5)])
+        expected = b''.join(iter_export(self.form, self.form.responses.all()))
+
+        reports = []
+        sharded = b''.join(iter_parallel_export(
+            self.form, self.form.responses.all(), workers=1, shards=4,
+            progress=lambda done, total: reports.append((done, total)),
+        ))
+
+        self.assertEqual(sharded, expected)
+        self.assertEqual(reports, [(3, 9), (6, 9), (9, 9)])
+
+    def test_shard_bounds_cut_every_shard_in_one_query(self):
+        tied = datetime(2026, 3, 2, 9, 30, tzinfo=dt_timezone.utc)
+        bulk_create_responses([(Response(form=self.form, created_at=tied), []) for _ in range(7)])
+        keys = list(self.form.responses.order_by('-created_at', '-id').values_list('created_at', 'id'))
+
+        with self.assertNumQueries(2):
+            total, bounds = shard_bounds(self.form.responses.all(), 4)
+
+        # 11 responses in shards of 3, cut after the 3rd, 6th and 9th key
+        self.assertEqual(total, 11)
+        self.assertEqual(bounds, [(None, keys[2]), (keys[2], keys[5]), (keys[5], keys[8]), (keys[8], None)])
+
+    def test_export_command_writes_the_csv_export(self):
+        expected = b''.join(iter_export(self.form, self.form.responses.all()))
+        out = io.StringIO()
+
+        call_command('export_responses', str(self.form.id), '--workers', '1', '--shards', '2', stdout=out, stderr=io.StringIO())
+
+        self.assertEqual(out.getvalue(), expected.decode())
+
+    @override_settings(EXPORT_BATCH_SIZE=2)
+    def test_ndjson_export_keeps_numbers_and_choice_lists(self):
+        response = self.client.get(self.url, {'type': 'ndjson'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([record['response_id'] for record in records], self._newest_first())
+        self.assertEqual([record[f'question_{self.age.id}'] for record in records], [41, None, 30, 20])
+        self.assertEqual(
+            [record[f'question_{self.color.id}'] for record in records],
+            [['Blue'], [], ['Red'], ['Red', 'Blue']],
+        )
+
+    def test_unknown_export_type_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'type': 'xlsx'}).status_code, 400)
+
+    @skipUnless(EXPORT_FORMATS['parquet'].available, 'pyarrow is not installed')
+    @override_settings(EXPORT_BATCH_SIZE=2, EXPORT_ROW_GROUP_SIZE=3)
+    def test_parquet_export_has_typed_columns(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(io.BytesIO(b''.join(self.client.get(self.url, {'type': 'parquet'}).streaming_content)))
+        records = [json.loads(line) for line in b''.join(self.client.get(self.url, {'type': 'ndjson'}).streaming_content).splitlines()]
+
+        age, color = f'question_{self.age.id}', f'question_{self.color.id}'
+        self.assertEqual(table.schema.field(age).type, pa.int64())
+        self.assertEqual(table.schema.field(color).type, pa.list_(pa.string()))
+        self.assertEqual(table.schema.field(age).metadata[b'text'], b'Age')
+        responses = Response.objects.filter(form=self.form).order_by('-created_at', '-id')
+        self.assertEqual(table.to_pylist(), [
+            {key: value for key, value in record.items() if key != 'submitted_at'} | {'submitted_at': response.created_at}
+            for record, response in zip(records, responses)
+        ])
+
+    @skipUnless(EXPORT_FORMATS['arrow'].available, 'pyarrow is not installed')
+    @override_settings(EXPORT_BATCH_SIZE=2)
+    def test_sharded_arrow_export_matches_the_streaming_export(self):
+        import pyarrow as pa
+
+        expected = pa.ipc.open_stream(b''.join(iter_export(self.form, self.form.responses.all(), 'arrow'))).read_all()
+        sharded = b''.join(iter_parallel_export(self.form, self.form.responses.all(), fmt='arrow', workers=1, shards=3))
+
+        self.assertEqual(pa.ipc.open_stream(sharded).read_all().to_pylist(), expected.to_pylist())
+
+    @skipUnless(EXPORT_FORMATS['parquet'].available, 'pyarrow is not installed')
+    @override_settings(EXPORT_BATCH_SIZE=2)
+    def test_sharded_parquet_export_copies_the_shards_row_groups(self):
+        import pyarrow.parquet as pq
+
+        expected = pq.read_table(io.BytesIO(b''.join(iter_export(self.form, self.form.responses.all(), 'parquet'))))
+        sharded = pq.ParquetFile(io.BytesIO(b''.join(
+            iter_parallel_export(self.form, self.form.responses.all(), fmt='parquet', workers=1, shards=2),
+        )))
+
+        self.assertEqual(sharded.num_row_groups, 2)
+        self.assertEqual(sharded.read().to_pylist(), expected.to_pylist())
+
+
+@override_settings(EXPORT_BATCH_SIZE=2, EXPORT_BUFFER_SIZE=1)
+class ExportCompressionTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('form-export-csv', args=[self.form.id])
+        self.plain = b''.join(self.client.get(self.url).streaming_content)
+
+    def test_accepted_gzip_encoding_compresses_the_stream(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='br, gzip;q=0.8')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['Content-Disposition'].endswith('_responses.csv"'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.plain)
+
+    def test_refused_encoding_is_not_used(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_compression_parameter_downloads_a_compressed_file(self):
+        response = self.client.get(self.url, {'compression': 'gzip'}, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('_responses.csv.gz"'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.plain)
+
+    @skipUnless(COMPRESSIONS['zstd'].available, 'zstandard is not installed')
+    def test_zstd_is_preferred_when_accepted(self):
+        import zstandard
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, zstd')
+
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+        body = zstandard.ZstdDecompressor().decompressobj().decompress(b''.join(response.streaming_content))
+        self.assertEqual(body, self.plain)
+
+
+class ExportJobTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(EXPORT_JOB_WORKERS=0, EXPORT_ARTIFACT_DIR=self.temp_dir.name)
+        self.settings_override.enable()
+        self.client.force_authenticate(user=self.owner)
+        self.create_url = reverse('form-export-jobs', args=[self.form.id])
+        self.expected = b''.join(self.client.get(reverse('form-export-csv', args=[self.form.id])).streaming_content)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def _create_job(self):
+        return self.client.post(self.create_url, {'type': 'csv'}, format='json').data
+
+    def _finished_job(self):
+        job = self._create_job()
+        call_command('run_export_jobs', stdout=io.StringIO())
+        return self.client.get(reverse('form-export-job', args=[self.form.id, job['id']])).data
+
+    def test_job_is_queued_then_reports_progress(self):
+        job = self._create_job()
+        self.assertEqual((job['status'], job['download_url']), ('pending', None))
+
+        call_command('run_export_jobs', stdout=io.StringIO())
+
+        job = self.client.get(reverse('form-export-job', args=[self.form.id, job['id']])).data
+        self.assertEqual((job['status'], job['progress'], job['total']), ('done', 4, 4))
+
+    def test_artifact_download_matches_the_export(self):
+        download = self.client.get(self._finished_job()['download_url'])
+
+        self.assertEqual(download['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(download.streaming_content), self.expected)
+
+    def test_runner_takes_over_jobs_whose_heartbeat_stopped(self):
+        stale, live = self._create_job(), self.client.post(self.create_url, {'type': 'ndjson'}, format='json').data
+        ExportJob.objects.filter(pk=stale['id']).update(
+            status='running', progress=2, heartbeat_at=timezone.now() - timedelta(seconds=settings.EXPORT_JOB_STALE_AFTER + 1),
+        )
+        ExportJob.objects.filter(pk=live['id']).update(status='running', heartbeat_at=timezone.now())
+
+        with self.assertLogs('forms_api.export_jobs', 'WARNING'):
+            call_command('run_export_jobs', stdout=io.StringIO())
+
+        self.assertEqual(ExportJob.objects.get(pk=stale['id']).status, 'done')
+        self.assertEqual(ExportJob.objects.get(pk=live['id']).status, 'running')
+
+    @override_settings(EXPORT_JOB_PROCESSES=2)
+    def test_jobs_can_render_shards_in_worker_processes(self):
+        with mock.patch('forms_api.exports.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as pool:
+            job = self._finished_job()
+
+        self.assertEqual(pool.call_args.kwargs['max_workers'], 2)
+        self.assertEqual((job['status'], job['progress'], job['total']), ('done', 4, 4))
+        self.assertEqual(b''.join(self.client.get(job['download_url']).streaming_content), self.expected)
+
+    def test_artifact_download_serves_byte_ranges(self):
+        url = self._finished_job()['download_url']
+        etag = self.client.get(url)['ETag']
+
+        partial = self.client.get(url, HTTP_RANGE='bytes=5-14')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f'bytes 5-14/{len(self.expected)}')
+        self.assertEqual(b''.join(partial.streaming_content), self.expected[5:15])
+        tail = self.client.get(url, HTTP_RANGE='bytes=-10', HTTP_IF_RANGE=etag)
+        self.assertEqual(b''.join(tail.streaming_content), self.expected[-10:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=-10', HTTP_IF_RANGE='"other"').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(self.expected)}-').status_code, 416)
+
+    def test_repeated_export_reuses_the_artifact_until_a_submission(self):
+        self._finished_job()
+
+        # No new submissions: the artifact is reused without running the export
+        again = self._create_job()
+        self.assertEqual((again['status'], again['total']), ('done', 4))
+        bulk_create_responses([(Response(form=self.form), [])])
+        self.assertEqual(self._create_job()['status'], 'pending')
+
+    def test_evicted_artifact_is_gone(self):
+        url = self._finished_job()['download_url']
+
+        with self.settings(EXPORT_ARTIFACT_MAX_BYTES=0):
+            # Just written, so inside the grace period
+            self.assertEqual(evict_artifacts(), 0)
+            with self.settings(EXPORT_ARTIFACT_GRACE=0):
+                self.assertEqual(evict_artifacts(), 1)
+
+        self.assertEqual(self.client.get(url).status_code, 410)
+
+    def test_download_survives_eviction_once_opened(self):
+        url = self._finished_job()['download_url']
+        response = self.client.get(url)
+
+        with self.settings(EXPORT_ARTIFACT_MAX_BYTES=0, EXPORT_ARTIFACT_GRACE=0):
+            self.assertEqual(evict_artifacts(), 1)
+
+        self.assertEqual(b''.join(response.streaming_content), self.expected)
+
+    def test_parse_range_clamps_and_ignores_multiple_ranges(self):
+        self.assertEqual(parse_range('bytes=0-1,4-5', 10), None)
+        self.assertEqual(parse_range('bytes=3-99', 10), (3, 9))
+
+
+@override_settings(EXPORT_DELTA_SETTLE=0)
+class DeltaExportTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('form-export-csv', args=[self.form.id])
+
+    def _export(self, since):
+        response = self.client.get(self.url, {'since': since})
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        return [int(row[0]) for row in rows[1:]], response['X-Export-Cursor']
+
+    def test_empty_cursor_exports_everything(self):
+        exported, cursor = self._export('')
+
+        self.assertEqual(sorted(exported), sorted(self._newest_first()))
+        self.assertEqual(self._export(cursor), ([], cursor))
+
+    def test_delta_exports_only_newer_responses(self):
+        first, cursor = self._export('')
+        bulk_create_responses([(Response(form=self.form), []) for _ in range(2)])
+
+        with CaptureQueriesContext(connection) as queries:
+            delta, next_cursor = self._export(cursor)
+
+        self.assertEqual(delta, [pk for pk in self._newest_first() if pk not in first])
+        self.assertEqual(next_cursor, str(max(delta)))
+        # Batches seek by id, not through the whole form's (created_at, id) order
+        batches = [query['sql'] for query in queries if 'FROM "forms_api_response"' in query['sql'] and 'LIMIT' in query['sql']]
+        self.assertTrue(batches)
+        self.assertTrue(all('ORDER BY "forms_api_response"."id" DESC' in sql for sql in batches))
+
+    def test_late_commit_with_an_earlier_submission_time_is_not_skipped(self):
+        _, cursor = self._export('')
+
+        # A spooled submission replayed after the sync keeps its original created_at
+        late, = bulk_create_responses([(Response(form=self.form, created_at=timezone.now() - timedelta(days=1)), [])])
+
+        self.assertEqual(self._export(cursor), ([late.id], str(late.id)))
+
+    @override_settings(EXPORT_DELTA_SETTLE=3600)
+    def test_unsettled_responses_wait_for_the_next_export(self):
+        self.assertEqual(self._export(''), ([], ''))
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'bogus'}).status_code, 400)
+
+    def test_deletion_log_pages_by_tombstone(self):
+        removed = sorted(self._newest_first())[:2]
+        Response.objects.get(pk=removed[0]).delete()
+        Response.objects.filter(pk=removed[1]).delete()
+        deletions = reverse('form-deletions', args=[self.form.id])
+
+        page = self.client.get(deletions, {'page_size': 1}).data
+        self.assertEqual(([row['response_id'] for row in page['results']], page['has_more']), ([removed[0]], True))
+        page = self.client.get(deletions, {'since': page['cursor']}).data
+        self.assertEqual(([row['response_id'] for row in page['results']], page['has_more']), ([removed[1]], False))
+        self.assertEqual(self.client.get(deletions, {'since': page['cursor']}).data['results'], [])
+
+
+class MediaExportTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        self.photo = Question.objects.create(section=self.color.section, text='Photo', question_type='media', order=3)
+        self.form.refresh_structure()
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('form-export-media', args=[self.form.id])
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir.name, EXPORT_BUFFER_SIZE=4)
+        self.settings_override.enable()
+
+        self.older, self.newer = Response.objects.filter(form=self.form).order_by('created_at', 'id')[:2]
+        for response, content in ((self.older, b'first upload'), (self.newer, b'second upload')):
+            name = default_storage.save(f'uploads/{response.id}.txt', ContentFile(content))
+            Answer.objects.create(response=response, question=self.photo, file_answer=name)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def _entry(self, response):
+        return f'{response.id}/{self.photo.id}/{response.id}.txt'
+
+    def _archive(self, params=None):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_media_export_streams_a_zip_of_uploads(self):
+        archive = self._archive()
+
+        self.assertEqual(archive.namelist(), [self._entry(self.newer), self._entry(self.older)])
+        self.assertEqual(archive.read(self._entry(self.older)), b'first upload')
+        self.assertIsNone(archive.testzip())
+
+    def test_missing_uploads_are_skipped(self):
+        Answer.objects.create(response=Response.objects.create(form=self.form), question=self.photo, file_answer='uploads/gone.txt')
+
+        with self.assertLogs('forms_api.bundles', 'WARNING'):
+            archive = self._archive()
+
+        self.assertEqual(archive.namelist(), [self._entry(self.newer), self._entry(self.older)])
+        self.assertIsNone(archive.testzip())
+
+    def test_media_export_can_lead_with_the_csv(self):
+        archive = self._archive({'include_csv': 'true'})
+
+        self.assertEqual(archive.namelist()[0], 'responses.csv')
+        self.assertEqual(archive.read('responses.csv').splitlines()[0], b'Response ID,Submitted At,Colors,Age,Comment,Photo')
+        self.assertEqual(archive.getinfo('responses.csv').extract_version, zipfile.ZIP64_VERSION)
+        self.assertIsNone(archive.testzip())
+
+    def test_media_export_accepts_the_response_filter(self):
+        archive = self._archive({'filter': json.dumps([{'question': self.age.id, 'op': 'between', 'value': [20, 25]}])})
+
+        self.assertEqual(archive.namelist(), [self._entry(self.older)])
+
+
+class ResponseSearchTests(AnsweredFormTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.owner)
+        self.url = reverse('form-responses', args=[self.form.id])
+        self.tagged, = bulk_create_responses([(Response(form=self.form), [self._answer(self.comment, '<b>Great</b> job')])])
+        self.great = set(Answer.objects.filter(question=self.comment, text_answer__icontains='great').values_list('response_id', flat=True))
+
+    def _search(self, query, **params):
+        return self.client.get(self.url, {'search': query, **params}).data
+
+    @staticmethod
+    def _ids(data):
+        return {item['id'] for item in data['results']}
+
+    def test_search_ranks_responses_containing_every_term(self):
+        data = self._search('great')
+
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(self._ids(data), self.great)
+        scores = [item['search']['score'] for item in data['results']]
+        self.assertEqual(scores, sorted(scores))
+        self.assertEqual(data['results'][0]['search']['question'], self.comment.id)
+        self.assertEqual(self._ids(self._search('great job')), {self.tagged.id})
+
+    def test_last_term_matches_as_a_case_insensitive_prefix(self):
+        self.assertEqual(self._ids(self._search('GRE')), self.great)
+
+    def test_snippets_escape_html_and_mark_matches(self):
+        snippets = {item['id']: item['search']['snippet'] for item in self._search('great job')['results']}
+
+        self.assertEqual(snippets, {self.tagged.id: '&lt;b&gt;<mark>Great</mark>&lt;/b&gt; <mark>job</mark>'})
+
+    def test_search_is_scoped_to_the_form(self):
+        other = Form.objects.create(title='Other', owner=self.owner)
+        other_question = Question.objects.create(section=Section.objects.create(form=other), text='Note', question_type='short_text')
+        bulk_create_responses([(Response(form=other), [self._answer(other_question, 'great')])])
+
+        self.assertEqual(self._ids(self._search('great')), self.great)
+
+    def test_search_accepts_the_response_filter(self):
+        data = self._search('great', filter=json.dumps([{'question': self.age.id, 'op': 'lte', 'value': 20}]))
+
+        self.assertEqual(self._ids(data), set(Answer.objects.filter(question=self.age, text_answer='20').values_list('response_id', flat=True)))
+
+    def test_punctuation_only_query_matches_nothing(self):
+        self.assertEqual(self._search('!!')['count'], 0)
+
+    def test_search_rejects_the_compact_layout(self):
+        self.assertEqual(self.client.get(self.url, {'search': 'great', 'layout': 'compact'}).status_code, 400)
+
+    def test_index_follows_deletes_and_cascades(self):
+        Response.objects.filter(pk=self.tagged.pk).delete()
+        self.assertEqual(self._search('job')['count'], 0)
+
+        self.comment.delete()
+        self.assertEqual(self._search('great')['count'], 0)
+
+    def test_rebuild_search_index_repopulates_the_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM forms_api_answer_search')
+        self.assertEqual(self._search('great')['count'], 0)
+
+        call_command('rebuild_search_index', '--form', str(self.form.id), stdout=io.StringIO())
+
+        self.assertEqual(self._search('great')['count'], 3)
 
 
 class FormPermissionTests(TestCase):
@@ -1,33 +1,49 @@
 from rest_framework import viewsets, permissions, status, pagination
 import rest_framework
 from rest_framework.decorators import action
+from rest_framework.fields import empty
 from rest_framework.response import Response as DRFResponse
 from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.views import APIView
-from django.shortcuts import get_object_or_404
 from django.db.models import Q, Count
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.http import StreamingHttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from django.utils import timezone
 
 from pathlib import Path
-import csv
-import io
 import os
 import shutil
 import uuid as _uuid
 from datetime import datetime, timezone as dt_timezone
 
-from .models import Form, FormPermission, Answer, Question, FormArchive
+from .models import Form, FormPermission, Answer, Question, FormArchive, FormRollup, ExportJob
 from .serializers import (
     FormListSerializer, FormDetailSerializer, ResponseSerializer,
     UserSerializer, LoginSerializer, CreateUserSerializer, 
     ResetPasswordSerializer, FormPermissionSerializer,
-    UpdateProfileSerializer, ChangePasswordSerializer
+    UpdateProfileSerializer, ChangePasswordSerializer, FormOperationsSerializer, TrendQuerySerializer,
+    ResponseFilterSerializer, SpreadsheetQuerySerializer, ExportQuerySerializer, ExportJobSerializer,
+    DeletionLogQuerySerializer, MediaExportQuerySerializer,
 )
 from .permissions import IsAdmin, IsFormOwner, HasFormPermission
+from .analytics import build_form_analytics, submission_trend, whole_days
+from .bundles import iter_media_zip
+from .compact import compact_responses
+from .deltas import delta_responses, deletions_since
+from .export_jobs import UnsatisfiableRange, create_export_job, iter_file_range, open_artifact, parse_range
+from .exports import COMPRESSIONS, EXPORT_FORMATS, compress, iter_export, negotiate_compression
+from .filters import filter_responses
+from .pagination import ResponseCursorPagination
+from .spreadsheet import build_spreadsheet
+from .form_ops import apply_form_operations
+from .ingest import get_spool
+from .public_forms import get_public_form
+from .schema import get_form_schema
+from .search import rank_responses, search_snippets, search_terms
+from .submissions import create_response
 
 
 class UploadQuestionMediaView(APIView):
@@ -85,6 +101,9 @@ FILE_BROWSER_DEFAULT_PAGE = 1
 FILE_BROWSER_DEFAULT_PAGE_SIZE = 50
 FILE_BROWSER_MAX_PAGE_SIZE = 200
 
+# Export job ids in URLs
+_UUID_PATTERN = r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'
+
 
 def _resolve_media_child(media_root, relative_path):
     target_path = (media_root / relative_path).resolve() if relative_path else media_root
@@ -95,6 +114,20 @@ def _resolve_media_child(media_root, relative_path):
     return target_path
 
 
+def _stored_response_count(form):
+    """The form's response count from its rollup row, instead of a ``COUNT(*)``."""
+    return FormRollup.objects.filter(form=form).values_list('response_count', flat=True).first() or 0
+
+
+def _safe_title(form):
+    return form.title.replace('"', '').replace('\r', '').replace('\n', '')[:100]
+
+
+def _export_filename(form, fmt, compression=None):
+    filename = f'{_safe_title(form)}_responses.{EXPORT_FORMATS[fmt].extension}'
+    return f'{filename}.{COMPRESSIONS[compression].extension}' if compression else filename
+
+
 def _get_positive_int_query_param(query_params, name, default, maximum=None):
     try:
         value = int(query_params.get(name, default))
@@ -394,7 +427,12 @@ class UserViewSet(viewsets.ModelViewSet):
         linked_answers = Answer.objects.filter(file_answer=relative_path)
         linked_answers.update(file_answer=None)
 
+        # Bump the version of affected forms so cached public payloads drop the media URL
+        affected_forms = list(Form.objects.filter(sections__questions__media_file=relative_path).distinct())
         Question.objects.filter(media_file=relative_path).update(media_file='')
+        for form in affected_forms:
+            form.refresh_structure()
+        Form.objects.filter(pk__in=[form.pk for form in affected_forms]).update(updated_at=timezone.now())
 
         file_path.unlink()
 
@@ -458,10 +496,12 @@ class FormViewSet(viewsets.ModelViewSet):
     """
     def get_queryset(self):
         # Allow public submission and retrieval (for form filling)
-        if self.action in ['submit', 'retrieve', 'by_share_id']:
-            return Form.objects.all().prefetch_related(
-                'sections__questions__choices'
-            )
+        if self.action == 'submit':
+            # Structure comes from the compiled schema, not the ORM
+            return Form.objects.defer('structure')
+        if self.action == 'retrieve':
+            # Rendered from the denormalized Form.structure document
+            return Form.objects.all()
 
         user = self.request.user
         if not user.is_authenticated:
@@ -480,7 +520,7 @@ class FormViewSet(viewsets.ModelViewSet):
             archive_subquery = FormArchive.objects.filter(
                 user=user, form=OuterRef('pk')
             )
-            qs = qs.select_related('owner').annotate(
+            qs = qs.defer('structure').select_related('owner').annotate(
                 _section_count=Count('sections', distinct=True),
                 _question_count=Count('sections__questions', distinct=True),
                 _response_count=Count('responses', distinct=True),
@@ -523,6 +563,12 @@ class FormViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    def _response_filter(self, request, form):
+        """Validated ``ResponseFilterSerializer`` data from the query string; invalid input is a 400."""
+        query = ResponseFilterSerializer(data=request.query_params, context={'form': form})
+        query.is_valid(raise_exception=True)
+        return query.validated_data
+
     def _is_admin_user(self, user):
         return user.is_authenticated and user.role == 'admin'
 
@@ -541,11 +587,11 @@ class FormViewSet(viewsets.ModelViewSet):
             return
 
         # Granular checks for shared users
-        if self.action in ['update', 'partial_update']:
+        if self.action in ['update', 'partial_update', 'operations']:
             if not FormPermission.objects.filter(form=obj, user=request.user, permission_type='edit').exists():
                 self.permission_denied(request, message="You do not have permission to edit this form.")
         
-        elif self.action in ['responses', 'export_csv']:
+        elif self.action in ['responses', 'export', 'export_csv', 'export_jobs', 'export_job', 'export_job_download', 'export_media', 'deletions', 'analytics', 'trends', 'spreadsheet']:
              if not FormPermission.objects.filter(form=obj, user=request.user, permission_type='view_responses').exists():
                 self.permission_denied(request, message="You do not have permission to view responses.")
         
@@ -562,10 +608,26 @@ class FormViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='by-share-id/(?P<share_id>[^/.]+)')
     def by_share_id(self, request, share_id=None):
-        # Public access allowed
-        form = get_object_or_404(self.get_queryset(), share_id=share_id)
-        serializer = FormDetailSerializer(form, context={'request': request})
-        return DRFResponse(serializer.data)
+        # Public access allowed; served from the pre-rendered cache with ETag revalidation
+        rendered = get_public_form(share_id, request)
+        if rendered is None:
+            raise Http404
+        etag, body = rendered
+
+        response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        # Weak If-None-Match comparison, so a W/ tag from a compressing proxy still revalidates
+        return get_conditional_response(request, etag=etag, response=response)
+
+    @action(detail=True, methods=['post'])
+    def operations(self, request, pk=None):
+        """Apply incremental builder edits (see ``form_ops``) against a form version."""
+        form = self.get_object()
+        serializer = FormOperationsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = apply_form_operations(form, serializer.validated_data['version'], serializer.validated_data['ops'])
+        return DRFResponse(result)
 
     @action(detail=True, methods=['post'])
     def archive(self, request, pk=None):
@@ -595,7 +657,7 @@ class FormViewSet(viewsets.ModelViewSet):
             )
 
         # Construct data for serializer manually to avoid QueryDict issues with nested data
-        data = {'form': form.id}
+        data = {}
 
         # Handle nested multipart data parsing
         import re
@@ -643,80 +705,238 @@ class FormViewSet(viewsets.ModelViewSet):
              if 'answers' in request.data:
                  data['answers'] = request.data['answers']  
 
-        serializer = ResponseSerializer(data=data)
-        if serializer.is_valid():
-            serializer.save()
-            return DRFResponse(serializer.data, status=201)
-        return DRFResponse(serializer.errors, status=400)
+        answers = get_form_schema(form).validate(data.get('answers', empty))
+        if settings.SUBMISSION_SPOOL_ENABLED:
+            receipt_id = get_spool().append(form, answers)
+            return DRFResponse({'receipt_id': receipt_id, 'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
+        response = create_response(form, answers)
+        return DRFResponse(ResponseSerializer(response).data, status=201)
 
     @action(detail=True, methods=['get'])
     def responses(self, request, pk=None):
         form = self.get_object()
         # Permission check handled in check_object_permissions
 
-        page_size = request.query_params.get('page_size', 25)
-        try:
-            page_size = min(int(page_size), 100)  # cap at 100
-        except (ValueError, TypeError):
-            page_size = 25
+        page_size = _get_positive_int_query_param(request.query_params, 'page_size', 25, maximum=100)
 
-        responses = form.responses.prefetch_related(
-            'answers__question', 'answers__selected_choices'
-        ).order_by('-created_at')
+        response_filter = self._response_filter(request, form)
+        compact = request.query_params.get('layout') == 'compact'
+        if 'search' in request.query_params:
+            if compact:
+                return DRFResponse({'layout': ['Search results use the nested layout.']}, status=status.HTTP_400_BAD_REQUEST)
+            return self._search_responses(request, form, response_filter, page_size)
+        if compact:
+            responses = form.responses.values_list('id', 'created_at', named=True)
+        else:
+            responses = form.responses.prefetch_related('answers__question', 'answers__selected_choices')
+        responses = filter_responses(responses.order_by('-created_at', '-id'), **response_filter)
+
+        if 'cursor' in request.query_params:
+            # Keyset pages; the rollup counter stands in for COUNT(*) when unfiltered
+            count = None if response_filter else _stored_response_count(form)
+            paginator = ResponseCursorPagination(page_size, count=count)
+        else:
+            paginator = rest_framework.pagination.PageNumberPagination()
+            paginator.page_size = page_size
+        page = paginator.paginate_queryset(responses, request)
+        if not compact:
+            return paginator.get_paginated_response(ResponseSerializer(page, many=True).data)
+        columns, results = compact_responses(form, page, request)
+        response = paginator.get_paginated_response(results)
+        response.data['columns'] = columns
+        return response
 
+    def _search_responses(self, request, form, response_filter, page_size):
+        """Ranked page of responses matching ``?search=`` (see ``search``), each with its best snippet."""
+        terms = search_terms(request.query_params['search'])
+        candidates = filter_responses(form.responses.all(), **response_filter) if response_filter else None
         paginator = rest_framework.pagination.PageNumberPagination()
         paginator.page_size = page_size
-        page = paginator.paginate_queryset(responses, request)
-        serializer = ResponseSerializer(page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        page = paginator.paginate_queryset(rank_responses(form, terms, candidates), request)
+
+        response_ids = [response_id for response_id, _ in page]
+        responses = form.responses.filter(pk__in=response_ids).prefetch_related('answers__question', 'answers__selected_choices')
+        serialized = {item['id']: item for item in ResponseSerializer(responses, many=True).data}
+        snippets = search_snippets(form, terms, response_ids)
+        results = []
+        for response_id, score in page:
+            if response_id in serialized:
+                question_id, snippet = snippets.get(response_id, (None, ''))
+                results.append({**serialized[response_id], 'search': {'score': score, 'question': question_id, 'snippet': snippet}})
+        return paginator.get_paginated_response(results)
+
+    @action(detail=True, methods=['get'])
+    def spreadsheet(self, request, pk=None):
+        """A sorted window of responses pivoted into one cell per requested question."""
+        form = self.get_object()
+        query = SpreadsheetQuerySerializer(data=request.query_params, context={'form': form})
+        query.is_valid(raise_exception=True)
+        params = dict(query.validated_data)
+        response_filter = {key: params.pop(key) for key in ('predicates', 'start', 'end') if key in params}
+        responses = filter_responses(form.responses.all(), **response_filter)
+        count = responses.count() if response_filter else _stored_response_count(form)
+        return DRFResponse({'count': count, **build_spreadsheet(form, responses, request=request, **params)})
+
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, pk=None):
+        """Per-question aggregates over all responses, or over those matching a filter."""
+        form = self.get_object()
+        top_n = _get_positive_int_query_param(request.query_params, 'top', 5, maximum=50)
+        response_filter = self._response_filter(request, form)
+        responses = filter_responses(form.responses.all(), **response_filter) if response_filter else None
+        days = None
+        if response_filter and 'predicates' not in response_filter:
+            days = whole_days(response_filter.get('start'), response_filter.get('end'))
+        return DRFResponse(build_form_analytics(form, top_n=top_n, responses=responses, days=days))
+
+    @action(detail=True, methods=['get'])
+    def trends(self, request, pk=None):
+        """Submission counts per hour/day/week/month, read from the bucket rollups."""
+        form = self.get_object()
+        query = TrendQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return DRFResponse(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        granularity = query.validated_data['granularity']
+        return DRFResponse({
+            'granularity': granularity,
+            'series': submission_trend(
+                form, granularity, query.validated_data.get('start'), query.validated_data.get('end'),
+            ),
+        })
+
+    def _export_response(self, request, form, query_params):
+        """Streamed export for ``ExportQuerySerializer`` parameters.
+
+        ``?compression=`` downloads a compressed file (``.csv.gz``); otherwise the
+        body is compressed in transit with ``Content-Encoding`` when the client's
+        ``Accept-Encoding`` allows it. ``?since=`` makes it a delta export (see
+        ``deltas``) whose next cursor is sent in ``X-Export-Cursor``.
+        """
+        query = ExportQuerySerializer(data=query_params, context={'form': form})
+        query.is_valid(raise_exception=True)
+        params = dict(query.validated_data)
+        delta = 'since' in params
+        fmt, compression, since = params.pop('type'), params.pop('compression', None), params.pop('since', None)
+        export_format = EXPORT_FORMATS[fmt]
+        responses = filter_responses(form.responses.all(), **params)
+        if delta:
+            responses, mark = delta_responses(responses, since)
+        chunks = iter_export(form, responses, fmt, request, by_id=delta)
+
+        if compression:
+            response = StreamingHttpResponse(compress(chunks, compression), content_type=COMPRESSIONS[compression].content_type)
+        else:
+            encoding = negotiate_compression(request.META.get('HTTP_ACCEPT_ENCODING', '')) if export_format.compressible else None
+            response = StreamingHttpResponse(
+                compress(chunks, encoding) if encoding else chunks, content_type=export_format.content_type,
+            )
+            if encoding:
+                response['Content-Encoding'] = COMPRESSIONS[encoding].encoding
+            patch_vary_headers(response, ['Accept-Encoding'])
+        response['Content-Disposition'] = f'attachment; filename="{_export_filename(form, fmt, compression)}"'
+        if delta:
+            response['X-Export-Cursor'] = '' if mark is None else str(mark)
+        return response
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """Stream the (optionally filtered) responses as CSV, NDJSON, Arrow or Parquet (``?type=``)."""
+        return self._export_response(request, self.get_object(), request.query_params)
 
     @action(detail=True, methods=['get'])
     def export_csv(self, request, pk=None):
+        query_params = request.query_params.copy()
+        query_params['type'] = 'csv'
+        return self._export_response(request, self.get_object(), query_params)
+
+    @action(detail=True, methods=['get'])
+    def export_media(self, request, pk=None):
+        """Stream a ZIP of the (optionally filtered) responses' uploads, with ``?include_csv=true`` adding the CSV."""
         form = self.get_object()
+        query = MediaExportQuerySerializer(data=request.query_params, context={'form': form})
+        query.is_valid(raise_exception=True)
+        params = dict(query.validated_data)
+        include_csv = params.pop('include_csv')
+        responses = filter_responses(form.responses.all(), **params)
+        response = StreamingHttpResponse(iter_media_zip(form, responses, include_csv, request), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{_safe_title(form)}_media.zip"'
+        return response
 
-        def csv_rows():
-            output = io.StringIO()
-            writer = csv.writer(output)
-
-            # Headers
-            headers = ['Response ID', 'Submitted At']
-            questions = []
-            for section in form.sections.prefetch_related('questions').all():
-                for question in section.questions.all():
-                    headers.append(question.text)
-                    questions.append(question)
-            writer.writerow(headers)
-            yield output.getvalue()
-            output.seek(0)
-            output.truncate(0)
-
-            # Rows
-            responses = form.responses.select_related().prefetch_related(
-                'answers__question', 'answers__selected_choices'
-            ).order_by('-created_at')
-
-            for r in responses:
-                row = [r.id, r.created_at.strftime('%Y-%m-%d %H:%M:%S')]
-                answers_map = {a.question_id: a for a in r.answers.all()}
-                for q in questions:
-                    answer = answers_map.get(q.id)
-                    if not answer:
-                        row.append('')
-                    elif q.question_type in ['multiple_choice', 'multiple_select']:
-                        choices = [c.text for c in answer.selected_choices.all()]
-                        row.append(', '.join(choices))
-                    elif q.question_type == 'media':
-                        row.append(request.build_absolute_uri(answer.file_answer.url) if answer.file_answer else '')
-                    else:
-                        row.append(answer.text_answer or '')
-                writer.writerow(row)
-                yield output.getvalue()
-                output.seek(0)
-                output.truncate(0)
-
-        safe_title = form.title.replace('"', '').replace('\r', '').replace('\n', '')[:100]
-        response = StreamingHttpResponse(csv_rows(), content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="{safe_title}_responses.csv"'
+    @action(detail=True, methods=['get'])
+    def deletions(self, request, pk=None):
+        """Tombstones of deleted responses after ``?since=`` (a tombstone id), for delta export consumers."""
+        form = self.get_object()
+        query = DeletionLogQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        results, cursor, has_more = deletions_since(form, query.validated_data['since'], query.validated_data['page_size'])
+        return DRFResponse({'cursor': cursor, 'has_more': has_more, 'results': results})
+
+    @action(detail=True, methods=['post'])
+    def export_jobs(self, request, pk=None):
+        """Start a background export; takes the parameters of ``export`` (``filter`` as a JSON string)."""
+        form = self.get_object()
+        query = ExportQuerySerializer(data=request.data, context={'form': form})
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        if 'since' in params:
+            return DRFResponse({'since': ['Delta exports are streamed by the export endpoints.']}, status=status.HTTP_400_BAD_REQUEST)
+        job = create_export_job(
+            form, request.user, params['type'], params.get('compression', ''),
+            params.get('predicates', []), params.get('start'), params.get('end'),
+            base_uri=request.build_absolute_uri('/'),
+        )
+        return DRFResponse(ExportJobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+
+    def _export_job(self, form, job_id):
+        job = ExportJob.objects.filter(form=form, pk=job_id).first()
+        if job is None:
+            raise Http404
+        return job
+
+    @action(detail=True, methods=['get'], url_path=f'export_jobs/(?P<job_id>{_UUID_PATTERN})')
+    def export_job(self, request, pk=None, job_id=None):
+        job = self._export_job(self.get_object(), job_id)
+        return DRFResponse(ExportJobSerializer(job, context={'request': request}).data)
+
+    @action(detail=True, methods=['get'], url_path=f'export_jobs/(?P<job_id>{_UUID_PATTERN})/download')
+    def export_job_download(self, request, pk=None, job_id=None):
+        """Download a finished job's artifact; honours a single ``Range`` (and ``If-Range``)."""
+        form = self.get_object()
+        job = self._export_job(form, job_id)
+        if job.status != 'done':
+            return DRFResponse({'detail': 'The export is not finished.'}, status=status.HTTP_409_CONFLICT)
+        # Open first: eviction may unlink the artifact at any moment, but an open file stays readable
+        try:
+            artifact = open_artifact(job.artifact)
+        except FileNotFoundError:
+            return DRFResponse({'detail': 'The export has expired; start a new one.'}, status=status.HTTP_410_GONE)
+        size = os.fstat(artifact.fileno()).st_size
+
+        etag = f'"{job.artifact}"'
+        range_header = request.META.get('HTTP_RANGE')
+        if request.META.get('HTTP_IF_RANGE', etag) != etag:
+            range_header = None
+        try:
+            byte_range = parse_range(range_header, size)
+        except UnsatisfiableRange:
+            artifact.close()
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        start, end = byte_range or (0, size - 1)
+        content_type = COMPRESSIONS[job.compression].content_type if job.compression else EXPORT_FORMATS[job.format].content_type
+        response = StreamingHttpResponse(
+            iter_file_range(artifact, start, end),
+            status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+            content_type=content_type,
+        )
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Content-Disposition'] = f'attachment; filename="{_export_filename(form, job.format, job.compression or None)}"'
         return response
 
 
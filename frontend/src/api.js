@@ -71,12 +71,21 @@ export const getForm = (id) => api.get('/forms/' + id + '/')
 export const getFormByShareId = (shareId) => api.get('/forms/by-share-id/' + shareId + '/')
 export const createForm = (data) => api.post('/forms/', data)
 export const updateForm = (id, data) => api.put('/forms/' + id + '/', data)
+export const applyFormOperations = (id, version, ops) => api.post('/forms/' + id + '/operations/', { version, ops })
 export const deleteForm = (id) => api.delete('/forms/' + id + '/')
 export const archiveForm = (id) => api.post('/forms/' + id + '/archive/')
 export const restoreForm = (id) => api.post('/forms/' + id + '/restore/')
 export const submitForm = (id, data) => api.post('/forms/' + id + '/submit/', data)
-export const getFormResponses = (id) => api.get('/forms/' + id + '/responses/')
-export const exportFormResponses = (id) => api.get('/forms/' + id + '/export_csv/', { responseType: 'blob' })  // Expect binary data
+export const getFormResponses = (id, params = {}) => api.get('/forms/' + id + '/responses/', { params })
+export const getFormSpreadsheet = (id, params = {}) => api.get('/forms/' + id + '/spreadsheet/', { params })
+export const getFormAnalytics = (id, params = {}) => api.get('/forms/' + id + '/analytics/', { params })
+export const getFormTrends = (id, params = {}) => api.get('/forms/' + id + '/trends/', { params })
+export const exportFormResponses = (id, params = {}) => api.get('/forms/' + id + '/export_csv/', { params, responseType: 'blob' })  // Expect binary data
+export const exportFormMedia = (id, params = {}) => api.get('/forms/' + id + '/export_media/', { params, responseType: 'blob' })
+export const getFormDeletions = (id, params = {}) => api.get('/forms/' + id + '/deletions/', { params })
+export const createExportJob = (id, data) => api.post('/forms/' + id + '/export_jobs/', data)
+export const getExportJob = (id, jobId) => api.get('/forms/' + id + '/export_jobs/' + jobId + '/')
+export const exportFormResponsesAs = (id, type, params = {}) => api.get('/forms/' + id + '/export/', { params: { ...params, type }, responseType: 'blob' })
 
 // Question media upload
 export const uploadQuestionMedia = (file) => {
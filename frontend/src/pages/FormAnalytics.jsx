@@ -1,19 +1,21 @@
 import { useEffect, useMemo, useRef, useState } from 'react'
 import { useParams, Link } from 'react-router-dom'
-import { getForm, getFormResponses } from '../api'
+import { getForm, getFormAnalytics, getFormTrends, exportFormResponses } from '../api'
 
-const COMMON_STOPWORDS = new Set([
-  'about', 'after', 'again', 'against', 'also', 'among', 'because', 'before', 'being', 'below',
-  'between', 'could', 'does', 'doing', 'during', 'from', 'have', 'having', 'just', 'more',
-  'most', 'other', 'over', 'same', 'some', 'such', 'than', 'that', 'their', 'there', 'these',
-  'they', 'this', 'those', 'through', 'very', 'what', 'when', 'where', 'which', 'while', 'with',
-  'would', 'your', 'you', 'the', 'and', 'for', 'are', 'not', 'was', 'were', 'can'
-])
+const CHOICE_TYPES = ['multiple_choice', 'multiple_select']
+const NUMERIC_TYPES = ['number', 'float']
+const TEXT_TYPES = ['short_text', 'long_text']
+// Question types the server-side response filter has predicates for
+const FILTERABLE_TYPES = [...CHOICE_TYPES, ...NUMERIC_TYPES, ...TEXT_TYPES]
+const NUMERIC_OPERATORS = { '=': 'eq', '>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte' }
+const FILTER_DEBOUNCE_MS = 300
 
 export default function FormAnalytics() {
   const { id } = useParams()
   const [form, setForm] = useState(null)
-  const [responses, setResponses] = useState([])
+  const [analytics, setAnalytics] = useState(null)
+  const [totalResponses, setTotalResponses] = useState(0)
+  const [trendSeries, setTrendSeries] = useState([])
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
   const [trendMode, setTrendMode] = useState('daily')
@@ -23,25 +25,13 @@ export default function FormAnalytics() {
   const [filters, setFilters] = useState(() => [createEmptyFilter(1)])
 
   useEffect(() => {
-    loadData()
+    let cancelled = false
+    getForm(id)
+      .then(formData => { if (!cancelled) setForm(formData.data) })
+      .catch(() => { if (!cancelled) setError('Failed to load analytics data.') })
+    return () => { cancelled = true }
   }, [id])
 
-  async function loadData() {
-    try {
-      const [formData, responsesData] = await Promise.all([
-        getForm(id),
-        getFormResponses(id)
-      ])
-      setForm(formData.data)
-      const rData = responsesData.data
-      setResponses(rData.results || rData)
-    } catch (err) {
-      setError('Failed to load analytics data.')
-    } finally {
-      setLoading(false)
-    }
-  }
-
   const questionEntries = useMemo(() => {
     if (!form) return []
     return form.sections.flatMap(section =>
@@ -62,43 +52,74 @@ export default function FormAnalytics() {
     [filters, questionById]
   )
 
-  const filteredResponses = useMemo(() => {
-    if (!activeFilters.length) return responses
+  // Query string for the server-side response filter; '' when nothing is filtered
+  const filterQuery = useMemo(() => {
+    const predicates = activeFilters.map(filter => toPredicate(filter, questionById[String(filter.questionId)]))
+    return predicates.length ? JSON.stringify(predicates) : ''
+  }, [activeFilters, questionById])
 
-    return responses.filter(response =>
-      activeFilters.every(filter => {
-        const question = questionById[String(filter.questionId)]
-        if (!question) return true
-        return matchesResponseFilter(response, question, filter)
-      })
-    )
-  }, [responses, questionById, activeFilters])
+  useEffect(() => {
+    let cancelled = false
+    const timer = setTimeout(async () => {
+      try {
+        const { data } = await getFormAnalytics(id, filterQuery ? { filter: filterQuery } : {})
+        if (cancelled) return
+        setAnalytics(data)
+        if (!filterQuery) setTotalResponses(data.response_count)
+      } catch (err) {
+        if (!cancelled) setError('Failed to load analytics data.')
+      } finally {
+        if (!cancelled) setLoading(false)
+      }
+    }, filterQuery ? FILTER_DEBOUNCE_MS : 0)
+    return () => {
+      cancelled = true
+      clearTimeout(timer)
+    }
+  }, [id, filterQuery])
 
-  const trendSeries = useMemo(
-    () => buildTrendSeries(filteredResponses, trendMode),
-    [filteredResponses, trendMode]
-  )
+  useEffect(() => {
+    let cancelled = false
+    getFormTrends(id, { granularity: trendMode === 'weekly' ? 'week' : 'day' })
+      .then(({ data }) => { if (!cancelled) setTrendSeries(buildTrendSeries(data.series, trendMode)) })
+      .catch(() => { if (!cancelled) setTrendSeries([]) })
+    return () => { cancelled = true }
+  }, [id, trendMode])
+
+  const analyticsById = useMemo(() => {
+    const byId = {}
+    for (const item of analytics?.questions || []) {
+      byId[item.id] = item
+    }
+    return byId
+  }, [analytics])
 
-  function downloadFilteredCSV(requestedName) {
+  const responseCount = analytics?.response_count ?? 0
+
+  async function downloadFilteredCSV(requestedName) {
     const defaultName = `${sanitizeFilename(form?.title || 'form')}_filtered_analytics`
     const finalName = sanitizeFilename((requestedName || '').trim()) || defaultName
-    const csv = buildAnalyticsCsv(filteredResponses, questionEntries, form.sections.length > 1)
-
-    const blob = new Blob([csv], { type: 'text/csv;charset=utf-8;' })
-    const url = window.URL.createObjectURL(blob)
-    const link = document.createElement('a')
-    link.href = url
-    link.setAttribute('download', `${finalName}.csv`)
-    document.body.appendChild(link)
-    link.click()
-    link.remove()
-    window.URL.revokeObjectURL(url)
+
+    try {
+      const response = await exportFormResponses(id, filterQuery ? { filter: filterQuery } : {})
+      const url = window.URL.createObjectURL(new Blob([response.data], { type: 'text/csv;charset=utf-8;' }))
+      const link = document.createElement('a')
+      link.href = url
+      link.setAttribute('download', `${finalName}.csv`)
+      document.body.appendChild(link)
+      link.click()
+      link.remove()
+      window.URL.revokeObjectURL(url)
+    } catch (err) {
+      console.error('Failed to export CSV', err)
+      alert('Failed to export CSV')
+    }
     setShowExportModal(false)
     setExportFileName('')
   }
 
   function handleExportFilteredCSV() {
-    if (!filteredResponses.length) return
+    if (!responseCount) return
     setExportFileName('')
     setShowExportModal(true)
   }
@@ -119,7 +140,6 @@ export default function FormAnalytics() {
       questionId,
       choiceId: '',
       textQuery: '',
-      mediaMode: '',
       numericOperator: '=',
       numericValue: ''
     })
@@ -145,8 +165,8 @@ export default function FormAnalytics() {
     nextFilterIdRef.current = 2
   }
 
-  if (loading) return <div className="loading"><div className="spinner" /></div>
   if (error) return <div className="empty-state"><h2>{error}</h2></div>
+  if (loading || !form) return <div className="loading"><div className="spinner" /></div>
 
   return (
     <div className="dashboard analytics-page">
@@ -154,12 +174,12 @@ export default function FormAnalytics() {
         <div>
           <h1>Analytics: {form.title}</h1>
           <span className="form-count">
-            {filteredResponses.length} response{filteredResponses.length !== 1 ? 's' : ''}
-            {activeFilters.length ? ` (filtered from ${responses.length})` : ' total'}
+            {responseCount} response{responseCount !== 1 ? 's' : ''}
+            {activeFilters.length ? ` (filtered from ${totalResponses})` : ' total'}
           </span>
         </div>
         <div style={{ display: 'flex', gap: '8px' }}>
-          <button className="btn btn-primary" onClick={handleExportFilteredCSV} disabled={!filteredResponses.length}>
+          <button className="btn btn-primary" onClick={handleExportFilteredCSV} disabled={!responseCount}>
             ⬇ Export Filtered CSV
           </button>
           <Link to={`/forms/${id}/responses`} className="btn btn-secondary">
@@ -172,7 +192,7 @@ export default function FormAnalytics() {
       </div>
 
       <div className="analytics-kpis">
-        <KpiCard title="Total Responses" value={filteredResponses.length} />
+        <KpiCard title="Total Responses" value={responseCount} />
         <KpiCard title="Questions" value={questionEntries.length} />
         <KpiCard title="Sections" value={form.sections.length} />
       </div>
@@ -205,7 +225,7 @@ export default function FormAnalytics() {
                     onChange={(event) => handleFilterQuestionChange(filter.id, event.target.value)}
                   >
                     <option value="">Select question</option>
-                    {questionEntries.map(({ section, question }) => (
+                    {questionEntries.filter(({ question }) => FILTERABLE_TYPES.includes(question.question_type)).map(({ section, question }) => (
                       <option key={question.id} value={question.id}>
                         {form.sections.length > 1 ? `${section.title} · ` : ''}{question.text}
                       </option>
@@ -228,20 +248,6 @@ export default function FormAnalytics() {
                   </div>
                 )}
 
-                {selectedFilterQuestion && selectedFilterQuestion.question_type === 'media' && (
-                  <div className="analytics-filter-field">
-                    <label>Upload Status</label>
-                    <select
-                      value={filter.mediaMode}
-                      onChange={(event) => updateFilter(filter.id, { mediaMode: event.target.value })}
-                    >
-                      <option value="">Any</option>
-                      <option value="with_file">Has uploaded file</option>
-                      <option value="without_file">No uploaded file</option>
-                    </select>
-                  </div>
-                )}
-
                 {selectedFilterQuestion && (selectedFilterQuestion.question_type === 'number' || selectedFilterQuestion.question_type === 'float') && (
                   <>
                     <div className="analytics-filter-field">
@@ -251,7 +257,6 @@ export default function FormAnalytics() {
                         onChange={(event) => updateFilter(filter.id, { numericOperator: event.target.value })}
                       >
                         <option value="=">= (equals)</option>
-                        <option value="!=">!= (not equal)</option>
                         <option value=">">&gt; (greater than)</option>
                         <option value=">=">&gt;= (at least)</option>
                         <option value="<">&lt; (less than)</option>
@@ -271,7 +276,7 @@ export default function FormAnalytics() {
                   </>
                 )}
 
-                {selectedFilterQuestion && selectedFilterQuestion.question_type !== 'multiple_choice' && selectedFilterQuestion.question_type !== 'multiple_select' && selectedFilterQuestion.question_type !== 'media' && selectedFilterQuestion.question_type !== 'number' && selectedFilterQuestion.question_type !== 'float' && (
+                {selectedFilterQuestion && TEXT_TYPES.includes(selectedFilterQuestion.question_type) && (
                   <div className="analytics-filter-field">
                     <label>Text Contains</label>
                     <input
@@ -323,6 +328,11 @@ export default function FormAnalytics() {
           </div>
         </div>
         <TrendChart series={trendSeries} />
+        {activeFilters.length > 0 && (
+          <div className="analytics-footnote" style={{ marginTop: '10px' }}>
+            Trends count all responses; filters apply to the totals and questions.
+          </div>
+        )}
       </div>
 
       <div className="summary-view">
@@ -334,7 +344,8 @@ export default function FormAnalytics() {
               <QuestionAnalytics
                 key={question.id}
                 question={question}
-                responses={filteredResponses}
+                item={analyticsById[question.id]}
+                responseCount={responseCount}
               />
             ))}
           </div>
@@ -385,7 +396,6 @@ function createEmptyFilter(id) {
     questionId: '',
     choiceId: '',
     textQuery: '',
-    mediaMode: '',
     numericOperator: '=',
     numericValue: ''
   }
@@ -394,57 +404,32 @@ function createEmptyFilter(id) {
 function isFilterActive(filter, question) {
   if (!question || !filter.questionId) return false
 
-  if (question.question_type === 'multiple_choice' || question.question_type === 'multiple_select') {
+  if (CHOICE_TYPES.includes(question.question_type)) {
     return Boolean(filter.choiceId)
   }
 
-  if (question.question_type === 'media') {
-    return Boolean(filter.mediaMode)
+  if (NUMERIC_TYPES.includes(question.question_type)) {
+    return Number.isFinite(parseFloat(filter.numericValue))
   }
 
-  if (question.question_type === 'number' || question.question_type === 'float') {
-    return (filter.numericValue || '').trim().length > 0
+  if (TEXT_TYPES.includes(question.question_type)) {
+    return (filter.textQuery || '').trim().length > 0
   }
 
-  return (filter.textQuery || '').trim().length > 0
+  return false
 }
 
-function matchesResponseFilter(response, question, filter) {
-  const answer = response.answers.find(item => String(item.question) === String(question.id))
-
-  if (question.question_type === 'multiple_choice' || question.question_type === 'multiple_select') {
-    if (!filter.choiceId) return true
-    const selectedChoices = Array.isArray(answer?.selected_choices) ? answer.selected_choices : []
-    return selectedChoices.some(choiceId => String(choiceId) === String(filter.choiceId))
-  }
-
-  if (question.question_type === 'media') {
-    if (!filter.mediaMode) return true
-    const hasFile = Boolean(answer?.file_answer)
-    return filter.mediaMode === 'with_file' ? hasFile : !hasFile
+// One {question, op, value} predicate of the server-side response filter
+function toPredicate(filter, question) {
+  if (CHOICE_TYPES.includes(question.question_type)) {
+    return { question: question.id, op: 'choice_in', value: [Number(filter.choiceId)] }
   }
 
-  if (question.question_type === 'number' || question.question_type === 'float') {
-    const numericValue = (filter.numericValue || '').trim()
-    if (!numericValue) return true
-    const answerNum = parseFloat(answer?.text_answer)
-    const filterNum = parseFloat(numericValue)
-    if (isNaN(answerNum) || isNaN(filterNum)) return false
-    switch (filter.numericOperator) {
-      case '=':  return answerNum === filterNum
-      case '!=': return answerNum !== filterNum
-      case '>':  return answerNum > filterNum
-      case '>=': return answerNum >= filterNum
-      case '<':  return answerNum < filterNum
-      case '<=': return answerNum <= filterNum
-      default:   return true
-    }
+  if (NUMERIC_TYPES.includes(question.question_type)) {
+    return { question: question.id, op: NUMERIC_OPERATORS[filter.numericOperator], value: parseFloat(filter.numericValue) }
   }
 
-  const query = (filter.textQuery || '').trim().toLowerCase()
-  if (!query) return true
-  const text = (answer?.text_answer || '').toLowerCase()
-  return text.includes(query)
+  return { question: question.id, op: 'contains', value: filter.textQuery.trim() }
 }
 
 function KpiCard({ title, value }) {
@@ -486,50 +471,36 @@ function TrendChart({ series }) {
   )
 }
 
-function QuestionAnalytics({ question, responses }) {
-  const answers = responses.flatMap(response =>
-    response.answers.filter(answer => answer.question === question.id)
-  )
+function QuestionAnalytics({ question, item, responseCount }) {
+  // Questions added since the aggregates were computed have no entry yet
+  if (!item) return null
 
   return (
     <div className="summary-card">
       <div className="summary-question">{question.text}</div>
       <div className="summary-stats">
-        {(question.question_type === 'multiple_choice' || question.question_type === 'multiple_select') ? (
-          <ChoiceAnalytics question={question} answers={answers} responses={responses} />
+        {CHOICE_TYPES.includes(question.question_type) ? (
+          <ChoiceAnalytics question={question} item={item} responseCount={responseCount} />
+        ) : NUMERIC_TYPES.includes(question.question_type) ? (
+          <NumericAnalytics item={item} />
         ) : question.question_type === 'media' ? (
-          <MediaAnalytics answers={answers} />
+          <MediaAnalytics item={item} />
         ) : (
-          <TextAnalytics answers={answers} />
+          <TextAnalytics item={item} />
         )}
       </div>
     </div>
   )
 }
 
-function ChoiceAnalytics({ question, answers, responses }) {
-  const counts = {}
-  question.choices.forEach(choice => {
-    counts[choice.id] = 0
-  })
-
-  answers.forEach(answer => {
-    const selectedChoices = Array.isArray(answer.selected_choices) ? answer.selected_choices : []
-    selectedChoices.forEach(choiceId => {
-      counts[choiceId] = (counts[choiceId] || 0) + 1
-    })
-  })
-
-  const answeredResponses = answers.filter(
-    answer => Array.isArray(answer.selected_choices) && answer.selected_choices.length > 0
-  ).length
+function ChoiceAnalytics({ question, item, responseCount }) {
+  const answeredResponses = item.answered_count
 
   return (
     <div>
-      {question.choices.map(choice => {
-        const count = counts[choice.id] || 0
-        const denominator = question.question_type === 'multiple_select' ? responses.length : Math.max(answeredResponses, 1)
-        const percent = denominator > 0 ? Math.round((count / denominator) * 100) : 0
+      {(item.choices || []).map(choice => {
+        const denominator = question.question_type === 'multiple_select' ? responseCount : Math.max(answeredResponses, 1)
+        const percent = denominator > 0 ? Math.round((choice.count / denominator) * 100) : 0
 
         return (
           <div key={choice.id} className="chart-row">
@@ -543,187 +514,127 @@ function ChoiceAnalytics({ question, answers, responses }) {
       })}
       <div className="analytics-footnote">
         {question.question_type === 'multiple_select'
-          ? `Selection frequency across ${responses.length} response${responses.length !== 1 ? 's' : ''}`
+          ? `Selection frequency across ${responseCount} response${responseCount !== 1 ? 's' : ''}`
           : `${answeredResponses} answered response${answeredResponses !== 1 ? 's' : ''}`}
       </div>
     </div>
   )
 }
 
-function MediaAnalytics({ answers }) {
-  const uploadCount = answers.filter(answer => Boolean(answer.file_answer)).length
-
-  return (
-    <div>
-      <div className="analytics-kpi-value" style={{ fontSize: '1.8rem' }}>{uploadCount}</div>
-      <div className="analytics-footnote">
-        file{uploadCount !== 1 ? 's' : ''} uploaded
-      </div>
-    </div>
-  )
-}
-
-function TextAnalytics({ answers }) {
-  const textValues = answers
-    .map(answer => (answer.text_answer || '').trim())
-    .filter(Boolean)
-
-  if (!textValues.length) {
+function NumericAnalytics({ item }) {
+  const numeric = item.numeric || {}
+  if (!item.answered_count || numeric.min == null) {
     return (
       <div className="analytics-footnote">
-        No text responses yet.
+        No numeric responses yet.
       </div>
     )
   }
 
-  const groupedAnswers = {}
-  textValues.forEach(text => {
-    groupedAnswers[text] = (groupedAnswers[text] || 0) + 1
-  })
-
-  const topAnswers = Object.entries(groupedAnswers)
-    .sort((a, b) => b[1] - a[1])
-    .slice(0, 5)
-
-  const keywordCounts = extractKeywords(textValues)
+  const histogram = numeric.histogram || []
+  const maxCount = Math.max(...histogram.map(bin => bin.count), 1)
+  const stats = [
+    ['Mean', numeric.mean],
+    ['Min', numeric.min],
+    ['Median', numeric.percentiles?.p50],
+    ['90th percentile', numeric.percentiles?.p90],
+    ['99th percentile', numeric.percentiles?.p99],
+    ['Max', numeric.max],
+  ]
 
   return (
     <div className="analytics-text-grid">
       <div>
-        <div className="analytics-subtitle">Top responses</div>
-        {topAnswers.map(([text, count]) => (
-          <div key={text} className="chart-row">
-            <div className="chart-label analytics-text-label" title={text}>
-              {text}
-            </div>
-            <div className="chart-count">{count}</div>
+        <div className="analytics-subtitle">Summary</div>
+        {stats.map(([label, value]) => (
+          <div key={label} className="chart-row">
+            <div className="chart-label analytics-text-label">{label}</div>
+            <div className="chart-count">{formatNumber(value)}</div>
           </div>
         ))}
       </div>
 
       <div>
-        <div className="analytics-subtitle">Top keywords</div>
-        {keywordCounts.length === 0 ? (
-          <div className="analytics-footnote">No strong keywords found.</div>
-        ) : (
-          keywordCounts.slice(0, 8).map(([keyword, count]) => (
-            <div key={keyword} className="chart-row">
-              <div className="chart-label analytics-text-label">{keyword}</div>
-              <div className="chart-count">{count}</div>
+        <div className="analytics-subtitle">Distribution</div>
+        {histogram.map(bin => (
+          <div key={bin.start} className="chart-row">
+            <div className="chart-label" title={`${bin.start} to ${bin.end}`}>
+              {formatNumber(bin.start)} – {formatNumber(bin.end)}
             </div>
-          ))
-        )}
+            <div className="chart-bar-container">
+              <div className="chart-bar-fill" style={{ width: `${Math.round((bin.count / maxCount) * 100)}%` }} />
+            </div>
+            <div className="chart-count">{bin.count}</div>
+          </div>
+        ))}
+        <div className="analytics-footnote">
+          {item.answered_count} answered response{item.answered_count !== 1 ? 's' : ''}; percentiles are within 1%
+        </div>
       </div>
     </div>
   )
 }
 
-function extractKeywords(textValues) {
-  const tokenCounts = {}
-
-  textValues.forEach(text => {
-    text
-      .toLowerCase()
-      .split(/[^a-z0-9]+/)
-      .filter(token => token.length >= 4)
-      .filter(token => !COMMON_STOPWORDS.has(token))
-      .forEach(token => {
-        tokenCounts[token] = (tokenCounts[token] || 0) + 1
-      })
-  })
+function MediaAnalytics({ item }) {
+  const uploadCount = item.answered_count
 
-  return Object.entries(tokenCounts).sort((a, b) => b[1] - a[1])
+  return (
+    <div>
+      <div className="analytics-kpi-value" style={{ fontSize: '1.8rem' }}>{uploadCount}</div>
+      <div className="analytics-footnote">
+        file{uploadCount !== 1 ? 's' : ''} uploaded
+      </div>
+    </div>
+  )
 }
 
-function buildTrendSeries(responses, trendMode) {
-  const grouped = {}
-
-  responses.forEach(response => {
-    const createdAt = new Date(response.created_at)
-    if (Number.isNaN(createdAt.getTime())) return
-
-    if (trendMode === 'weekly') {
-      const weekStart = getWeekStart(createdAt)
-      const key = weekStart.toISOString().slice(0, 10)
-      grouped[key] = (grouped[key] || 0) + 1
-      return
-    }
+function TextAnalytics({ item }) {
+  const topAnswers = item.top_responses || []
 
-    const dayKey = createdAt.toISOString().slice(0, 10)
-    grouped[dayKey] = (grouped[dayKey] || 0) + 1
-  })
-
-  return Object.entries(grouped)
-    .sort((a, b) => new Date(a[0]) - new Date(b[0]))
-    .map(([key, count]) => {
-      const date = new Date(key)
-      return {
-        key,
-        count,
-        label: trendMode === 'weekly'
-          ? `Week of ${date.toLocaleDateString()}`
-          : date.toLocaleDateString()
-      }
-    })
-}
+  if (!topAnswers.length) {
+    return (
+      <div className="analytics-footnote">
+        No text responses yet.
+      </div>
+    )
+  }
 
-function getWeekStart(date) {
-  const copy = new Date(date)
-  const day = copy.getDay()
-  copy.setHours(0, 0, 0, 0)
-  copy.setDate(copy.getDate() - day)
-  return copy
+  return (
+    <div>
+      <div className="analytics-subtitle">Top responses</div>
+      {topAnswers.map(answer => (
+        <div key={answer.text} className="chart-row">
+          <div className="chart-label analytics-text-label" title={answer.text}>
+            {answer.text}
+          </div>
+          <div className="chart-count" title={answer.error ? `May overcount by up to ${answer.error}` : undefined}>
+            {answer.error ? '≤ ' : ''}{answer.count}
+          </div>
+        </div>
+      ))}
+      <div className="analytics-footnote">
+        {item.answered_count} answered response{item.answered_count !== 1 ? 's' : ''}
+      </div>
+    </div>
+  )
 }
 
-function buildAnalyticsCsv(responses, questionEntries, includeSectionTitle) {
-  const headers = ['Submitted At', ...questionEntries.map(({ section, question }) => (
-    includeSectionTitle ? `${section.title} - ${question.text}` : question.text
-  ))]
-
-  const rows = responses.map(response => {
-    const cells = [new Date(response.created_at).toLocaleString()]
-
-    questionEntries.forEach(({ question }) => {
-      const answer = response.answers.find(item => String(item.question) === String(question.id))
-      cells.push(formatCsvAnswer(answer, question))
-    })
-
-    return cells
+function buildTrendSeries(series, trendMode) {
+  return series.map(({ start, count }) => {
+    // Periods are UTC days or Sunday-started weeks
+    const date = new Date(`${String(start).slice(0, 10)}T00:00:00Z`)
+    const label = date.toLocaleDateString(undefined, { timeZone: 'UTC' })
+    return {
+      key: String(start),
+      count,
+      label: trendMode === 'weekly' ? `Week of ${label}` : label
+    }
   })
-
-  return [headers, ...rows]
-    .map(row => row.map(escapeCsvValue).join(','))
-    .join('\n')
-}
-
-function formatCsvAnswer(answer, question) {
-  if (!answer) return ''
-
-  if (question.question_type === 'multiple_choice' || question.question_type === 'multiple_select') {
-    const selectedChoices = Array.isArray(answer.selected_choices) ? answer.selected_choices : []
-    if (!selectedChoices.length) return ''
-
-    const choiceTextById = {}
-    question.choices.forEach(choice => {
-      choiceTextById[String(choice.id)] = choice.text
-    })
-
-    return selectedChoices
-      .map(choiceId => choiceTextById[String(choiceId)] || String(choiceId))
-      .join(' | ')
-  }
-
-  if (question.question_type === 'media') {
-    return answer.file_answer || ''
-  }
-
-  return answer.text_answer || ''
 }
 
-function escapeCsvValue(value) {
-  const safeValue = String(value ?? '')
-  const escaped = safeValue.replace(/"/g, '""')
-  return `"${escaped}"`
+function formatNumber(value) {
+  if (value == null) return '—'
+  return Number(value).toLocaleString(undefined, { maximumFractionDigits: 2 })
 }
 
 function sanitizeFilename(value) {
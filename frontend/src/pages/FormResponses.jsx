@@ -1,11 +1,15 @@
 import { useState, useEffect, useMemo } from 'react'
 import { useParams, Link } from 'react-router-dom'
-import { getForm, getFormResponses, exportFormResponses } from '../api'
+import { getForm, getFormAnalytics, getFormResponses, exportFormResponses } from '../api'
+
+// Responses fetched per keyset page of the compact layout
+const PAGE_SIZE = 25
 
 export default function FormResponses() {
   const { id } = useParams()
   const [form, setForm] = useState(null)
-  const [responses, setResponses] = useState([])
+  const [analytics, setAnalytics] = useState(null)
+  const [page, setPage] = useState({ count: 0, columns: [], rows: [], nextCursor: null })
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
   const [activeTab, setActiveTab] = useState('summary')
@@ -14,10 +18,15 @@ export default function FormResponses() {
     let cancelled = false
     async function load() {
       try {
-        const [formRes, responsesRes] = await Promise.all([getForm(id), getFormResponses(id)])
+        const [formRes, analyticsRes, responsesRes] = await Promise.all([
+          getForm(id),
+          getFormAnalytics(id),
+          getFormResponses(id, { layout: 'compact', cursor: '', page_size: PAGE_SIZE }),
+        ])
         if (!cancelled) {
           setForm(formRes.data)
-          setResponses(responsesRes.data.results || responsesRes.data)
+          setAnalytics(analyticsRes.data)
+          setPage(compactPage(responsesRes.data))
         }
       } catch (err) {
         if (!cancelled) setError('Failed to load data.')
@@ -29,6 +38,13 @@ export default function FormResponses() {
     return () => { cancelled = true }
   }, [id])
 
+  async function loadMoreResponses() {
+    if (!page.nextCursor) return
+    const { data } = await getFormResponses(id, { layout: 'compact', cursor: page.nextCursor, page_size: PAGE_SIZE })
+    const next = compactPage(data)
+    setPage(current => ({ ...next, rows: [...current.rows, ...next.rows] }))
+  }
+
   // Create lookup for questions — must be before any early returns
   const { questionsMap, choicesMap } = useMemo(() => {
     const qMap = {}
@@ -67,12 +83,14 @@ export default function FormResponses() {
   if (loading) return <div className="loading"><div className="spinner" /></div>
   if (error) return <div className="empty-state"><h2>{error}</h2></div>
 
+  const responseCount = analytics.response_count
+
   return (
     <div className="dashboard">
       <div className="dashboard-header">
         <div>
            <h1>Responses: {form.title}</h1>
-           <span className="form-count">{responses.length} response{responses.length !== 1 ? 's' : ''}</span>
+           <span className="form-count">{responseCount} response{responseCount !== 1 ? 's' : ''}</span>
         </div>
         <div style={{ display: 'flex', gap: '8px' }}>
           <Link
@@ -108,42 +126,51 @@ export default function FormResponses() {
         </button>
       </div>
 
-      {responses.length === 0 ? (
+      {responseCount === 0 ? (
         <div className="empty-state">
            <div className="empty-icon">📭</div>
            <h2>No responses yet</h2>
            <p>Share your form link to get started!</p>
         </div>
       ) : activeTab === 'summary' ? (
-        <SummaryView 
-          form={form} 
-          responses={responses} 
-          choicesMap={choicesMap} 
+        <SummaryView
+          form={form}
+          analytics={analytics}
         />
       ) : (
-        <IndividualView 
-          responses={responses} 
-          questionsMap={questionsMap} 
-          choicesMap={choicesMap} 
+        <IndividualView
+          page={page}
+          onLoadMore={loadMoreResponses}
+          questionsMap={questionsMap}
+          choicesMap={choicesMap}
         />
       )}
     </div>
   )
 }
 
-function SummaryView({ form, responses, choicesMap }) {
+// {count, columns, rows, nextCursor} from a compact keyset page of the responses endpoint
+function compactPage(data) {
+  return { count: data.count, columns: data.columns, rows: data.results, nextCursor: data.next_cursor }
+}
+
+function SummaryView({ form, analytics }) {
+  const byId = {}
+  analytics.questions.forEach(item => {
+    byId[item.id] = item
+  })
+
   return (
     <div className="summary-view">
       {form.sections.map(section => (
         <div key={section.id}>
           {form.sections.length > 1 && <h2 style={{ marginBottom: '16px' }}>{section.title}</h2>}
-          
-          {section.questions.map(question => (
-            <SummaryQuestion 
-              key={question.id} 
-              question={question} 
-              responses={responses} 
-              choicesMap={choicesMap} 
+
+          {section.questions.map(question => byId[question.id] && (
+            <SummaryQuestion
+              key={question.id}
+              question={question}
+              item={byId[question.id]}
             />
           ))}
         </div>
@@ -152,89 +179,54 @@ function SummaryView({ form, responses, choicesMap }) {
   )
 }
 
-function SummaryQuestion({ question, responses, choicesMap }) {
-  // Aggregate data
-  const answers = responses.flatMap(r => 
-    r.answers.filter(a => a.question === question.id)
-  )
-
+function SummaryQuestion({ question, item }) {
   return (
     <div className="summary-card">
       <div className="summary-question">{question.text}</div>
       <div className="summary-stats">
         {question.question_type === 'multiple_choice' || question.question_type === 'multiple_select' ? (
-          <ChoiceStats 
-            question={question} 
-            answers={answers} 
-            choicesMap={choicesMap} 
-            totalResponses={responses.length}
-          />
+          <ChoiceStats item={item} />
         ) : question.question_type === 'media' ? (
-          <FileStats answers={answers} />
+          <FileStats item={item} />
+        ) : question.question_type === 'number' || question.question_type === 'float' ? (
+          <NumberStats item={item} />
         ) : (
-          <TextStats answers={answers} totalResponses={responses.length} />
+          <TextStats item={item} />
         )}
       </div>
     </div>
   )
 }
 
-function FileStats({ answers }) {
-  const fileAnswers = answers.filter(a => a.file_answer)
-  
+function FileStats({ item }) {
+  const uploads = item.answered_count
+
   return (
-    <div>
-      <div style={{ marginBottom: '12px', fontStyle: 'italic', color: 'var(--text-secondary)' }}>
-        {fileAnswers.length} file{fileAnswers.length !== 1 ? 's' : ''} uploaded
-      </div>
-      <div style={{ display: 'flex', flexDirection: 'column', gap: '8px' }}>
-        {fileAnswers.map(answer => (
-          <div key={answer.id} className="chart-row">
-            <a 
-              href={answer.file_answer} 
-              target="_blank" 
-              rel="noopener noreferrer"
-              style={{ color: 'var(--primary)', textDecoration: 'underline', overflow: 'hidden', textOverflow: 'ellipsis', whiteSpace: 'nowrap' }}
-            >
-              {answer.file_answer.split('/').pop()}
-            </a>
-          </div>
-        ))}
-      </div>
+    <div style={{ fontStyle: 'italic', color: 'var(--text-secondary)' }}>
+      {uploads} file{uploads !== 1 ? 's' : ''} uploaded
     </div>
   )
 }
 
-function ChoiceStats({ question, answers, choicesMap, totalResponses }) {
-  const counts = {}
-  question.choices.forEach(c => counts[c.id] = 0)
-  
-  answers.forEach(a => {
-    const selectedChoices = Array.isArray(a.selected_choices) ? a.selected_choices : []
-    selectedChoices.forEach(cId => {
-      counts[cId] = (counts[cId] || 0) + 1
-    })
-  })
-
-  const validAnswers = answers.filter(a => Array.isArray(a.selected_choices) && a.selected_choices.length > 0).length
+function ChoiceStats({ item }) {
+  const validAnswers = item.answered_count
 
   return (
     <div>
-      {question.choices.map(choice => {
-        const count = counts[choice.id] || 0
-        const displayPercent = validAnswers > 0 ? Math.round((count / validAnswers) * 100) : 0
-        
+      {item.choices.map(choice => {
+        const displayPercent = validAnswers > 0 ? Math.round((choice.count / validAnswers) * 100) : 0
+
         return (
           <div key={choice.id} className="chart-row">
             <div className="chart-label" title={choice.text}>{choice.text}</div>
             <div className="chart-bar-container">
-              <div 
-                className="chart-bar-fill" 
+              <div
+                className="chart-bar-fill"
                 style={{ width: `${displayPercent}%` }}
               />
             </div>
             <div className="chart-count">
-              {count}{validAnswers > 0 ? ` (${displayPercent}%)` : ''}
+              {choice.count}{validAnswers > 0 ? ` (${displayPercent}%)` : ''}
             </div>
           </div>
         )
@@ -246,51 +238,70 @@ function ChoiceStats({ question, answers, choicesMap, totalResponses }) {
   )
 }
 
-function TextStats({ answers, totalResponses }) {
-  // Group by text value
-  const groups = {}
-  answers.forEach(a => {
-    const text = a.text_answer || '(No answer)'
-    groups[text] = (groups[text] || 0) + 1
-  })
-  
-  const sortedGroups = Object.entries(groups).sort((a, b) => b[1] - a[1])
-  
+function NumberStats({ item }) {
+  const numeric = item.numeric || {}
+  const format = value => value == null ? '—' : Number(value).toLocaleString(undefined, { maximumFractionDigits: 2 })
+
   return (
     <div>
-      {sortedGroups.slice(0, 5).map(([text, count], i) => (
-        <div key={i} className="chart-row">
-          <div className="chart-label" style={{ width: 'auto', flex: 1 }}>"{text}"</div>
-          <div style={{ fontWeight: 500 }}>{count}</div>
+      {[['Mean', numeric.mean], ['Median', numeric.percentiles?.p50], ['Min', numeric.min], ['Max', numeric.max]].map(([label, value]) => (
+        <div key={label} className="chart-row">
+          <div className="chart-label" style={{ width: 'auto', flex: 1 }}>{label}</div>
+          <div style={{ fontWeight: 500 }}>{format(value)}</div>
         </div>
       ))}
-      {sortedGroups.length > 5 && (
-        <div style={{ fontSize: '0.85rem', color: 'var(--text-secondary)', marginTop: '8px' }}>
-          ...and {sortedGroups.length - 5} more unique answers
+      <div style={{ marginTop: '12px', fontSize: '0.85rem', color: 'var(--text-secondary)' }}>
+        {item.answered_count} responses
+      </div>
+    </div>
+  )
+}
+
+function TextStats({ item }) {
+  return (
+    <div>
+      {item.top_responses.map(answer => (
+        <div key={answer.text} className="chart-row">
+          <div className="chart-label" style={{ width: 'auto', flex: 1 }}>"{answer.text}"</div>
+          <div style={{ fontWeight: 500 }}>{answer.count}</div>
         </div>
-      )}
+      ))}
       <div style={{ marginTop: '12px', fontSize: '0.85rem', color: 'var(--text-secondary)' }}>
-        {answers.length} responses
+        {item.answered_count} responses
       </div>
     </div>
   )
 }
 
-function IndividualView({ responses, questionsMap, choicesMap }) {
+function IndividualView({ page, onLoadMore, questionsMap, choicesMap }) {
   const [index, setIndex] = useState(0)
-  
-  // Sort responses by date desc? They come from API desc.
-  const response = responses[index]
-  const total = responses.length
+  const [loadingMore, setLoadingMore] = useState(false)
+
+  // Compact rows are [id, created_at, value, ...] with values lined up with page.columns, newest first
+  const row = page.rows[index]
+  const total = page.count ?? page.rows.length
 
   function prev() {
     setIndex(i => Math.max(0, i - 1))
   }
 
-  function next() {
-    setIndex(i => Math.min(total - 1, i + 1))
+  async function next() {
+    if (index + 1 >= page.rows.length) {
+      if (!page.nextCursor) return
+      setLoadingMore(true)
+      try {
+        await onLoadMore()
+      } finally {
+        setLoadingMore(false)
+      }
+    }
+    setIndex(i => i + 1)
   }
 
+  if (!row) return null
+  const [, createdAt, ...values] = row
+  const atEnd = index + 1 >= page.rows.length && !page.nextCursor
+
   return (
     <div className="individual-view">
       <div className="pagination-controls">
@@ -300,37 +311,38 @@ function IndividualView({ responses, questionsMap, choicesMap }) {
          <div className="response-counter">
            {index + 1} of {total}
          </div>
-         <button className="btn btn-secondary" onClick={next} disabled={index === total - 1}>
+         <button className="btn btn-secondary" onClick={next} disabled={atEnd || loadingMore}>
            Next →
          </button>
       </div>
 
       <div className="form-card" style={{ cursor: 'default' }}>
          <div className="form-card-title">
-            Submission at {new Date(response.created_at).toLocaleString()}
+            Submission at {new Date(createdAt).toLocaleString()}
          </div>
-         
+
          <div style={{ marginTop: '16px', display: 'flex', flexDirection: 'column', gap: '12px' }}>
-           {response.answers.map(answer => {
-             const question = questionsMap[answer.question]
+           {page.columns.map((questionId, column) => {
+             const question = questionsMap[questionId]
              if (!question) return null
-             
-             let displayAnswer = answer.text_answer
-             
+
+             const value = values[column]
+             let displayAnswer = value
+
              if (question.question_type === 'multiple_choice' || question.question_type === 'multiple_select') {
-                displayAnswer = answer.selected_choices
+                displayAnswer = (value || [])
                   .map(choiceId => choicesMap[choiceId] || '?')
                   .join(', ')
-             } else if (question.question_type === 'media' && answer.file_answer) {
+             } else if (question.question_type === 'media' && value) {
                 displayAnswer = (
-                  <a href={answer.file_answer} target="_blank" rel="noopener noreferrer" style={{ color: 'var(--primary)', textDecoration: 'underline' }}>
-                    View File 
+                  <a href={value} target="_blank" rel="noopener noreferrer" style={{ color: 'var(--primary)', textDecoration: 'underline' }}>
+                    View File
                   </a>
                 )
              }
 
              return (
-               <div key={answer.id}>
+               <div key={questionId}>
                   <div style={{ fontSize: '0.85rem', color: 'var(--text-secondary)', marginBottom: '4px' }}>
                     {question.text}
                   </div>
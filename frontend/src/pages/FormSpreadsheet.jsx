@@ -1,12 +1,18 @@
 import { useState, useEffect, useMemo, useRef, useLayoutEffect } from 'react'
 import { useParams, Link } from 'react-router-dom'
-import { getForm, getFormResponses, exportFormResponses } from '../api'
+import { getForm, getFormSpreadsheet, exportFormResponses } from '../api'
+
+// Rows fetched per window of the spreadsheet endpoint
+const PAGE_SIZE = 100
+// Column key -> the endpoint's ?sort= value; question columns sort by their id
+const SORT_PARAMS = { id: 'id', submittedAt: 'submitted_at' }
 
 export default function FormSpreadsheet() {
   const { id } = useParams()
   const [form, setForm] = useState(null)
-  const [responses, setResponses] = useState([])
+  const [sheet, setSheet] = useState({ count: 0, columns: [], rows: [] })
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [error, setError] = useState(null)
   const [sort, setSort] = useState({ key: 'submittedAt', direction: 'desc' })
   const scrollRef = useRef(null)
@@ -14,18 +20,26 @@ export default function FormSpreadsheet() {
   const [fillerRemainder, setFillerRemainder] = useState(0)
   const [dataRowHeight, setDataRowHeight] = useState(0)
 
+  useEffect(() => {
+    let cancelled = false
+    getForm(id)
+      .then((formRes) => { if (!cancelled) setForm(formRes.data) })
+      .catch(() => { if (!cancelled) setError('Failed to load data.') })
+    return () => { cancelled = true }
+  }, [id])
+
+  const sortParams = useMemo(() => {
+    // No sort falls back to the endpoint's default, newest first
+    if (!sort.key) return {}
+    return { sort: SORT_PARAMS[sort.key] ?? sort.key, direction: sort.direction }
+  }, [sort])
+
   useEffect(() => {
     let cancelled = false
     async function load() {
       try {
-        const [formRes, responsesRes] = await Promise.all([
-          getForm(id),
-          getFormResponses(id),
-        ])
-        if (!cancelled) {
-          setForm(formRes.data)
-          setResponses(responsesRes.data.results || responsesRes.data)
-        }
+        const { data } = await getFormSpreadsheet(id, { ...sortParams, offset: 0, limit: PAGE_SIZE })
+        if (!cancelled) setSheet(data)
       } catch (err) {
         if (!cancelled) setError('Failed to load data.')
       } finally {
@@ -34,20 +48,25 @@ export default function FormSpreadsheet() {
     }
     load()
     return () => { cancelled = true }
-  }, [id])
-
-  const { columns, rows } = useMemo(() => {
-    if (!form) return { columns: [], rows: [] }
+  }, [id, sortParams])
 
-    const questions = []
-    form.sections.forEach((section) => {
-      section.questions.forEach((q) => questions.push(q))
-    })
+  async function loadMore() {
+    setLoadingMore(true)
+    try {
+      const { data } = await getFormSpreadsheet(id, { ...sortParams, offset: sheet.rows.length, limit: PAGE_SIZE })
+      setSheet((current) => ({ ...data, rows: [...current.rows, ...data.rows] }))
+    } catch (err) {
+      console.error('Failed to load more responses', err)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
 
+  const { columns, rows } = useMemo(() => {
     const cols = [
       { key: 'id', label: 'Response ID', width: 130, sortable: true },
       { key: 'submittedAt', label: 'Submitted At', width: 170, sortable: true },
-      ...questions.map((q) => ({
+      ...sheet.columns.map((q) => ({
         key: q.id,
         label: q.text,
         width: 220,
@@ -56,47 +75,18 @@ export default function FormSpreadsheet() {
       })),
     ]
 
-    const answerRows = responses.map((r) => {
-      const answersMap = {}
-      r.answers.forEach((a) => {
-        answersMap[a.question] = a
-      })
-
-      const row = { id: r.id, submittedAt: r.created_at }
-      questions.forEach((q) => {
-        const answer = answersMap[q.id]
-        row[q.id] = formatSortableAnswer(answer, q)
-        row[`__isMedia_${q.id}`] = q.question_type === 'media' && answer?.file_answer
+    // Each row is [id, created_at, cell, ...] with one cell per column, choices already as text
+    const answerRows = sheet.rows.map(([responseId, createdAt, ...cells]) => {
+      const row = { id: responseId, submittedAt: createdAt }
+      sheet.columns.forEach((q, index) => {
+        row[q.id] = cells[index] ?? ''
+        row[`__isMedia_${q.id}`] = q.question_type === 'media' && Boolean(cells[index])
       })
       return row
     })
 
     return { columns: cols, rows: answerRows }
-  }, [form, responses])
-
-  const sortedRows = useMemo(() => {
-    if (!sort.key) return rows
-
-    return [...rows].sort((a, b) => {
-      let aVal = a[sort.key]
-      let bVal = b[sort.key]
-
-      if (sort.key === 'submittedAt') {
-        aVal = new Date(aVal).getTime()
-        bVal = new Date(bVal).getTime()
-      } else if (sort.key === 'id') {
-        aVal = Number(aVal)
-        bVal = Number(bVal)
-      } else {
-        aVal = String(aVal || '').toLowerCase()
-        bVal = String(bVal || '').toLowerCase()
-      }
-
-      if (aVal < bVal) return sort.direction === 'asc' ? -1 : 1
-      if (aVal > bVal) return sort.direction === 'asc' ? 1 : -1
-      return 0
-    })
-  }, [rows, sort])
+  }, [sheet])
 
   useLayoutEffect(() => {
     function updateFillerRows() {
@@ -134,7 +124,7 @@ export default function FormSpreadsheet() {
     updateFillerRows()
     window.addEventListener('resize', updateFillerRows)
     return () => window.removeEventListener('resize', updateFillerRows)
-  }, [sortedRows])
+  }, [rows])
 
   function handleSort(key) {
     setSort((current) => {
@@ -163,15 +153,15 @@ export default function FormSpreadsheet() {
     }
   }
 
-  if (loading) return <div className="loading"><div className="spinner" /></div>
   if (error) return <div className="empty-state"><h2>{error}</h2></div>
+  if (loading || !form) return <div className="loading"><div className="spinner" /></div>
 
   return (
     <div className="dashboard spreadsheet-page">
       <div className="dashboard-header">
         <div>
           <h1>Spreadsheet: {form.title}</h1>
-          <span className="form-count">{responses.length} response{responses.length !== 1 ? 's' : ''}</span>
+          <span className="form-count">{sheet.count} response{sheet.count !== 1 ? 's' : ''}</span>
         </div>
         <div style={{ display: 'flex', gap: '8px' }}>
           <button onClick={handleExportCSV} className="btn btn-secondary">
@@ -183,7 +173,7 @@ export default function FormSpreadsheet() {
         </div>
       </div>
 
-      {responses.length === 0 ? (
+      {sheet.count === 0 ? (
         <div className="empty-state">
           <div className="empty-icon">📭</div>
           <h2>No responses yet</h2>
@@ -225,7 +215,7 @@ export default function FormSpreadsheet() {
                 </tr>
               </thead>
               <tbody>
-                {sortedRows.map((row) => (
+                {rows.map((row) => (
                   <tr key={row.id}>
                     {columns.map((col, colIndex) => (
                       <td
@@ -284,35 +274,15 @@ export default function FormSpreadsheet() {
               </tbody>
             </table>
           </div>
+          {rows.length < sheet.count && (
+            <div style={{ display: 'flex', justifyContent: 'center', padding: '12px' }}>
+              <button className="btn btn-secondary" onClick={loadMore} disabled={loadingMore}>
+                {loadingMore ? 'Loading…' : `Load more (${rows.length} of ${sheet.count})`}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
   )
 }
-
-function formatSortableAnswer(answer, question) {
-  if (!answer) return ''
-
-  if (['multiple_choice', 'multiple_select'].includes(question.question_type)) {
-    const choices = Array.isArray(answer.selected_choices)
-      ? answer.selected_choices
-      : answer.selected_choices
-        ? [answer.selected_choices]
-        : []
-    if (choices.length === 0) return ''
-
-    const choiceMap = {}
-    if (question.choices) {
-      question.choices.forEach((c) => {
-        choiceMap[c.id] = c.text
-      })
-    }
-    return choices.map((cId) => choiceMap[cId] || cId).join(', ')
-  }
-
-  if (question.question_type === 'media') {
-    return answer.file_answer || ''
-  }
-
-  return answer.text_answer || ''
-}
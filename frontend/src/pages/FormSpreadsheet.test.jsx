@@ -1,12 +1,12 @@
 import { describe, it, expect, vi, beforeEach, afterEach } from 'vitest'
-import { render, screen, waitFor } from '@testing-library/react'
+import { fireEvent, render, screen, waitFor } from '@testing-library/react'
 import { MemoryRouter, Routes, Route } from 'react-router-dom'
 import FormSpreadsheet from './FormSpreadsheet'
-import { getForm, getFormResponses, exportFormResponses } from '../api'
+import { getForm, getFormSpreadsheet, exportFormResponses } from '../api'
 
 vi.mock('../api', () => ({
   getForm: vi.fn(),
-  getFormResponses: vi.fn(),
+  getFormSpreadsheet: vi.fn(),
   exportFormResponses: vi.fn(),
 }))
 
@@ -77,11 +77,13 @@ describe('FormSpreadsheet', () => {
       },
     })
 
-    getFormResponses.mockResolvedValue({
+    getFormSpreadsheet.mockResolvedValue({
       data: {
-        results: [
-          { id: 1, created_at: '2026-01-01T10:00:00Z', answers: [{ question: 101, text_answer: 'Alice' }] },
-          { id: 2, created_at: '2026-01-02T10:00:00Z', answers: [{ question: 101, text_answer: 'Bob' }] },
+        count: 2,
+        columns: [{ id: 101, text: 'Name', question_type: 'text' }],
+        rows: [
+          [1, '2026-01-01T10:00:00Z', 'Alice'],
+          [2, '2026-01-02T10:00:00Z', 'Bob'],
         ],
       },
     })
@@ -117,10 +119,12 @@ describe('FormSpreadsheet', () => {
       },
     })
 
-    getFormResponses.mockResolvedValue({
+    getFormSpreadsheet.mockResolvedValue({
       data: {
-        results: [
-          { id: 1, created_at: '2026-01-01T10:00:00Z', answers: [{ question: 101, text_answer: 'Alice' }] },
+        count: 1,
+        columns: [{ id: 101, text: 'Name', question_type: 'text' }],
+        rows: [
+          [1, '2026-01-01T10:00:00Z', 'Alice'],
         ],
       },
     })
@@ -159,12 +163,14 @@ describe('FormSpreadsheet', () => {
       },
     })
 
-    getFormResponses.mockResolvedValue({
+    getFormSpreadsheet.mockResolvedValue({
       data: {
-        results: [
-          { id: 1, created_at: '2026-01-01T10:00:00Z', answers: [{ question: 101, text_answer: 'A' }] },
-          { id: 2, created_at: '2026-01-02T10:00:00Z', answers: [{ question: 101, text_answer: 'B' }] },
-          { id: 3, created_at: '2026-01-03T10:00:00Z', answers: [{ question: 101, text_answer: 'C' }] },
+        count: 3,
+        columns: [{ id: 101, text: 'Name', question_type: 'text' }],
+        rows: [
+          [1, '2026-01-01T10:00:00Z', 'A'],
+          [2, '2026-01-02T10:00:00Z', 'B'],
+          [3, '2026-01-03T10:00:00Z', 'C'],
         ],
       },
     })
@@ -200,10 +206,12 @@ describe('FormSpreadsheet', () => {
       },
     })
 
-    getFormResponses.mockResolvedValue({
+    getFormSpreadsheet.mockResolvedValue({
       data: {
-        results: [
-          { id: 1, created_at: '2026-01-01T10:00:00Z', answers: [{ question: 101, text_answer: 'Alice' }] },
+        count: 1,
+        columns: [{ id: 101, text: 'Name', question_type: 'text' }],
+        rows: [
+          [1, '2026-01-01T10:00:00Z', 'Alice'],
         ],
       },
     })
@@ -250,8 +258,8 @@ describe('FormSpreadsheet', () => {
     })
 
     // responses array is empty
-    getFormResponses.mockResolvedValue({
-      data: { results: [] },
+    getFormSpreadsheet.mockResolvedValue({
+      data: { count: 0, columns: [{ id: 101, text: 'Name', question_type: 'text' }], rows: [] },
     })
 
     const restore = mockDimensions({ scrollHeight: 600, tableHeight: 50, rowHeight: 40 })
@@ -269,4 +277,32 @@ describe('FormSpreadsheet', () => {
       restore()
     }
   })
+
+  it('asks the spreadsheet endpoint to sort by a clicked question column', async () => {
+    getForm.mockResolvedValue({ data: { id: 1, title: 'Test Form', sections: [] } })
+    getFormSpreadsheet.mockResolvedValue({
+      data: {
+        count: 1,
+        columns: [{ id: 101, text: 'Name', question_type: 'short_text' }],
+        rows: [[1, '2026-01-01T10:00:00Z', 'Alice']],
+      },
+    })
+
+    renderAtRoute(<FormSpreadsheet />)
+
+    await waitFor(() => {
+      expect(screen.getByText('Alice')).toBeTruthy()
+    })
+    expect(getFormSpreadsheet).toHaveBeenLastCalledWith('1', {
+      sort: 'submitted_at', direction: 'desc', offset: 0, limit: 100,
+    })
+
+    fireEvent.click(screen.getByTitle('Name'))
+
+    await waitFor(() => {
+      expect(getFormSpreadsheet).toHaveBeenLastCalledWith('1', {
+        sort: 101, direction: 'asc', offset: 0, limit: 100,
+      })
+    })
+  })
 })
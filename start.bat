@@ -25,6 +25,9 @@ popd
 echo Starting ShemaField Backend (Django) ...
 start "ShemaField Backend" cmd /k "cd /d "%BACKEND%" && call "%VENV_ACTIVATE%" && python manage.py runserver"
 
+echo Starting ShemaField export job runner ...
+start "ShemaField Export Jobs" cmd /k "cd /d "%BACKEND%" && call "%VENV_ACTIVATE%" && python manage.py run_export_jobs --watch 5"
+
 echo Starting ShemaField Frontend (Vite) ...
 start "ShemaField Frontend" cmd /k "cd /d "%FRONTEND%" && npm run dev"
 
@@ -22,6 +22,9 @@ python (Join-Path $Backend "manage.py") migrate
 Write-Host "Starting ShemaField Backend (Django) ..." -ForegroundColor Green
 Start-Process powershell -ArgumentList "-NoExit", "-Command", "cd `"$Backend`"; & `"$VenvActivate`"; python manage.py runserver"
 
+Write-Host "Starting ShemaField export job runner ..." -ForegroundColor Green
+Start-Process powershell -ArgumentList "-NoExit", "-Command", "cd `"$Backend`"; & `"$VenvActivate`"; python manage.py run_export_jobs --watch 5"
+
 Write-Host "Starting ShemaField Frontend (Vite) ..." -ForegroundColor Green
 Start-Process powershell -ArgumentList "-NoExit", "-Command", "cd `"$Frontend`"; npm run dev"
 